@@ -0,0 +1,4 @@
+import time
+
+# Reference point for cold-start measurements (see app/startup.py).
+IMPORT_STARTED = time.perf_counter()
@@ -1,5 +1,113 @@
+import hmac
+import inspect
+
+import httpx
+from fastapi import Depends, Header, HTTPException, Query, Request
+from fastapi.responses import RedirectResponse
+
+import app.config as config
+from app.services.http import HttpClients
+from app.services.oauth_state import OAuthStateError, OAuthUser, cookie_name, oauth_state
+from app.services.OAuthService import OAuthService
+from app.services.providers import Provider
 from app.services.users import UserService
 
 
-def get_user_service() -> UserService:
-    return UserService()
+def get_http_clients(request: Request) -> HttpClients:
+    return request.app.state.http_clients
+
+
+def get_supabase_http_client(request: Request) -> httpx.AsyncClient:
+    return get_http_clients(request).get("supabase")
+
+
+def get_user_service(request: Request) -> UserService:
+    return UserService(get_supabase_http_client(request))
+
+
+def get_oauth_service(request: Request) -> OAuthService:
+    return request.app.state.oauth_service
+
+
+def require_internal_key(x_internal_key: str | None = Header(None)):
+    """
+    Guards internal endpoints with the shared `INTERNAL_API_KEY`.
+    """
+    if not config.INTERNAL_API_KEY:
+        raise HTTPException(status_code=503, detail="Internal API is not configured")
+    if not x_internal_key or not hmac.compare_digest(x_internal_key, config.INTERNAL_API_KEY):
+        raise HTTPException(status_code=401, detail="Invalid internal API key")
+
+
+async def get_login_user(
+        state: str = Query(...),
+        user_service: UserService = Depends(get_user_service)) -> OAuthUser:
+    """
+    Resolves the user starting an OAuth login from the `state` parameter.
+
+    The raw `user_id/user_hash` state is checked against the `users`
+    table (cached). Signed state tokens are only issued to providers and
+    are not accepted here, so a leaked one cannot start another login.
+    """
+    user = state.split('/')
+    # first part is user_id, second one is user_hash
+    exists, status, message = await user_service.user_exists(user[0], user[-1])
+
+    if not exists:
+        raise HTTPException(status_code=status, detail=message)
+    return OAuthUser(user[0], user[-1])
+
+
+def get_callback_user(provider: str):
+    """
+    Builds a dependency that verifies a callback's signed `state`
+    against the provider's nonce cookie.
+    """
+    def dependency(request: Request, state: str = Query(...)) -> OAuthUser:
+        try:
+            return oauth_state.verify(state, request.cookies.get(cookie_name(provider)))
+        except OAuthStateError:
+            raise HTTPException(status_code=400, detail="Invalid or expired state")
+    return dependency
+
+
+def get_callback_params(provider: Provider):
+    """
+    Builds a dependency that declares a provider's extra callback query
+    parameters (`Provider.callback_params`, e.g. QuickBooks' `realmId`)
+    as required, so FastAPI validates and documents them.
+    """
+    names = {f"param_{i}": name for i, name in enumerate(provider.callback_params)}
+
+    def dependency(**values: str) -> dict[str, str]:
+        return {name: values[key] for key, name in names.items()}
+
+    dependency.__signature__ = inspect.Signature([
+        inspect.Parameter(key, inspect.Parameter.KEYWORD_ONLY, default=Query(..., alias=name), annotation=str)
+        for key, name in names.items()
+    ])
+    return dependency
+
+
+def redirect_to_provider(provider: str, authorize_url: str, user: OAuthUser) -> RedirectResponse:
+    """
+    Redirects to a provider's consent page with a freshly signed state
+    and binds the state's nonce to the browser with a cookie.
+
+    Args:
+        provider (str): Provider name.
+        authorize_url (str): Authorize URL without the `state` parameter.
+        user (OAuthUser): Verified user starting the login.
+    """
+    token, nonce = oauth_state.issue(user)
+    response = RedirectResponse(f"{authorize_url}&state={token}")
+    response.set_cookie(
+        cookie_name(provider),
+        nonce,
+        max_age=int(config.OAUTH_STATE_TTL),
+        path="/auth",
+        secure=True,
+        httponly=True,
+        samesite="lax"
+    )
+    return response
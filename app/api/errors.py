@@ -0,0 +1,37 @@
+import logging
+
+import httpx
+from fastapi import Request
+from fastapi.responses import JSONResponse, RedirectResponse
+
+from app.services.database import DatabaseError
+from app.services.providers import PROVIDERS
+from app.services.resilience import CircuitOpenError, UpstreamError
+
+logger = logging.getLogger(__name__)
+
+
+async def upstream_error_handler(request: Request, exc: Exception):
+    """
+    Turns failures of a provider or Supabase into a clean response.
+
+    OAuth callbacks redirect the browser to the provider's frontend error
+    page; other routes answer 503 when a circuit is open, 504 on
+    timeouts and 502 otherwise.
+    """
+    logger.warning("Upstream failure on %s: %s", request.url.path, exc)
+
+    parts = request.url.path.strip("/").split("/")
+    if len(parts) == 3 and parts[0] == "auth" and parts[2] == "callback" and parts[1] in PROVIDERS:
+        return RedirectResponse(url=PROVIDERS[parts[1]].error_url)
+
+    if isinstance(exc, CircuitOpenError):
+        status_code = 503
+    elif isinstance(exc, httpx.TimeoutException):
+        status_code = 504
+    else:
+        status_code = 502
+    return JSONResponse({"detail": "Upstream service unavailable"}, status_code=status_code)
+
+
+UPSTREAM_ERRORS = (UpstreamError, DatabaseError, httpx.HTTPError)
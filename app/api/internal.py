@@ -0,0 +1,252 @@
+import json
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+import app.config as config
+from app.api.dependencies import require_internal_key
+from app.services.diagnostics import loop_diagnostics
+from app.services.disconnect import disconnect_service
+from app.services.health_check import connection_health_check
+from app.services.idempotency import callback_deduplicator
+from app.services.providers import PROVIDERS
+from app.services.status_events import status_broker
+from app.services.tokens import TokenRefreshError, token_service
+from app.services.user_status import user_status_service
+from app.services.users import user_exists_cache
+from app.services.write_behind import write_behind_queue
+from app.services.xero_tenants import xero_tenant_service
+from app.startup import startup_timings
+
+router = APIRouter(
+    prefix="/internal",
+    tags=["Internal"],
+    dependencies=[Depends(require_internal_key)]
+)
+
+
+def cache_stats() -> dict:
+    """
+    Returns size and hit/miss counters of the in-process caches.
+
+    Returns:
+        dict: Statistics per cache.
+    """
+    return {
+        "user_exists": user_exists_cache.stats(),
+        "user_status": user_status_service.rows.stats(),
+        "tokens": token_service.cache.stats(),
+        "callbacks": callback_deduplicator.stats()
+    }
+
+
+def check_providers(providers: list[str] | None):
+    unknown = set(providers or ()) - set(PROVIDERS)
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Unknown provider: {', '.join(sorted(unknown))}")
+
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """
+    Returns size and hit/miss counters of the in-process caches.
+
+    Returns:
+        dict: Statistics per cache.
+    """
+    return cache_stats()
+
+
+@router.get("/write-behind")
+async def write_behind_stats():
+    """
+    Returns how many journaled connections are pending, flushed or
+    rejected by Supabase.
+
+    Returns:
+        dict: Entry counts by state; empty when write-behind is disabled.
+    """
+    return await write_behind_queue.stats()
+
+
+@router.get("/diagnostics")
+async def diagnostics():
+    """
+    Returns this worker's event loop block events and slow-request
+    profiles (enable with DIAGNOSTICS_ENABLED).
+
+    Returns:
+        dict: Maximum loop lag, recent blocks with the blocking stack and
+        recent slow requests with their sampled await chains.
+    """
+    return loop_diagnostics.report()
+
+
+@router.delete("/diagnostics", status_code=204)
+async def reset_diagnostics():
+    """
+    Clears this worker's recorded block events and profiles.
+    """
+    loop_diagnostics.reset()
+
+
+@router.get("/status-streams")
+async def status_stream_stats():
+    """
+    Returns how many /auth/status/stream connections this worker serves
+    and how events reach other workers.
+
+    Returns:
+        dict: Open streams, subscribed users and fan-out mode.
+    """
+    return status_broker.stats()
+
+
+@router.post("/health-check", status_code=202)
+async def start_health_check(
+        provider: list[str] | None = Query(default=None),
+        restart: bool = False):
+    """
+    Starts the connection health check in the background, resuming the
+    previous run unless `restart` is set.
+
+    Args:
+        provider (list[str] | None): Providers to check; all by default.
+        restart (bool): Ignore the checkpoint and start over.
+
+    Returns:
+        dict: Confirmation; poll `GET /internal/health-check` for progress.
+    """
+    check_providers(provider)
+    if not await connection_health_check.start(provider, restart):
+        raise HTTPException(status_code=409, detail="A health check is already running")
+    return {"status": "started"}
+
+
+@router.get("/health-check")
+async def health_check_progress():
+    """
+    Returns the progress of the current or last connection health check.
+
+    Returns:
+        dict: Per-provider cursor and counts of checked, healthy, revoked
+        and errored connections.
+    """
+    return connection_health_check.progress or connection_health_check.load_checkpoint()
+
+
+class DisconnectRequest(BaseModel):
+    user_ids: list[UUID]
+    providers: list[str] | None = None
+    force: bool = False
+
+
+@router.post("/disconnect")
+async def disconnect_users(body: DisconnectRequest):
+    """
+    Revokes and deletes the provider connections of many users, e.g. for
+    offboarding or GDPR deletion.
+
+    Users are processed in batches of `DISCONNECT_BATCH_SIZE`; the
+    response streams one JSON line per user as each batch completes.
+
+    Args:
+        body (DisconnectRequest): User IDs, providers to disconnect (all
+            by default) and whether to delete connections whose
+            revocation failed.
+
+    Returns:
+        StreamingResponse: NDJSON lines {"user_id", "providers": {provider:
+        result}, "ok"}; see `DisconnectService` for the results.
+    """
+    if len(body.user_ids) > config.DISCONNECT_MAX_IDS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {config.DISCONNECT_MAX_IDS} ids per request"
+        )
+    check_providers(body.providers)
+
+    async def lines():
+        async for result in disconnect_service.disconnect(body.user_ids, body.providers, body.force):
+            yield json.dumps(result) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@router.delete("/connections/{user_id}")
+async def disconnect_user(
+        user_id: UUID,
+        provider: list[str] | None = Query(default=None),
+        force: bool = False):
+    """
+    Revokes and deletes one user's provider connections.
+
+    Args:
+        user_id (UUID): ID of the user in the `users` table.
+        provider (list[str] | None): Providers to disconnect; all by default.
+        force (bool): Delete connections whose revocation failed too.
+
+    Returns:
+        dict: {"user_id", "providers": {provider: result}, "ok"}.
+    """
+    check_providers(provider)
+    [result] = await disconnect_service.disconnect_batch([str(user_id)], provider, force)
+    return result
+
+
+@router.get("/startup")
+async def startup():
+    """
+    Returns how long this process took to import the app and become ready.
+
+    Returns:
+        dict: Seconds since interpreter start of the `app` package per stage.
+    """
+    return startup_timings
+
+
+@router.get("/tokens/{provider}/{user_id}")
+async def get_access_token(provider: str, user_id: UUID):
+    """
+    Vends a currently valid access token for a connected user.
+
+    Tokens come from the in-process cache; a near-expiry token is
+    refreshed once per process, however many requests for it arrive at
+    the same time. Refreshes in other processes are reconciled by the
+    compare-and-set when the new tokens are stored.
+
+    Args:
+        provider (str): google, outlook, xero or quickbooks.
+        user_id (UUID): ID of the user in the `users` table.
+
+    Returns:
+        dict: access_token and expires_at.
+    """
+    if provider not in PROVIDERS:
+        raise HTTPException(status_code=404, detail="Unknown provider")
+    try:
+        return await token_service.get_access_token(provider, str(user_id))
+    except TokenRefreshError as e:
+        if e.error == "not_connected":
+            raise HTTPException(status_code=404, detail="Provider not connected")
+        if e.revoked:
+            raise HTTPException(status_code=410, detail="Provider access was revoked")
+        raise HTTPException(status_code=502, detail="Provider token refresh failed")
+
+
+@router.get("/xero/tenants/{user_id}")
+async def get_xero_tenants(user_id: UUID):
+    """
+    Lists every Xero organisation a user authorised, as stored at the
+    last connection, so workers need not call Xero's connections API.
+
+    Args:
+        user_id (UUID): ID of the user in the `users` table.
+
+    Returns:
+        dict: user_id and its tenants (tenant_id, tenant_name,
+        tenant_type, connection_id, updated_at).
+    """
+    return {"user_id": str(user_id), "tenants": await xero_tenant_service.for_user(str(user_id))}
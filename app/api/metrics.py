@@ -0,0 +1,31 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+
+from app.api.dependencies import require_internal_key
+from app.api.internal import cache_stats
+from app.services.metrics import CACHE_HITS, CACHE_MISSES, CACHE_SIZE, multiprocess_metrics, registry
+
+router = APIRouter(tags=["Metrics"])
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@registry.collector
+def _collect_cache_stats():
+    for cache, stats in cache_stats().items():
+        CACHE_SIZE.set(cache, value=stats["size"])
+        CACHE_HITS.set(cache, value=stats["hits"])
+        CACHE_MISSES.set(cache, value=stats["misses"])
+
+
+@router.get("/metrics", include_in_schema=False, dependencies=[Depends(require_internal_key)])
+async def metrics():
+    """
+    Exposes request, OAuth stage, database, upstream, pool and cache
+    metrics in the Prometheus text format, merged across the instance's
+    worker processes. Scrapers send the `X-Internal-Key` header.
+
+    Returns:
+        PlainTextResponse: Prometheus exposition of all metrics.
+    """
+    return PlainTextResponse(await multiprocess_metrics.render(), media_type=PROMETHEUS_CONTENT_TYPE)
@@ -0,0 +1,79 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import RedirectResponse
+
+from app.api.dependencies import (
+    get_callback_params,
+    get_callback_user,
+    get_login_user,
+    get_oauth_service,
+    redirect_to_provider
+)
+from app.services.OAuthService import OAuthService
+from app.services.idempotency import callback_deduplicator
+from app.services.oauth_state import OAuthUser
+from app.services.providers import AUTHORIZE_URLS, Provider
+
+
+def provider_router(provider: Provider) -> APIRouter:
+    """
+    Builds the login and callback routes of one provider.
+
+    Args:
+        provider (Provider): Provider descriptor from `PROVIDERS`.
+
+    Returns:
+        APIRouter: Router with `GET /auth/<name>` and `GET /auth/<name>/callback`.
+    """
+    name = provider.name
+    authorize_url = AUTHORIZE_URLS[name]
+    router = APIRouter(tags=[f"{provider.title} OAuth"])
+
+    @router.get(f"/auth/{name}", name=f"{name}_login", summary=f"{provider.title} login")
+    async def login(user: OAuthUser = Depends(get_login_user)):
+        """
+        Initiates the OAuth2 login process.
+
+        Redirects the user to the provider's consent screen with the
+        precomputed authorize URL and a freshly signed `state`.
+
+        Args:
+            user (OAuthUser): User resolved from the `state` parameter.
+
+        Returns:
+            RedirectResponse: Redirects to the provider's consent page.
+        """
+        return redirect_to_provider(name, authorize_url, user)
+
+    @router.get(f"/auth/{name}/callback", name=f"{name}_callback", summary=f"{provider.title} callback")
+    async def callback(
+            code: str,
+            state: str,
+            params: dict[str, str] = Depends(get_callback_params(provider)),
+            user: OAuthUser = Depends(get_callback_user(name)),
+            oauth_service: OAuthService = Depends(get_oauth_service)):
+        """
+        Handles the OAuth2 callback after user authentication.
+
+        Steps:
+            1. Exchanges the authorization code for access and refresh tokens.
+            2. Builds the user's profile from the id_token or the provider's API.
+            3. Stores the connection in Supabase for the user from `state`.
+            4. Redirects the user back to the frontend application.
+
+        Args:
+            code (str): Authorization code returned by the provider.
+            state (str): Signed state token issued by the login endpoint.
+            params (dict[str, str]): Provider-specific query parameters.
+            user (OAuthUser): User verified from the signed 'state' parameter.
+            oauth_service (OAuthService): Service handling the OAuth callback.
+
+        Returns:
+            RedirectResponse: Redirects to the frontend with authentication status.
+        """
+        await callback_deduplicator.run(
+            name, code, state,
+            lambda: oauth_service.handle_callback(name, code, user.user_id, params)
+        )
+        return RedirectResponse(url=f"{provider.frontend_url}&state={user.state}")
+
+    return router
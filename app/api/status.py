@@ -1,14 +1,25 @@
 # File: app/api/status.py
 
-from fastapi import APIRouter, HTTPException, Query
+import json
+import logging
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
 from uuid import UUID
 from typing import Optional
-from app.config import supabase
+from app.api.dependencies import require_internal_key
+from app.config import STATUS_BATCH_MAX_IDS, STATUS_STREAM_HEARTBEAT, STATUS_STREAM_RETRY_MS
+from app.services.status_events import StreamLimitError, status_broker
+from app.services.user_status import compute_etag, user_status_service
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 @router.get("/auth/status")
 async def get_user_status(
+    request: Request,
     user_id: Optional[UUID] = Query(None),
     session_id: Optional[str] = Query(None)
 ):
@@ -16,25 +27,142 @@ async def get_user_status(
     Securely fetches a user's data for Framer.
     Accepts either user_id OR session_id.
     Uses service_role key to bypass RLS.
+
+    Besides the profile columns, the response includes the
+    `is_email_service_connected` and `is_invoice_service_connected`
+    flags (see README.md).
+
+    Responses carry an ETag; a poll sending a matching If-None-Match
+    gets an empty 304. Rows are served from the status cache, which the
+    OAuth callbacks update write-through.
     """
     if not user_id and not session_id:
         raise HTTPException(status_code=400, detail="Either user_id or session_id is required")
     
     try:
-        query = supabase.table('users').select('id, user_hash, name, email, status, email_provider, invoice_provider')
-        
-        if user_id:
-            query = query.eq('id', str(user_id))
-        else:
-            query = query.eq('session_id', session_id)
-        
-        response = query.single().execute()
-
-        if response.data:
-            return response.data
-        else:
-            raise HTTPException(status_code=404, detail="User not found")
-            
-    except Exception as e:
-        print(f"Error fetching user status: {e}")
+        entry = await user_status_service.get(
+            str(user_id) if user_id else None,
+            session_id
+        )
+    except Exception:
+        logger.exception("Error fetching user status")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+    if not entry:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    data, etag = entry
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(data, headers=headers)
+
+
+def sse_event(data: dict, etag: str) -> str:
+    """
+    Formats a status as a Server-Sent Event.
+    """
+    body = json.dumps(data, separators=(",", ":"), default=str)
+    return f"event: status\nid: {etag}\ndata: {body}\n\n"
+
+
+@router.get("/auth/status/stream")
+async def stream_user_status(
+    user_id: Optional[UUID] = Query(None),
+    session_id: Optional[str] = Query(None)
+):
+    """
+    Streams a user's data to Framer as Server-Sent Events.
+    Accepts either user_id OR session_id, like /auth/status.
+
+    The current status is sent first, then again whenever an OAuth
+    callback stores a connection for the user or the user is
+    disconnected. A comment line is sent every `STATUS_STREAM_HEARTBEAT`
+    seconds to keep proxies from closing an idle stream. Each worker serves at most
+    `STATUS_STREAM_MAX_CONNECTIONS` streams and answers 503 beyond that;
+    EventSource clients reconnect after `STATUS_STREAM_RETRY_MS`.
+    """
+    if not user_id and not session_id:
+        raise HTTPException(status_code=400, detail="Either user_id or session_id is required")
+
+    try:
+        entry = await user_status_service.get(
+            str(user_id) if user_id else None,
+            session_id
+        )
+    except Exception:
+        logger.exception("Error fetching user status for stream")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+    if not entry:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    resolved_id = str(entry[0]["id"])
+    try:
+        subscription = status_broker.subscribe(resolved_id)
+    except StreamLimitError:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many status streams",
+            headers={"Retry-After": str(STATUS_STREAM_RETRY_MS // 1000 or 1)}
+        )
+
+    async def events():
+        with subscription:
+            # re-read after subscribing so a connection stored in between is not missed
+            data, etag = await user_status_service.get(resolved_id) or entry
+            yield f"retry: {STATUS_STREAM_RETRY_MS}\n\n" + sse_event(data, etag)
+            while True:
+                event = await subscription.next(STATUS_STREAM_HEARTBEAT)
+                if event is None:
+                    yield ": ping\n\n"
+                    continue
+                if event.get("status"):
+                    data = event["status"]
+                else:
+                    # write-behind mode or another worker: the local cache may be stale
+                    current = await user_status_service.get(resolved_id)
+                    data = {**(current[0] if current else data), event["flag"]: event.get("connected", True)}
+                if compute_etag(data) != etag:
+                    etag = compute_etag(data)
+                    yield sse_event(data, etag)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+class StatusBatchRequest(BaseModel):
+    user_ids: list[UUID] = []
+    session_ids: list[str] = []
+
+
+@router.post("/auth/status/batch", dependencies=[Depends(require_internal_key)])
+async def get_user_status_batch(body: StatusBatchRequest):
+    """
+    Fetches many users' data in a few chunked Supabase queries.
+    Internal endpoint for dashboards and back-office jobs.
+
+    Args:
+        body (StatusBatchRequest): User IDs and/or session IDs to resolve.
+
+    Returns:
+        dict: {"users": {user_id: data | null}, "sessions": {session_id: data | null}},
+        where null marks an ID that matched no user.
+    """
+    if len(body.user_ids) + len(body.session_ids) > STATUS_BATCH_MAX_IDS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {STATUS_BATCH_MAX_IDS} ids per request"
+        )
+
+    try:
+        return await user_status_service.get_many(
+            [str(user_id) for user_id in body.user_ids],
+            body.session_ids
+        )
+    except Exception:
+        logger.exception("Error fetching user status batch")
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -12,25 +13,197 @@ GOOGLE_REDIRECT_URI = os.getenv("GOOGLE_REDIRECT_URI")
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
+# HTTP client pools
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() == "true"
+HTTP_WARMUP = os.getenv("HTTP_WARMUP", "false").lower() == "true"
+HTTP_WARMUP_TIMEOUT = float(os.getenv("HTTP_WARMUP_TIMEOUT", "3"))
+
+
+def http_timeouts(group: str, connect: float, read: float, total: float) -> tuple[float, float, float]:
+    """
+    Reads a host group's (connect, read, total) timeouts in seconds,
+    overridable as e.g. `HTTP_TIMEOUTS_INTUIT="2,8,12"`. The groups and
+    their defaults are declared in `app.services.providers`.
+    """
+    value = os.getenv(f"HTTP_TIMEOUTS_{group.upper()}")
+    if value:
+        connect, read, total = (float(part) for part in value.split(","))
+    return connect, read, total
+
+# Upstream retries (idempotent requests only) and circuit breakers
+HTTP_RETRY_ATTEMPTS = int(os.getenv("HTTP_RETRY_ATTEMPTS", "2"))
+HTTP_RETRY_BACKOFF = float(os.getenv("HTTP_RETRY_BACKOFF", "0.2"))
+HTTP_RETRY_BACKOFF_MAX = float(os.getenv("HTTP_RETRY_BACKOFF_MAX", "2"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+
+# Caches
+USER_EXISTS_CACHE_TTL = float(os.getenv("USER_EXISTS_CACHE_TTL", "300"))
+USER_EXISTS_NEGATIVE_TTL = float(os.getenv("USER_EXISTS_NEGATIVE_TTL", "10"))
+USER_EXISTS_CACHE_SIZE = int(os.getenv("USER_EXISTS_CACHE_SIZE", "10000"))
+# Bounds how long a worker can serve a status changed by another worker
+# when status events stay local (no STATUS_STREAM_DATABASE_URL); keep it short.
+STATUS_CACHE_TTL = float(os.getenv("STATUS_CACHE_TTL", "15"))
+STATUS_CACHE_SIZE = int(os.getenv("STATUS_CACHE_SIZE", "10000"))
+CALLBACK_DEDUP_TTL = float(os.getenv("CALLBACK_DEDUP_TTL", "120"))
+CALLBACK_DEDUP_SIZE = int(os.getenv("CALLBACK_DEDUP_SIZE", "10000"))
+
+# Batch status lookups
+STATUS_BATCH_MAX_IDS = int(os.getenv("STATUS_BATCH_MAX_IDS", "5000"))
+STATUS_BATCH_URL_BUDGET = int(os.getenv("STATUS_BATCH_URL_BUDGET", "6000"))
+STATUS_BATCH_CONCURRENCY = int(os.getenv("STATUS_BATCH_CONCURRENCY", "4"))
+
+# Write-behind persistence of provider connections (app/services/write_behind.py)
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "false").lower() == "true"
+# Required with write-behind: the journal must survive the instance, so it
+# lives on a persistent disk, not in the (in-memory) container filesystem.
+# Use a local disk of this instance: never a network filesystem (NFS, GCS
+# FUSE) or a volume shared by several instances, where SQLite locking fails.
+WRITE_BEHIND_JOURNAL_PATH = os.getenv("WRITE_BEHIND_JOURNAL_PATH")
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "0.5"))
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "500"))
+WRITE_BEHIND_CLAIM_LEASE = float(os.getenv("WRITE_BEHIND_CLAIM_LEASE", "60"))
+WRITE_BEHIND_RETRY_BASE = float(os.getenv("WRITE_BEHIND_RETRY_BASE", "1"))
+WRITE_BEHIND_RETRY_MAX = float(os.getenv("WRITE_BEHIND_RETRY_MAX", "60"))
+WRITE_BEHIND_SHUTDOWN_TIMEOUT = float(os.getenv("WRITE_BEHIND_SHUTDOWN_TIMEOUT", "10"))
+
+# Connection health check (app/services/health_check.py)
+HEALTH_CHECK_PAGE_SIZE = int(os.getenv("HEALTH_CHECK_PAGE_SIZE", "500"))
+HEALTH_CHECK_CONCURRENCY = int(os.getenv("HEALTH_CHECK_CONCURRENCY", "10"))
+HEALTH_CHECK_RATE = float(os.getenv("HEALTH_CHECK_RATE", "5"))
+# one run at a time across all instances holds this lease (leader_lease.sql)
+HEALTH_CHECK_LEASE_TTL = float(os.getenv("HEALTH_CHECK_LEASE_TTL", "60"))
+HEALTH_CHECK_CHECKPOINT_PATH = os.getenv(
+    "HEALTH_CHECK_CHECKPOINT_PATH",
+    os.path.join(tempfile.gettempdir(), "invnudge-health-check.json")
+)
+
+# Connection status stream (app/services/status_events.py)
+STATUS_STREAM_HEARTBEAT = float(os.getenv("STATUS_STREAM_HEARTBEAT", "15"))
+STATUS_STREAM_BUFFER = int(os.getenv("STATUS_STREAM_BUFFER", "16"))
+STATUS_STREAM_MAX_CONNECTIONS = int(os.getenv("STATUS_STREAM_MAX_CONNECTIONS", "1000"))
+STATUS_STREAM_RETRY_MS = int(os.getenv("STATUS_STREAM_RETRY_MS", "3000"))
+# Postgres DSN for the LISTEN/NOTIFY fan-out across workers (needs asyncpg);
+# empty = events reach subscribers of the publishing worker only
+STATUS_STREAM_DATABASE_URL = os.getenv("STATUS_STREAM_DATABASE_URL", "")
+STATUS_STREAM_CHANNEL = os.getenv("STATUS_STREAM_CHANNEL", "invnudge_status")
+
+# Admission control on /auth routes (app/services/rate_limit.py)
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+# token buckets: sustained requests per second and burst size
+RATE_LIMIT_IP_RATE = float(os.getenv("RATE_LIMIT_IP_RATE", "10"))
+RATE_LIMIT_IP_BURST = float(os.getenv("RATE_LIMIT_IP_BURST", "50"))
+RATE_LIMIT_USER_RATE = float(os.getenv("RATE_LIMIT_USER_RATE", "2"))
+RATE_LIMIT_USER_BURST = float(os.getenv("RATE_LIMIT_USER_BURST", "20"))
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# in-flight OAuth callbacks per worker before shedding with 503
+RATE_LIMIT_CALLBACK_CONCURRENCY = int(os.getenv("RATE_LIMIT_CALLBACK_CONCURRENCY", "64"))
+# Redis URL to share buckets across workers (needs redis); empty = per worker
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "")
+
+# Event-loop diagnostics (app/services/diagnostics.py), off by default
+DIAGNOSTICS_ENABLED = os.getenv("DIAGNOSTICS_ENABLED", "false").lower() == "true"
+DIAGNOSTICS_LOOP_INTERVAL = float(os.getenv("DIAGNOSTICS_LOOP_INTERVAL", "0.05"))
+# loop stalls longer than this capture the blocking stack
+DIAGNOSTICS_BLOCK_THRESHOLD = float(os.getenv("DIAGNOSTICS_BLOCK_THRESHOLD", "0.1"))
+# requests slower than this budget are profiled
+DIAGNOSTICS_SLOW_REQUEST = float(os.getenv("DIAGNOSTICS_SLOW_REQUEST", "1"))
+DIAGNOSTICS_SAMPLE_INTERVAL = float(os.getenv("DIAGNOSTICS_SAMPLE_INTERVAL", "0.01"))
+DIAGNOSTICS_HISTORY = int(os.getenv("DIAGNOSTICS_HISTORY", "50"))
+# streaming routes, comma-separated; they stay open by design and are not
+# tracked (they would be profiled as slow requests on every connection)
+DIAGNOSTICS_EXCLUDED_ROUTES = frozenset(filter(None, os.getenv(
+    "DIAGNOSTICS_EXCLUDED_ROUTES", "/auth/status/stream,/internal/disconnect"
+).split(",")))
+# file to append block and slow-request events to as JSON lines; empty = log only
+DIAGNOSTICS_EVENT_LOG = os.getenv("DIAGNOSTICS_EVENT_LOG", "")
+
+# Bulk disconnect of provider connections (app/services/disconnect.py)
+DISCONNECT_MAX_IDS = int(os.getenv("DISCONNECT_MAX_IDS", "10000"))
+# users loaded, revoked and deleted together; one result line each per batch
+DISCONNECT_BATCH_SIZE = int(os.getenv("DISCONNECT_BATCH_SIZE", "200"))
+# revocation calls in flight and per second, per provider
+DISCONNECT_CONCURRENCY = int(os.getenv("DISCONNECT_CONCURRENCY", "10"))
+DISCONNECT_RATE = float(os.getenv("DISCONNECT_RATE", "20"))
+
+# Metrics across worker processes (app/services/metrics.py)
+# each worker writes a snapshot here for /metrics to merge; empty = this worker only
+# (app.server picks a temporary directory when it starts several workers)
+METRICS_MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR", "")
+METRICS_WRITE_INTERVAL = float(os.getenv("METRICS_WRITE_INTERVAL", "5"))
+
+# Production server (app/server.py)
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+# 0 = one worker per CPU available to the container
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "0"))
+SERVER_GRACEFUL_TIMEOUT = int(os.getenv("SERVER_GRACEFUL_TIMEOUT", "20"))
+# proxies in front of the app that append to X-Forwarded-For (1 on Cloud Run);
+# the client IP is the entry this many hops from the right, 0 = the peer address
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "1"))
+
+# Background access-token refresh
+# one process across all instances holds the scheduler lease (leader_lease.sql)
+TOKEN_REFRESH_LEASE_TTL = float(os.getenv("TOKEN_REFRESH_LEASE_TTL", "30"))
+TOKEN_REFRESH_ENABLED = os.getenv("TOKEN_REFRESH_ENABLED", "false").lower() == "true"
+TOKEN_REFRESH_LEAD = float(os.getenv("TOKEN_REFRESH_LEAD", "300"))
+TOKEN_REFRESH_JITTER = float(os.getenv("TOKEN_REFRESH_JITTER", "30"))
+TOKEN_REFRESH_BATCH_WINDOW = float(os.getenv("TOKEN_REFRESH_BATCH_WINDOW", "60"))
+TOKEN_REFRESH_BATCH_SIZE = int(os.getenv("TOKEN_REFRESH_BATCH_SIZE", "100"))
+TOKEN_REFRESH_CONCURRENCY = int(os.getenv("TOKEN_REFRESH_CONCURRENCY", "5"))
+TOKEN_REFRESH_PAGE_SIZE = int(os.getenv("TOKEN_REFRESH_PAGE_SIZE", "1000"))
+# the leader picks up connections made on other workers by rescanning
+TOKEN_REFRESH_RESCAN_INTERVAL = float(os.getenv("TOKEN_REFRESH_RESCAN_INTERVAL", "60"))
+TOKEN_REFRESH_RETRY_BASE = float(os.getenv("TOKEN_REFRESH_RETRY_BASE", "30"))
+TOKEN_REFRESH_RETRY_MAX = float(os.getenv("TOKEN_REFRESH_RETRY_MAX", "900"))
+
+# Persisting refreshed tokens: immediate retries, then a background retry
+TOKEN_PERSIST_RETRIES = int(os.getenv("TOKEN_PERSIST_RETRIES", "3"))
+TOKEN_PERSIST_BACKOFF = float(os.getenv("TOKEN_PERSIST_BACKOFF", "0.5"))
+TOKEN_PERSIST_RETRY_INTERVAL = float(os.getenv("TOKEN_PERSIST_RETRY_INTERVAL", "10"))
+
+# Token vending
+TOKEN_VENDING_MIN_TTL = float(os.getenv("TOKEN_VENDING_MIN_TTL", "120"))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "50000"))
+
+# id_token verification
+JWKS_CACHE_TTL = float(os.getenv("JWKS_CACHE_TTL", "3600"))
+JWKS_MIN_REFRESH_INTERVAL = float(os.getenv("JWKS_MIN_REFRESH_INTERVAL", "60"))
+JWKS_CLOCK_LEEWAY = float(os.getenv("JWKS_CLOCK_LEEWAY", "60"))
+
+# Internal API
+INTERNAL_API_KEY = os.getenv("INTERNAL_API_KEY")
+
 # JWT
 JWT_SECRET = os.getenv("JWT_SECRET")
 JWT_ALGORITHM = "HS256"
 
+# Signed OAuth state
+OAUTH_STATE_TTL = float(os.getenv("OAUTH_STATE_TTL", "900"))
+OAUTH_STATE_BIND_COOKIE = os.getenv("OAUTH_STATE_BIND_COOKIE", "true").lower() == "true"
+
 # Google API endpoints
-GOOGLE_TOKEN_URL = "https://oauth2.googleapis.com/token"
-GOOGLE_USERINFO_URL = "https://www.googleapis.com/oauth2/v2/userinfo"
+# Server-to-server URLs (token, userinfo, discovery) can be overridden,
+# e.g. to point at the local stubs in `benchmarks/`.
+GOOGLE_TOKEN_URL = os.getenv("GOOGLE_TOKEN_URL", "https://oauth2.googleapis.com/token")
+GOOGLE_USERINFO_URL = os.getenv("GOOGLE_USERINFO_URL", "https://www.googleapis.com/oauth2/v2/userinfo")
+GOOGLE_REVOKE_URL = os.getenv("GOOGLE_REVOKE_URL", "https://oauth2.googleapis.com/revoke")
 GOOGLE_AUTH_URL = "https://accounts.google.com/o/oauth2/v2/auth"
+GOOGLE_DISCOVERY_URL = os.getenv("GOOGLE_DISCOVERY_URL", "https://accounts.google.com/.well-known/openid-configuration")
 
 # Microsoft API endpoints
 OUTLOOK_TENANT_ID = os.getenv("OUTLOOK_TENANT_ID", "common")
 OUTLOOK_AUTH_URL = f"https://login.microsoftonline.com/{OUTLOOK_TENANT_ID}/oauth2/v2.0/authorize"
-OUTLOOK_TOKEN_URL = f"https://login.microsoftonline.com/{OUTLOOK_TENANT_ID}/oauth2/v2.0/token"
-OUTLOOK_USERINFO_URL = "https://graph.microsoft.com/v1.0/me"
+OUTLOOK_TOKEN_URL = os.getenv("OUTLOOK_TOKEN_URL", f"https://login.microsoftonline.com/{OUTLOOK_TENANT_ID}/oauth2/v2.0/token")
+OUTLOOK_USERINFO_URL = os.getenv("OUTLOOK_USERINFO_URL", "https://graph.microsoft.com/v1.0/me")
+OUTLOOK_TOKEN_SCOPE = "openid profile email offline_access https://graph.microsoft.com/User.Read"
 
 OUTLOOK_CLIENT_ID = os.getenv("OUTLOOK_CLIENT_ID")
 OUTLOOK_CLIENT_SECRET = os.getenv("OUTLOOK_CLIENT_SECRET")
 OUTLOOK_REDIRECT_URI = os.getenv("OUTLOOK_REDIRECT_URI")
-OUTLOOK_TENANT_ID = os.getenv("OUTLOOK_TENANT_ID", "common")
 
 # XERO API
 XERO_CLIENT_ID = os.getenv("XERO_CLIENT_ID")
@@ -38,8 +211,11 @@ XERO_CLIENT_SECRET = os.getenv("XERO_CLIENT_SECRET")
 XERO_REDIRECT_URI = os.getenv("XERO_REDIRECT_URI")
 
 XERO_AUTH_URL = "https://login.xero.com/identity/connect/authorize"
-XERO_TOKEN_URL = "https://identity.xero.com/connect/token"
-XERO_CONNECTIONS_URL = "https://api.xero.com/connections"
+XERO_TOKEN_URL = os.getenv("XERO_TOKEN_URL", "https://identity.xero.com/connect/token")
+XERO_CONNECTIONS_URL = os.getenv("XERO_CONNECTIONS_URL", "https://api.xero.com/connections")
+XERO_USERINFO_URL = os.getenv("XERO_USERINFO_URL", "https://identity.xero.com/connect/userinfo")
+XERO_REVOKE_URL = os.getenv("XERO_REVOKE_URL", "https://identity.xero.com/connect/revocation")
+XERO_DISCOVERY_URL = os.getenv("XERO_DISCOVERY_URL", "https://identity.xero.com/.well-known/openid-configuration")
 
 # QUICKBOOKS
 QUICKBOOKS_CLIENT_ID = os.getenv("QUICKBOOKS_CLIENT_ID")
@@ -47,14 +223,12 @@ QUICKBOOKS_CLIENT_SECRET = os.getenv("QUICKBOOKS_CLIENT_SECRET")
 QUICKBOOKS_REDIRECT_URI = os.getenv("QUICKBOOKS_REDIRECT_URI")
 
 QUICKBOOKS_AUTH_URL = "https://appcenter.intuit.com/connect/oauth2"
-QUICKBOOKS_TOKEN_URL = "https://oauth.platform.intuit.com/oauth2/v1/tokens/bearer"
-QUICKBOOKS_USERINFO_URL = "https://accounts.platform.intuit.com/v1/openid_connect/userinfo"
+QUICKBOOKS_TOKEN_URL = os.getenv("QUICKBOOKS_TOKEN_URL", "https://oauth.platform.intuit.com/oauth2/v1/tokens/bearer")
+QUICKBOOKS_USERINFO_URL = os.getenv("QUICKBOOKS_USERINFO_URL", "https://accounts.platform.intuit.com/v1/openid_connect/userinfo")
+QUICKBOOKS_REVOKE_URL = os.getenv("QUICKBOOKS_REVOKE_URL", "https://developer.api.intuit.com/v2/oauth2/tokens/revoke")
+QUICKBOOKS_DISCOVERY_URL = os.getenv("QUICKBOOKS_DISCOVERY_URL", "https://developer.api.intuit.com/.well-known/openid_configuration")
 
 FRONTEND_GOOGLE_URL = "https://invnudge.com/setup-3?service=google&status=connected"
 FRONTEND_OUTLOOK_URL = "https://invnudge.com/setup-3?service=outlook&status=connected"
 FRONTEND_XERO_URL = "https://invnudge.com/setup-2?service=xero&status=connected"
 FRONTEND_QUICKBOOKS_URL = "https://invnudge.com/setup-2?service=quickbooks&status=connected"
-
-from supabase import create_client, Client
-
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
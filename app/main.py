@@ -1,23 +1,100 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.api import google, outlook, xero, quickbooks, status
+from app.api import providers, status, internal, metrics
+from app.api.errors import UPSTREAM_ERRORS, upstream_error_handler
+from app.middleware import AdmissionControlMiddleware, DiagnosticsMiddleware, MetricsMiddleware
+from app.services.diagnostics import loop_diagnostics
+from app.services.http import http_clients
+from app.services.jwks import jwks_cache
+from app.services.metrics import multiprocess_metrics
+from app.services.OAuthService import oauth_service
+from app.services.providers import PROVIDERS
+from app.services.rate_limit import admission_control
+from app.services.status_events import status_broker
+from app.services.token_refresh import token_refresh_leader, token_refresh_scheduler
+from app.services.tokens import token_service
+from app.services.write_behind import write_behind_queue
+from app.startup import mark, startup_timings
+import app.config as config
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Creates the pooled upstream HTTP clients (optionally preloading the
+    providers' id_token signing keys) and starts the token refresh
+    scheduler on startup; stops both on shutdown.
+
+    Runs once per worker process. Only the process holding the
+    scheduler lease in Supabase, across all instances, runs the
+    scheduler, so tokens are not refreshed twice; it is elected and
+    loads stored tokens in the background, off the startup path. In
+    write-behind mode the journal flusher is started as well and drained
+    on shutdown before the HTTP clients close. With
+    `STATUS_STREAM_DATABASE_URL` set, the status event broker listens
+    for other workers' events. With `DIAGNOSTICS_ENABLED` the event loop
+    watchdog runs for the whole lifetime of the worker. Metrics snapshots
+    are shared with the other workers for /metrics to merge.
+    """
+    if config.DIAGNOSTICS_ENABLED:
+        await loop_diagnostics.start()
+    await http_clients.start()
+    if config.WRITE_BEHIND_ENABLED:
+        await write_behind_queue.start()
+    await status_broker.start()
+    if config.HTTP_WARMUP:
+        await jwks_cache.warm_up()
+    if config.TOKEN_REFRESH_ENABLED:
+        await token_refresh_leader.start(token_refresh_scheduler.start, token_refresh_scheduler.stop)
+    await multiprocess_metrics.start()
+    mark("ready")
+    try:
+        yield
+    finally:
+        await token_refresh_leader.stop(token_refresh_scheduler.stop)
+        await token_service.close()
+        await write_behind_queue.stop()
+        await status_broker.stop()
+        await admission_control.close()
+        await http_clients.close()
+        await loop_diagnostics.stop()
+        await multiprocess_metrics.stop()
+
 
 app = FastAPI(
     title="Invnudge OAuth API",
     version="1.0.0",
-    description="API for handling OAuth2 authentication with Supabase integration."
+    description="API for handling OAuth2 authentication with Supabase integration.",
+    lifespan=lifespan
 )
 
+app.state.http_clients = http_clients
+app.state.oauth_service = oauth_service
+app.state.startup_timings = startup_timings
+
+if config.RATE_LIMIT_ENABLED:
+    app.add_middleware(AdmissionControlMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
+app.add_middleware(MetricsMiddleware)
+if config.DIAGNOSTICS_ENABLED:
+    app.add_middleware(DiagnosticsMiddleware)
 
-app.include_router(google.router)
-app.include_router(outlook.router)
-app.include_router(xero.router)
-app.include_router(quickbooks.router)
+for error in UPSTREAM_ERRORS:
+    app.add_exception_handler(error, upstream_error_handler)
+
+for provider in PROVIDERS.values():
+    app.include_router(providers.provider_router(provider))
 app.include_router(status.router)
+app.include_router(internal.router)
+app.include_router(metrics.router)
+
+mark("import")
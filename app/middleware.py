@@ -0,0 +1,202 @@
+import math
+import time
+from urllib.parse import parse_qs
+
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+import app.config as config
+from app.services.diagnostics import LoopDiagnostics, loop_diagnostics
+from app.services.metrics import REQUEST_DURATION, REQUESTS_IN_FLIGHT, REQUESTS_REJECTED
+from app.services.oauth_state import OAuthStateError, cookie_name, oauth_state
+from app.services.rate_limit import AdmissionControl, admission_control
+
+
+def route_template(scope: Scope) -> str:
+    """
+    Returns the path template of the route a request matches, or
+    `unmatched`.
+    """
+    for route in scope["app"].router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", "unmatched")
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    Records per-route request latency and in-flight requests.
+
+    Requests are labelled with the route template (e.g.
+    `/auth/google/callback`) rather than the raw path, so query strings
+    and path parameters do not create new series. Paths that match no
+    route share the `unmatched` label.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route = route_template(scope)
+        status_code = 500
+
+        async def _send(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc(route)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            REQUESTS_IN_FLIGHT.dec(route)
+            REQUEST_DURATION.observe(
+                scope["method"], route, status_code,
+                value=time.perf_counter() - started
+            )
+
+
+def client_ip(scope: Scope, hops: int = config.TRUSTED_PROXY_HOPS) -> str | None:
+    """
+    Returns the address of the client behind `hops` trusted proxies.
+
+    Each proxy appends the address it received the request from to
+    X-Forwarded-For, so only the rightmost `hops` entries are trusted;
+    anything further left is supplied by the client. Without enough
+    entries (or with `hops` 0) the peer address is used.
+    """
+    if hops > 0:
+        forwarded = [
+            entry.strip()
+            for name, value in scope.get("headers", ())
+            if name == b"x-forwarded-for"
+            for entry in value.decode("latin-1").split(",")
+        ]
+        if len(forwarded) >= hops and forwarded[-hops]:
+            return forwarded[-hops]
+    client = scope.get("client")
+    return client[0] if client else None
+
+
+def request_user_id(scope: Scope) -> str | None:
+    """
+    Returns the user an OAuth callback is made for: the user in its
+    signed `state`, if the state is bound to the browser's nonce cookie.
+
+    Other requests name their user without proof (a `user_id` query
+    parameter or a raw `user_id/user_hash` state anyone can send), so
+    they are limited per client IP only; keying a bucket on such a value
+    would let a client drain another user's bucket.
+    """
+    parts = scope.get("path", "").strip("/").split("/")
+    if len(parts) != 3 or parts[2] != "callback":
+        return None
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    state = query.get("state", [""])[0]
+    if not oauth_state.is_signed(state):
+        return None
+    nonce = Request(scope).cookies.get(cookie_name(parts[1]))
+    try:
+        return oauth_state.verify(state, nonce).user_id
+    except OAuthStateError:
+        return None
+
+
+class AdmissionControlMiddleware:
+    """
+    Rate limits the browser-facing /auth routes.
+
+    GET requests under /auth take a token from the client IP's bucket
+    and, for OAuth callbacks, from the bucket of the user in the verified
+    state (see `request_user_id`), and get a 429 with
+    Retry-After once either is empty. OAuth callbacks beyond the
+    per-worker in-flight cap get a 503. Internal POST endpoints are not
+    limited.
+    """
+
+    def __init__(self, app: ASGIApp, control: AdmissionControl = admission_control):
+        self.app = app
+        self.control = control
+
+    @staticmethod
+    def _reject(status_code: int, reason: str, retry_after: float) -> JSONResponse:
+        REQUESTS_REJECTED.inc(reason)
+        return JSONResponse(
+            {"detail": "Too many requests" if status_code == 429 else "Server busy, try again"},
+            status_code=status_code,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        path = scope.get("path", "")
+        if scope["type"] != "http" or scope["method"] != "GET" or not path.startswith("/auth/"):
+            await self.app(scope, receive, send)
+            return
+
+        limited = await self.control.check(client_ip(scope), request_user_id(scope))
+        if limited is not None:
+            reason, wait = limited
+            await self._reject(429, reason, wait)(scope, receive, send)
+            return
+
+        if not path.endswith("/callback"):
+            await self.app(scope, receive, send)
+            return
+        if not self.control.try_enter_callback():
+            await self._reject(503, "callback_concurrency", 1)(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.control.exit_callback()
+
+
+class DiagnosticsMiddleware:
+    """
+    Registers in-flight requests with the loop diagnostics, so blocked
+    loop events name the routes in flight and slow requests get profiled.
+    Streaming routes (`DIAGNOSTICS_EXCLUDED_ROUTES`) are passed through
+    untracked: they stay open by design and are neither sampled nor
+    reported as slow.
+    """
+
+    def __init__(
+            self,
+            app: ASGIApp,
+            diagnostics: LoopDiagnostics = loop_diagnostics,
+            excluded_routes: frozenset[str] = config.DIAGNOSTICS_EXCLUDED_ROUTES):
+        self.app = app
+        self.diagnostics = diagnostics
+        self.excluded_routes = excluded_routes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        route = route_template(scope)
+        if route in self.excluded_routes:
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def _send(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        request_id = self.diagnostics.request_started(scope["method"], route)
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            self.diagnostics.request_finished(request_id, status_code)
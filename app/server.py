@@ -0,0 +1,106 @@
+"""
+Production entry point.
+
+Runs the app under uvicorn with one worker process per CPU available
+to the container (respecting cgroup CPU quotas), using uvloop and
+httptools when they are installed. Each worker builds its own pools,
+caches and schedulers in the app lifespan and drains in-flight requests
+for up to `SERVER_GRACEFUL_TIMEOUT` seconds on SIGTERM.
+
+Usage:
+    python -m app.server
+    WEB_CONCURRENCY=4 PORT=8080 python -m app.server
+"""
+import importlib.util
+import logging
+import math
+import os
+import tempfile
+
+import uvicorn
+
+import app.config as config
+from app.services.metrics import clear_multiprocess_dir
+
+logger = logging.getLogger(__name__)
+
+
+def cgroup_cpu_limit() -> float | None:
+    """
+    Returns the container's CPU quota in CPUs, or None when unlimited.
+
+    Reads cgroup v2 (`cpu.max`) and falls back to cgroup v1
+    (`cpu.cfs_quota_us` / `cpu.cfs_period_us`).
+    """
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            return int(quota) / int(period)
+        return None
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        if quota > 0 and period > 0:
+            return quota / period
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def available_cpus() -> int:
+    """
+    Returns how many CPUs this process may use: the smaller of its CPU
+    affinity and the cgroup quota (rounded up), at least 1.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    limit = cgroup_cpu_limit()
+    if limit is not None:
+        cpus = min(cpus, math.ceil(limit))
+    return max(1, cpus)
+
+
+def worker_count() -> int:
+    """
+    Returns `WEB_CONCURRENCY` if set, otherwise one worker per available CPU.
+    """
+    return config.WEB_CONCURRENCY or available_cpus()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    loop = "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+    http = "httptools" if importlib.util.find_spec("httptools") else "h11"
+    workers = worker_count()
+    logger.info("Starting %d worker(s) on %s:%d (loop=%s, http=%s)", workers, config.HOST, config.PORT, loop, http)
+    metrics_dir = config.METRICS_MULTIPROC_DIR
+    if not metrics_dir and workers > 1:
+        # workers re-import app.config and read the directory from the environment
+        metrics_dir = os.environ["METRICS_MULTIPROC_DIR"] = os.path.join(tempfile.gettempdir(), "invnudge-metrics")
+    if metrics_dir:
+        clear_multiprocess_dir(metrics_dir)
+
+    uvicorn.run(
+        "app.main:app",
+        host=config.HOST,
+        port=config.PORT,
+        workers=workers,
+        loop=loop,
+        http=http,
+        lifespan="on",
+        # X-Forwarded-For is resolved by hop count in app.middleware.client_ip;
+        # uvicorn would trust its client-controlled leftmost entry
+        proxy_headers=False,
+        timeout_graceful_shutdown=config.SERVER_GRACEFUL_TIMEOUT,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,215 +1,242 @@
-import base64
+import asyncio
+import logging
 
 import httpx
-from supabase import create_client
 import app.config as config
-
-supabase = create_client(config.SUPABASE_URL, config.SUPABASE_KEY)
+from app.services.database import SupabaseRest, db
+from app.services.http import HttpClients, http_clients
+from app.services.jwks import IdTokenError, JwksCache, jwks_cache
+from app.services.metrics import stage
+from app.services.providers import PROVIDERS, TOKEN_AUTH, FollowUp
+from app.services.resilience import UpstreamError
+from app.services.status_events import StatusBroker, status_broker
+from app.services.token_refresh import TokenRefreshScheduler, token_refresh_scheduler
+from app.services.tokens import TokenService, expires_at, parse_timestamp, token_service
+from app.services.user_status import UserStatusService, user_status_service
+from app.services.write_behind import WriteBehindQueue, write_behind_queue
+
+logger = logging.getLogger(__name__)
+
+
+def read_json(provider: str, resp: httpx.Response, required: str | None = None):
+    """
+    Decodes a provider response, checking its status first.
+
+    Args:
+        provider (str): Provider name, used in the error.
+        resp (httpx.Response): Response to decode.
+        required (str | None): Key the decoded object must contain.
+
+    Raises:
+        UpstreamError: On a non-2xx status, a body that is not JSON or
+            a missing required key.
+    """
+    if not resp.is_success:
+        raise UpstreamError(provider, f"{resp.request.url.path} failed", resp.status_code)
+    try:
+        data = resp.json()
+    except ValueError:
+        raise UpstreamError(provider, f"{resp.request.url.path} returned invalid JSON", resp.status_code)
+    if required is not None and (not isinstance(data, dict) or required not in data):
+        raise UpstreamError(provider, f"{resp.request.url.path} returned no {required}", resp.status_code)
+    return data
 
 
 class OAuthService:
-    async def handle_google_callback(self, code: str, state: str):
+    def __init__(
+            self,
+            clients: HttpClients = http_clients,
+            database: SupabaseRest = db,
+            statuses: UserStatusService = user_status_service,
+            scheduler: TokenRefreshScheduler = token_refresh_scheduler,
+            tokens: TokenService = token_service,
+            jwks: JwksCache = jwks_cache,
+            journal: WriteBehindQueue = write_behind_queue,
+            events: StatusBroker = status_broker):
+        self.clients = clients
+        self.db = database
+        self.statuses = statuses
+        self.scheduler = scheduler
+        self.tokens = tokens
+        self.jwks = jwks
+        self.journal = journal
+        self.events = events
+
+    async def handle_callback(self, provider: str, code: str, user_id: str, params: dict | None = None):
         """
-        Handles OAuth callback for Google provider.
+        Completes an OAuth flow for any provider in `PROVIDERS`.
 
-        Args:
-            code (str): Authorization code returned by the provider.
-            state (str): State with user ID and hash of the user initiating the OAuth login.
-        """
-        user_id = state.split('/')[0]
-        async with httpx.AsyncClient() as client:
-            token_resp = await client.post(config.GOOGLE_TOKEN_URL, data={
-                "code": code,
-                "client_id": config.GOOGLE_CLIENT_ID,
-                "client_secret": config.GOOGLE_CLIENT_SECRET,
-                "redirect_uri": config.GOOGLE_REDIRECT_URI,
-                "grant_type": "authorization_code"
-            })
-            tokens = token_resp.json()
-            access_token = tokens.get("access_token")
-
-            user_resp = await client.get(config.GOOGLE_USERINFO_URL, headers={
-                "Authorization": f"Bearer {access_token}"
-            })
-            user_info = user_resp.json()
-
-            supabase.table("google_users").upsert({
-                "google_id": user_info["id"],
-                "email": user_info["email"],
-                "given_name": user_info.get("given_name"),
-                "family_name": user_info.get("family_name"),
-                "picture": user_info.get("picture"),
-                "access_token": tokens.get("access_token"),
-                "refresh_token": tokens.get("refresh_token"),
-                "user_id": user_id
-            }, on_conflict="user_id").execute()
-
-            # Update users table: set is_email_service_connected = TRUE
-            supabase.table("users").update({
-                "is_email_service_connected": True
-            }).eq("id", user_id).execute()
-
-    async def handle_outlook_callback(self, code: str, state: str):
-        """
-        Handles OAuth callback for Outlook provider.
+        Exchanges the authorization code for tokens, builds the profile
+        from the verified id_token where possible and otherwise from the
+        provider's follow-up requests (run concurrently), and stores the
+        connection. Each stage is timed in `oauth_stage_duration_seconds`.
 
         Args:
+            provider (str): Provider name, a key of `PROVIDERS`.
             code (str): Authorization code returned by the provider.
-            state (str): The ID and hash of the user initiating the OAuth login.
-        """
-        user_id = state.split('/')[0]
-        async with httpx.AsyncClient() as client:
-            # 1. Exchange code for tokens
-            token_resp = await client.post(
-                config.OUTLOOK_TOKEN_URL,
-                data={
-                    "client_id": config.OUTLOOK_CLIENT_ID,
-                    "scope": "openid profile email offline_access https://graph.microsoft.com/User.Read",
-                    "code": code,
-                    "redirect_uri": config.OUTLOOK_REDIRECT_URI,
-                    "grant_type": "authorization_code",
-                    "client_secret": config.OUTLOOK_CLIENT_SECRET
-                },
-                headers={"Content-Type": "application/x-www-form-urlencoded"}
-            )
-            tokens = token_resp.json()
-            access_token = tokens.get("access_token")
-
-            # 2. Fetch user info
-            user_resp = await client.get(
-                config.OUTLOOK_USERINFO_URL,
-                headers={"Authorization": f"Bearer {access_token}"}
-            )
-            user_info = user_resp.json()
-
-        # 3. Upsert user in Supabase
-        supabase.table("outlook_users").upsert({
-            "outlook_id": user_info.get("id"),
-            "email": user_info.get("userPrincipalName"),
-            "display_name": user_info.get("displayName"),
-            "given_name": user_info.get("givenName"),
-            "surname": user_info.get("surname"),
-            "access_token": tokens.get("access_token"),
-            "refresh_token": tokens.get("refresh_token"),
-            "user_id": user_id  # ensure we link to the correct user
-        }, on_conflict="user_id").execute()
-
-        # Update users table: set is_email_service_connected = TRUE
-        supabase.table("users").update({
-            "is_email_service_connected": True
-        }).eq("id", user_id).execute()
+            user_id (str): ID of the user initiating the OAuth login.
+            params (dict | None): The provider's extra callback parameters
+                (`Provider.callback_params`), e.g. QuickBooks' realmId.
 
-    async def handle_xero_callback(self, code: str, state: str):
+        Returns:
+            dict | None: The user's status after the connection is stored.
         """
-        Handles OAuth callback for Xero provider.
-
-        Args:
-            code (str): Authorization code returned by the provider.
-            state (str): The ID and hash of the user initiating the OAuth login.
-        """
-        user_id = state.split('/')[0]
-        async with httpx.AsyncClient() as client:
-            basic_auth = base64.b64encode(
-                f"{config.XERO_CLIENT_ID}:{config.XERO_CLIENT_SECRET}".encode()
-            ).decode()
+        descriptor = PROVIDERS[provider]
+        client = self.clients.get(descriptor.group)
+        fields, headers = TOKEN_AUTH[provider]
 
+        with stage(provider, "token_exchange"):
             token_resp = await client.post(
-                config.XERO_TOKEN_URL,
+                descriptor.token_url,
                 data={
                     "grant_type": "authorization_code",
                     "code": code,
-                    "redirect_uri": config.XERO_REDIRECT_URI
+                    "redirect_uri": descriptor.redirect_uri,
+                    **fields
                 },
-                headers={
-                    "Authorization": f"Basic {basic_auth}",
-                    "Content-Type": "application/x-www-form-urlencoded"
-                }
+                headers=headers
             )
-            tokens = token_resp.json()
-            access_token = tokens.get("access_token")
+            tokens = read_json(provider, token_resp, "access_token")
 
-            connections_resp = await client.get(
-                config.XERO_CONNECTIONS_URL,
-                headers={"Authorization": f"Bearer {access_token}"}
-            )
-            connections = connections_resp.json()
+        with stage(provider, "profile_fetch"):
+            prefetched = await self.user_info_from_id_token(provider, tokens)
+            results = await self.fetch_follow_ups(provider, client, tokens["access_token"], prefetched)
 
-            tenant_id = connections[0].get("tenantId") if connections else None
-            tenant_name = connections[0].get(
-                "tenantName") if connections else None
-
-            userinfo_resp = await client.get(
-                "https://identity.xero.com/connect/userinfo",
-                headers={"Authorization": f"Bearer {access_token}"}
-            )
-            user_info = userinfo_resp.json()
-            email = user_info.get("email")
-
-        supabase.table("xero_users").upsert({
-            "tenant_id": tenant_id,
-            "tenant_name": tenant_name,
+        record = {
+            **descriptor.profile(results, params or {}),
             "access_token": tokens.get("access_token"),
             "refresh_token": tokens.get("refresh_token"),
-            "id_token": tokens.get("id_token"),
-            "user_id": user_id,
-            "email": email
-        }, on_conflict="user_id").execute()
+            "expires_at": expires_at(tokens)
+        }
+        if descriptor.store_id_token:
+            record["id_token"] = tokens.get("id_token")
+        return await self.connect_provider(provider, user_id, record)
 
-        supabase.table("users").update({
-            "is_invoice_service_connected": True,
-        }).eq("id", user_id).execute()
-
-    async def handle_quickbooks_callback(self, code: str, realm_id: str, state: str):
+    async def user_info_from_id_token(self, provider: str, tokens: dict) -> dict:
         """
-        Handles OAuth callback for QuickBooks provider.
+        Derives the user profile from a locally verified `id_token`.
 
         Args:
-            code (str): Authorization code returned by QuickBooks.
-            realm_id (str): The QuickBooks company (realm) ID.
-            state (str): The state of the user initiating the OAuth login.
+            provider (str): Provider name.
+            tokens (dict): Token response from the code exchange.
+
+        Returns:
+            dict: {"user_info": profile} when the token verifies and
+            carries an email, otherwise {} so that the userinfo endpoint
+            is called instead.
+        """
+        id_token = tokens.get("id_token")
+        build_profile = PROVIDERS[provider].id_token_profile
+        if not id_token or build_profile is None:
+            return {}
+        try:
+            claims = await self.jwks.verify(provider, id_token)
+        except IdTokenError as e:
+            logger.warning("Falling back to %s userinfo: %s", provider, e)
+            return {}
+        user_info = build_profile(claims)
+        if not user_info.get("email"):
+            return {}
+        return {"user_info": user_info}
+
+    async def fetch_follow_ups(
+            self,
+            provider: str,
+            client: httpx.AsyncClient,
+            access_token: str,
+            prefetched: dict | None = None) -> dict:
         """
-        user_id = state.split('/')[0]
-        async with httpx.AsyncClient() as client:
-            basic_auth = base64.b64encode(
-                f"{config.QUICKBOOKS_CLIENT_ID}:{config.QUICKBOOKS_CLIENT_SECRET}".encode()
-            ).decode()
+        Runs the provider's follow-up requests concurrently.
 
-            token_resp = await client.post(
-                config.QUICKBOOKS_TOKEN_URL,
-                data={
-                    "grant_type": "authorization_code",
-                    "code": code,
-                    "redirect_uri": config.QUICKBOOKS_REDIRECT_URI
-                },
-                headers={
-                    "Authorization": f"Basic {basic_auth}",
-                    "Content-Type": "application/x-www-form-urlencoded"
-                }
-            )
-            tokens = token_resp.json()
-            access_token = tokens.get("access_token")
+        Each request is isolated: a failing optional follow-up resolves to
+        None without affecting the others, while a failing required one is
+        raised once all requests have settled.
 
-            user_resp = await client.get(
-                config.QUICKBOOKS_USERINFO_URL,
-                headers={"Authorization": f"Bearer {access_token}"}
-            )
-            user_info = user_resp.json()
+        Args:
+            provider (str): Provider name, a key of `PROVIDERS`.
+            client (httpx.AsyncClient): Pooled client for the provider.
+            access_token (str): Access token from the code exchange.
+            prefetched (dict | None): Results already known (e.g. from the
+                id_token); their follow-ups are skipped.
+
+        Returns:
+            dict: Decoded JSON response per follow-up name.
+        """
+        prefetched = prefetched or {}
+        follow_ups = [f for f in PROVIDERS[provider].follow_ups if f.name not in prefetched]
+        headers = {"Authorization": f"Bearer {access_token}"}
+
+        async def _fetch(follow_up: FollowUp):
+            resp = await client.get(follow_up.url, headers=headers)
+            return read_json(provider, resp)
+
+        responses = await asyncio.gather(
+            *(_fetch(follow_up) for follow_up in follow_ups),
+            return_exceptions=True
+        )
+
+        results = dict(prefetched)
+        for follow_up, response in zip(follow_ups, responses):
+            if isinstance(response, Exception):
+                if follow_up.required:
+                    raise response
+                response = None
+            results[follow_up.name] = response
+        return results
+
+    async def connect_provider(self, provider: str, user_id: str, record: dict) -> dict:
+        """
+        Persists a provider connection in a single round trip.
+
+        Calls the `connect_provider` Postgres function (see
+        `app/services/sql/connect_provider.sql`), which upserts the
+        `<provider>_users` row and sets the matching `users` connection
+        flag in one transaction. The returned status is written through
+        to the status cache, or the cached entry dropped if none came back,
+        and the change is published to `/auth/status/stream` subscribers.
+        The new access token is cached for token vending and handed to the
+        background refresh scheduler if this process runs it; otherwise
+        the leader's rescan picks the connection up.
+
+        With `WRITE_BEHIND_ENABLED` the record is only journaled locally
+        and written by the write-behind flusher; no status is returned and
+        /auth/status overlays the pending connection flag meanwhile.
 
-        supabase.table("quickbooks_users").upsert({
-            "realm_id": realm_id,
-            "email": user_info.get("email"),
-            "given_name": user_info.get("givenName"),
-            "family_name": user_info.get("familyName"),
-            "access_token": tokens.get("access_token"),
-            "refresh_token": tokens.get("refresh_token"),
-            "id_token": tokens.get("id_token"),
-            "user_id": user_id
-        }, on_conflict="user_id").execute()
-
-        # Update users table: set is_invoice_service_connected = TRUE
-        supabase.table("users").update({
-            "is_invoice_service_connected": True
-        }).eq("id", user_id).execute()
+        Args:
+            provider (str): Provider name (google, outlook, xero, quickbooks).
+            user_id (str): ID of the user in the `users` table.
+            record (dict): Columns of the provider row, without `user_id`.
+
+        Returns:
+            dict | None: The user's status after the write, None in
+            write-behind mode.
+        """
+        with stage(provider, "db_write"):
+            if config.WRITE_BEHIND_ENABLED:
+                await self.journal.enqueue(provider, user_id, record)
+                status = None
+            else:
+                status = await self.db.rpc("connect_provider", {
+                    "p_table": PROVIDERS[provider].table,
+                    "p_flag": PROVIDERS[provider].flag,
+                    "p_user_id": user_id,
+                    "p_record": record
+                })
+        if status:
+            self.statuses.put(status)
+        else:
+            self.statuses.invalidate(user_id)
+        self.events.publish({
+            "user_id": str(user_id),
+            "provider": provider,
+            "flag": PROVIDERS[provider].flag,
+            "status": status,
+        })
+        self.tokens.remember(provider, user_id, record)
+        if self.scheduler.running and record.get("refresh_token"):
+            # other workers' connections reach the leader through its rescan
+            self.scheduler.schedule(provider, user_id, parse_timestamp(record.get("expires_at")))
+        return status
 
 
 oauth_service = OAuthService()
@@ -0,0 +1,213 @@
+from urllib.parse import quote_plus
+
+import httpx
+from app.config import SUPABASE_URL, SUPABASE_KEY
+from app.services.http import http_clients
+from app.services.metrics import DB_QUERY_DURATION
+
+
+class DatabaseError(Exception):
+    """
+    Raised when a PostgREST request returns a non-success status.
+    """
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f"{status_code}: {message}")
+        self.status_code = status_code
+        self.message = message
+
+
+def in_filter(values) -> str:
+    """
+    Builds a PostgREST `in.(...)` filter, quoting every value.
+    """
+    quoted = (
+        '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+        for value in values
+    )
+    return f"in.({','.join(quoted)})"
+
+
+def _encoded_length(text: str) -> int:
+    """
+    Returns the length of a query parameter value as httpx sends it
+    (form-encoded).
+    """
+    return len(quote_plus(text))
+
+
+def chunk_by_length(values: list, budget: int) -> list[list]:
+    """
+    Splits values into chunks whose `in.(...)` filter, encoded as sent in
+    the query string, stays within `budget` characters, keeping request
+    URLs under server limits. A single value over budget gets a chunk of
+    its own.
+    """
+    # encoding is per character, so the filter's encoded length is the sum
+    # of its parts': the `in.(` `)` wrapper, the values and the separators
+    wrapper = _encoded_length(in_filter([]))
+    separator = _encoded_length(",")
+    chunks, chunk, length = [], [], wrapper
+    for value in values:
+        size = _encoded_length(in_filter([value])) - wrapper
+        if chunk and length + separator + size > budget:
+            chunks.append(chunk)
+            chunk, length = [], wrapper
+        if chunk:
+            length += separator
+        chunk.append(value)
+        length += size
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+class SupabaseRest:
+    """
+    Non-blocking access to Supabase through its PostgREST API.
+
+    Every call goes over the pooled `supabase` HTTP client, so database
+    I/O never blocks the event loop the way supabase-py's sync
+    `.execute()` does.
+    """
+
+    def __init__(self, client: httpx.AsyncClient | None = None):
+        self._client = client
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        return self._client or http_clients.get("supabase")
+
+    @staticmethod
+    def _headers(prefer: str | None = None, single: bool = False) -> dict:
+        headers = {
+            "apikey": SUPABASE_KEY,
+            "Authorization": f"Bearer {SUPABASE_KEY}",
+        }
+        if prefer:
+            headers["Prefer"] = prefer
+        if single:
+            headers["Accept"] = "application/vnd.pgrst.object+json"
+        return headers
+
+    @staticmethod
+    def _raise_for_status(resp: httpx.Response):
+        if resp.status_code >= 400:
+            raise DatabaseError(resp.status_code, resp.text)
+
+    async def select(
+            self,
+            table: str,
+            columns: str,
+            filters: dict,
+            single: bool = False):
+        """
+        Selects rows from a table.
+
+        Args:
+            table (str): Table name.
+            columns (str): Comma-separated list of columns.
+            filters (dict): PostgREST filters, e.g. {"id": "eq.<uuid>"}.
+            single (bool): Return one object instead of a list.
+                Returns None when no row matches.
+
+        Returns:
+            list | dict | None: Selected rows.
+        """
+        with DB_QUERY_DURATION.time("select", table):
+            resp = await self.client.get(
+                f"{SUPABASE_URL}/rest/v1/{table}",
+                params={"select": columns, **filters},
+                headers=self._headers(single=single)
+            )
+        if single and resp.status_code == 406:
+            # PostgREST answers 406 when `.single()` matches no rows
+            return None
+        self._raise_for_status(resp)
+        return resp.json()
+
+    async def upsert(self, table: str, rows: dict | list[dict], on_conflict: str):
+        """
+        Inserts rows or merges them into existing ones on conflict.
+
+        Args:
+            table (str): Table name.
+            rows (dict | list[dict]): Row or rows to upsert.
+            on_conflict (str): Column(s) of the unique constraint.
+        """
+        with DB_QUERY_DURATION.time("upsert", table):
+            resp = await self.client.post(
+                f"{SUPABASE_URL}/rest/v1/{table}",
+                params={"on_conflict": on_conflict},
+                json=rows,
+                headers=self._headers(prefer="resolution=merge-duplicates,return=minimal")
+            )
+        self._raise_for_status(resp)
+
+    async def update(self, table: str, values: dict, filters: dict, returning: str | None = None):
+        """
+        Updates rows matching the given filters.
+
+        Args:
+            table (str): Table name.
+            values (dict): Column values to set.
+            filters (dict): PostgREST filters, e.g. {"id": "eq.<uuid>"}.
+            returning (str | None): Columns of the updated rows to return.
+
+        Returns:
+            list | None: Updated rows when `returning` is set.
+        """
+        params = filters
+        prefer = "return=minimal"
+        if returning:
+            params = {**filters, "select": returning}
+            prefer = "return=representation"
+        with DB_QUERY_DURATION.time("update", table):
+            resp = await self.client.patch(
+                f"{SUPABASE_URL}/rest/v1/{table}",
+                params=params,
+                json=values,
+                headers=self._headers(prefer=prefer)
+            )
+        self._raise_for_status(resp)
+        if returning:
+            return resp.json()
+
+    async def delete(self, table: str, filters: dict):
+        """
+        Deletes rows matching the given filters.
+
+        Args:
+            table (str): Table name.
+            filters (dict): PostgREST filters, e.g. {"id": "eq.<uuid>"}.
+        """
+        with DB_QUERY_DURATION.time("delete", table):
+            resp = await self.client.delete(
+                f"{SUPABASE_URL}/rest/v1/{table}",
+                params=filters,
+                headers=self._headers(prefer="return=minimal")
+            )
+        self._raise_for_status(resp)
+
+    async def rpc(self, function: str, params: dict):
+        """
+        Calls a Postgres function exposed through PostgREST.
+
+        Args:
+            function (str): Function name.
+            params (dict): Named function arguments.
+
+        Returns:
+            Any: Decoded function result.
+        """
+        with DB_QUERY_DURATION.time("rpc", function):
+            resp = await self.client.post(
+                f"{SUPABASE_URL}/rest/v1/rpc/{function}",
+                json=params,
+                headers=self._headers()
+            )
+        self._raise_for_status(resp)
+        return resp.json()
+
+
+db = SupabaseRest()
@@ -0,0 +1,238 @@
+import asyncio
+import itertools
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+
+import app.config as config
+from app.services.metrics import LOOP_BLOCKS, LOOP_LAG
+
+logger = logging.getLogger(__name__)
+
+# frames kept per captured stack, innermost last
+STACK_DEPTH = 20
+# folded stacks kept per slow-request profile
+PROFILE_TOP = 10
+
+
+def _frame_label(frame) -> str:
+    return f"{frame.f_globals.get('__name__', '?')}.{frame.f_code.co_name}:{frame.f_lineno}"
+
+
+def await_chain(task: asyncio.Task) -> str:
+    """
+    Folds the coroutine chain a task is suspended in (or running) into
+    one `outer;...;inner` line, like a flame graph stack.
+    """
+    frames = []
+    obj = task.get_coro()
+    while obj is not None and len(frames) < STACK_DEPTH * 2:
+        frame = getattr(obj, "cr_frame", None) or getattr(obj, "gi_frame", None)
+        if frame is not None:
+            frames.append(_frame_label(frame))
+        obj = getattr(obj, "cr_await", None) or getattr(obj, "gi_yieldfrom", None)
+    return ";".join(frames) or "<done>"
+
+
+class ActiveRequest:
+    __slots__ = ("method", "route", "started", "task", "samples")
+
+    def __init__(self, method: str, route: str, task: asyncio.Task | None):
+        self.method = method
+        self.route = route
+        self.started = time.monotonic()
+        self.task = task
+        self.samples: Counter[str] = Counter()
+
+
+class LoopDiagnostics:
+    """
+    Finds what blocks the event loop and where slow requests spend time.
+
+    A heartbeat task sleeps `interval` seconds at a time and records how
+    late it wakes up (`event_loop_lag_seconds`). A watchdog thread
+    notices when the heartbeat is overdue by more than `block_threshold`
+    and captures the loop thread's stack at that moment, which is the
+    synchronous call holding the loop.
+
+    The same thread samples, every `sample_interval` seconds, the await
+    chain of each request that has run for more than half of
+    `slow_request`. When such a request ends over budget, its folded
+    samples are kept as a profile.
+
+    Block events and profiles are kept in memory (the last `history` of
+    each), logged as one JSON object per line and, with `event_log` set,
+    appended to that file so tests can assert on them across workers.
+    All logging and file writes happen on the watchdog thread.
+    """
+
+    def __init__(
+            self,
+            interval: float = config.DIAGNOSTICS_LOOP_INTERVAL,
+            block_threshold: float = config.DIAGNOSTICS_BLOCK_THRESHOLD,
+            slow_request: float = config.DIAGNOSTICS_SLOW_REQUEST,
+            sample_interval: float = config.DIAGNOSTICS_SAMPLE_INTERVAL,
+            history: int = config.DIAGNOSTICS_HISTORY,
+            event_log: str = config.DIAGNOSTICS_EVENT_LOG):
+        self.interval = interval
+        self.block_threshold = block_threshold
+        self.slow_request = slow_request
+        self.sample_interval = sample_interval
+        self.event_log = event_log
+        self.blocks: deque[dict] = deque(maxlen=history)
+        self.slow_requests: deque[dict] = deque(maxlen=history)
+        self.requests: dict[int, ActiveRequest] = {}
+        self.max_lag = 0.0
+        self._ids = itertools.count()
+        self._beat = time.monotonic()
+        self._open_block: dict | None = None
+        self._events: queue.SimpleQueue[dict] = queue.SimpleQueue()
+        self._loop_thread: int | None = None
+        self._heartbeat_task: asyncio.Task | None = None
+        self._thread: threading.Thread | None = None
+        self._stopping = threading.Event()
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - self._beat - self.interval)
+            self._beat = now
+            LOOP_LAG.observe(value=lag)
+            self.max_lag = max(self.max_lag, lag)
+            block = self._open_block
+            if block is not None:
+                self._open_block = None
+                block["duration"] = round(lag, 4)
+                self._events.put(block)
+
+    def _capture_block(self, stalled: float):
+        frame = sys._current_frames().get(self._loop_thread)
+        stack = traceback.format_stack(frame, limit=STACK_DEPTH) if frame is not None else []
+        block = {
+            "event": "event_loop_blocked",
+            "at": time.time(),
+            "duration": None,
+            "stalled_for": round(stalled, 4),
+            "stack": [line.rstrip() for line in stack],
+            "in_flight": sorted({f"{r.method} {r.route}" for r in list(self.requests.values())}),
+        }
+        self.blocks.append(block)
+        self._open_block = block
+        LOOP_BLOCKS.inc()
+
+    def _sample(self):
+        cutoff = time.monotonic() - self.slow_request / 2
+        for request in list(self.requests.values()):
+            if request.started < cutoff and request.task is not None:
+                try:
+                    request.samples[await_chain(request.task)] += 1
+                except (RuntimeError, AttributeError):
+                    # the chain changed while it was walked
+                    pass
+
+    def _emit(self, event: dict):
+        line = json.dumps(event, default=str)
+        logger.warning("%s", line)
+        if self.event_log:
+            try:
+                with open(self.event_log, "a") as f:
+                    f.write(line + "\n")
+            except OSError as e:
+                logger.error("Could not write diagnostics event log: %s", e)
+
+    def _watch(self):
+        tick = min(self.sample_interval, self.block_threshold / 2)
+        while not self._stopping.wait(tick):
+            stalled = time.monotonic() - self._beat - self.interval
+            if stalled > self.block_threshold and self._open_block is None:
+                self._capture_block(stalled)
+            self._sample()
+            while not self._events.empty():
+                self._emit(self._events.get())
+
+    def request_started(self, method: str, route: str) -> int:
+        """
+        Registers an in-flight request of the current task.
+
+        Returns:
+            int: Handle to pass to `request_finished`.
+        """
+        request_id = next(self._ids)
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        self.requests[request_id] = ActiveRequest(method, route, task)
+        return request_id
+
+    def request_finished(self, request_id: int, status_code: int):
+        request = self.requests.pop(request_id, None)
+        if request is None:
+            return
+        duration = time.monotonic() - request.started
+        if duration < self.slow_request:
+            return
+        samples = sum(request.samples.values())
+        profile = {
+            "event": "slow_request",
+            "at": time.time(),
+            "method": request.method,
+            "route": request.route,
+            "status": status_code,
+            "duration": round(duration, 4),
+            "samples": samples,
+            "stacks": [
+                {"stack": stack, "share": round(count / samples, 3)}
+                for stack, count in request.samples.most_common(PROFILE_TOP)
+            ],
+        }
+        self.slow_requests.append(profile)
+        self._events.put(profile)
+
+    async def start(self):
+        """
+        Starts the heartbeat on the running loop and the watchdog thread.
+        """
+        if self._thread is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopping.clear()
+        self._heartbeat_task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        if self._thread is None:
+            return
+        self._heartbeat_task.cancel()
+        await asyncio.gather(self._heartbeat_task, return_exceptions=True)
+        self._stopping.set()
+        await asyncio.to_thread(self._thread.join)
+        self._thread = self._heartbeat_task = None
+
+    def reset(self):
+        """
+        Forgets recorded block events, profiles and the maximum lag.
+        """
+        self.blocks.clear()
+        self.slow_requests.clear()
+        self.max_lag = 0.0
+
+    def report(self) -> dict:
+        return {
+            "enabled": self._thread is not None,
+            "max_lag": round(self.max_lag, 4),
+            "in_flight": len(self.requests),
+            "blocks": list(self.blocks),
+            "slow_requests": list(self.slow_requests),
+        }
+
+
+loop_diagnostics = LoopDiagnostics()
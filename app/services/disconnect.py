@@ -0,0 +1,239 @@
+"""
+Bulk disconnect of provider connections, e.g. for offboarding or
+GDPR deletion.
+
+Users are handled in batches of `DISCONNECT_BATCH_SIZE`. For each batch
+the stored tokens of every provider are loaded with a few chunked
+selects, revoked at the providers' revocation endpoints concurrently
+(under per-provider concurrency and rate limits), and the `*_users`
+rows deleted and `users` connection flags reset with chunked bulk
+writes. Results are produced per user as soon as their batch is done.
+"""
+import asyncio
+import logging
+from typing import AsyncIterator
+
+import httpx
+import app.config as config
+from app.services.database import SupabaseRest, chunk_by_length, db, in_filter
+from app.services.health_check import RateLimiter, still_connected
+from app.services.http import HttpClients, http_clients
+from app.services.metrics import DISCONNECTS
+from app.services.providers import PROVIDERS, TOKEN_AUTH
+from app.services.status_events import StatusBroker, status_broker
+from app.services.token_refresh import TokenRefreshScheduler, token_refresh_scheduler
+from app.services.tokens import TokenService, token_service
+from app.services.user_status import UserStatusService, user_status_service
+from app.services.write_behind import WriteBehindQueue, write_behind_queue
+
+logger = logging.getLogger(__name__)
+
+# Per-provider results that leave the connection stored.
+KEPT = "failed"
+
+
+class DisconnectService:
+    """
+    Revokes and deletes provider connections.
+
+    Per provider and user the result is one of:
+        revoked: the provider accepted the revocation.
+        invalid: the provider rejected the token as already invalid.
+        deleted: the provider has no revocation endpoint (Outlook) or no
+            token was stored; only the row was deleted.
+        failed: revocation failed (network error, 5xx, rejected client
+            credentials); the row is kept so the call can be retried,
+            unless `force` is set.
+        not_connected: no row was stored.
+
+    A `users` flag is reset once none of the user's connections setting it
+    hold tokens any more. Cached tokens, statuses and scheduled refreshes
+    of the users are dropped and `/auth/status/stream` subscribers are
+    notified.
+    """
+
+    def __init__(
+            self,
+            clients: HttpClients = http_clients,
+            database: SupabaseRest = db,
+            tokens: TokenService = token_service,
+            scheduler: TokenRefreshScheduler = token_refresh_scheduler,
+            statuses: UserStatusService = user_status_service,
+            journal: WriteBehindQueue = write_behind_queue,
+            events: StatusBroker = status_broker):
+        self.clients = clients
+        self.db = database
+        self.tokens = tokens
+        self.scheduler = scheduler
+        self.statuses = statuses
+        self.journal = journal
+        self.events = events
+        self._limits = {name: asyncio.Semaphore(config.DISCONNECT_CONCURRENCY) for name in PROVIDERS}
+        self._rates = {name: RateLimiter(config.DISCONNECT_RATE) for name in PROVIDERS}
+
+    @staticmethod
+    def _chunks(user_ids: list[str]) -> list[list[str]]:
+        return chunk_by_length(user_ids, config.STATUS_BATCH_URL_BUDGET)
+
+    async def _load(self, provider: str, user_ids: list[str]) -> dict[str, dict]:
+        rows = await asyncio.gather(*(
+            self.db.select(
+                PROVIDERS[provider].table,
+                "user_id, access_token, refresh_token",
+                {"user_id": in_filter(chunk)}
+            )
+            for chunk in self._chunks(user_ids)
+        ))
+        return {str(row["user_id"]): row for chunk in rows for row in chunk}
+
+    async def _revoke(self, provider: str, row: dict) -> str:
+        descriptor = PROVIDERS[provider]
+        # revoking the refresh token ends the whole grant
+        token = row.get("refresh_token") or row.get("access_token")
+        if descriptor.revoke_url is None or not token:
+            return "deleted"
+
+        headers = dict(TOKEN_AUTH[provider][1]) if descriptor.basic_auth else {}
+        if descriptor.revoke_json:
+            headers.pop("Content-Type", None)
+            request = {"json": {"token": token}, "headers": {**headers, "Accept": "application/json"}}
+        else:
+            request = {"data": {"token": token}, "headers": headers}
+
+        async with self._limits[provider]:
+            await self._rates[provider].wait()
+            try:
+                resp = await self.clients.get(descriptor.group).post(descriptor.revoke_url, **request)
+            except httpx.HTTPError as e:
+                logger.warning("Revoking %s token of user %s failed: %s", provider, row["user_id"], e)
+                return KEPT
+        if resp.is_success:
+            return "revoked"
+        if resp.status_code == 400:
+            return "invalid"
+        logger.warning(
+            "Revoking %s token of user %s failed (%d): %s",
+            provider, row["user_id"], resp.status_code, resp.text[:200]
+        )
+        return KEPT
+
+    async def _disconnect_provider(self, provider: str, user_ids: list[str], force: bool) -> dict[str, str]:
+        rows = await self._load(provider, user_ids)
+        for user_id in rows:
+            self.tokens.forget(provider, user_id)
+            self.scheduler.unschedule(provider, user_id)
+
+        outcomes = dict(zip(rows, await asyncio.gather(*(self._revoke(provider, row) for row in rows.values()))))
+        deleted = [user_id for user_id, outcome in outcomes.items() if outcome != KEPT or force]
+        await asyncio.gather(*(
+            self.db.delete(PROVIDERS[provider].table, {"user_id": in_filter(chunk)})
+            for chunk in self._chunks(deleted)
+        ))
+        await self.journal.discard(provider, user_ids)
+
+        results = {}
+        for user_id in user_ids:
+            result = outcomes.get(user_id, "not_connected")
+            DISCONNECTS.inc(provider, result)
+            results[user_id] = result
+        return results
+
+    async def _reset_flags(
+            self,
+            providers: list[str],
+            results: dict[str, dict[str, str]],
+            force: bool) -> dict[str, list[str]]:
+        reset = {}
+        for flag in {PROVIDERS[provider].flag for provider in providers}:
+            group = [provider for provider in providers if PROVIDERS[provider].flag == flag]
+            candidates = [
+                user_id for user_id, outcomes in results.items()
+                if force or all(outcomes[provider] != KEPT for provider in group)
+            ]
+            if not candidates:
+                continue
+            connected = await still_connected(self.db, flag, providers, candidates)
+            reset[flag] = [user_id for user_id in candidates if user_id not in connected]
+            await asyncio.gather(*(
+                self.db.update("users", {flag: False}, {"id": in_filter(chunk)})
+                for chunk in self._chunks(reset[flag])
+            ))
+        return reset
+
+    async def disconnect_batch(
+            self,
+            user_ids: list[str],
+            providers: list[str] | None = None,
+            force: bool = False) -> list[dict]:
+        """
+        Disconnects one batch of users.
+
+        Args:
+            user_ids (list[str]): IDs of the users in the `users` table.
+            providers (list[str] | None): Providers to disconnect; all by default.
+            force (bool): Delete connections whose revocation failed too.
+
+        Returns:
+            list[dict]: Per user, {"user_id", "providers": {provider: result},
+            "ok"}, where `ok` is False if any connection was kept.
+        """
+        providers = list(providers or PROVIDERS)
+        by_provider = await asyncio.gather(*(
+            self._disconnect_provider(provider, user_ids, force) for provider in providers
+        ))
+        results = {
+            user_id: {provider: outcomes[user_id] for provider, outcomes in zip(providers, by_provider)}
+            for user_id in user_ids
+        }
+        reset = await self._reset_flags(providers, results, force)
+
+        for user_id in user_ids:
+            self.statuses.invalidate(user_id)
+        for flag, flag_user_ids in reset.items():
+            for user_id in flag_user_ids:
+                self.events.publish({
+                    "user_id": user_id,
+                    "provider": None,
+                    "flag": flag,
+                    "connected": False,
+                    "status": None,
+                })
+        return [
+            {
+                "user_id": user_id,
+                "providers": results[user_id],
+                "ok": KEPT not in results[user_id].values(),
+            }
+            for user_id in user_ids
+        ]
+
+    async def disconnect(
+            self,
+            user_ids: list[str],
+            providers: list[str] | None = None,
+            force: bool = False) -> AsyncIterator[dict]:
+        """
+        Disconnects users batch by batch, yielding each user's result as
+        soon as its batch is done.
+
+        A batch that fails on a database error yields an `error` result
+        for each of its users; later batches still run.
+
+        Args:
+            user_ids (list[str]): IDs of the users in the `users` table.
+            providers (list[str] | None): Providers to disconnect; all by default.
+            force (bool): Delete connections whose revocation failed too.
+        """
+        user_ids = list(dict.fromkeys(str(user_id) for user_id in user_ids))
+        for start in range(0, len(user_ids), config.DISCONNECT_BATCH_SIZE):
+            batch = user_ids[start:start + config.DISCONNECT_BATCH_SIZE]
+            try:
+                results = await self.disconnect_batch(batch, providers, force)
+            except Exception as e:
+                logger.exception("Disconnecting a batch of %d users failed", len(batch))
+                results = [{"user_id": user_id, "ok": False, "error": str(e)} for user_id in batch]
+            for result in results:
+                yield result
+
+
+disconnect_service = DisconnectService()
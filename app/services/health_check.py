@@ -0,0 +1,344 @@
+"""
+Bulk health check of stored provider connections.
+
+Streams every `*_users` row with keyset pagination, probes its refresh
+token under per-provider concurrency and rate limits, and writes each
+page's results back in bulk: the refreshed tokens of healthy connections
+with one `store_refreshed_tokens` call, and the cleared tokens and
+`users` connection flags of revoked ones with chunked updates. Only one
+page is held in memory at a time, and progress is checkpointed after
+every page so an interrupted run resumes where it stopped.
+
+Usage:
+    python -m app.services.health_check
+    python -m app.services.health_check --provider xero --restart
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+
+import httpx
+import app.config as config
+from app.services.database import DatabaseError, SupabaseRest, chunk_by_length, db, in_filter
+from app.services.leader import DatabaseLease
+from app.services.providers import PROVIDERS
+from app.services.status_events import StatusBroker, status_broker
+from app.services.token_refresh import TokenRefreshScheduler, token_refresh_scheduler
+from app.services.tokens import TokenRefreshError, TokenService, token_record, token_service
+from app.services.user_status import UserStatusService, user_status_service
+
+logger = logging.getLogger(__name__)
+
+
+async def still_connected(
+        database: SupabaseRest,
+        flag: str,
+        excluded: list[str],
+        user_ids: list[str]) -> set[str]:
+    """
+    Returns the users with a live connection setting the `users` flag
+    `flag` in a provider other than `excluded`.
+
+    Rows whose tokens were cleared after a revocation are kept by the
+    health check but do not count as connected.
+    """
+    peers = [p.table for p in PROVIDERS.values() if p.flag == flag and p.name not in excluded]
+    rows = await asyncio.gather(*(
+        database.select(table, "user_id", {"user_id": in_filter(chunk), "refresh_token": "not.is.null"})
+        for table in peers
+        for chunk in chunk_by_length(user_ids, config.STATUS_BATCH_URL_BUDGET)
+    ))
+    return {str(row["user_id"]) for chunk in rows for row in chunk}
+
+
+class RateLimiter:
+    """
+    Spaces calls evenly at `rate` per second.
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class ConnectionHealthCheck:
+    """
+    Finds connections whose refresh token no longer works.
+
+    A probe is a token refresh, so a healthy connection comes out with a
+    fresh (and, for Xero and QuickBooks, rotated) token pair. The pairs of
+    a page are stored together with the same compare-and-set as
+    `TokenService.store`; a pair whose stored refresh token was rotated
+    elsewhere in the meantime is dropped. Users whose refresh token is
+    rejected with `invalid_grant` have their stored tokens cleared and
+    lose their connection flag, unless another live connection of the
+    same kind (e.g. Outlook for a revoked Google account) is still stored;
+    the change is published as a status event.
+    """
+
+    def __init__(
+            self,
+            tokens: TokenService = token_service,
+            database: SupabaseRest = db,
+            statuses: UserStatusService = user_status_service,
+            scheduler: TokenRefreshScheduler = token_refresh_scheduler,
+            events: StatusBroker = status_broker,
+            checkpoint_path: str = config.HEALTH_CHECK_CHECKPOINT_PATH):
+        self.tokens = tokens
+        self.db = database
+        self.statuses = statuses
+        self.scheduler = scheduler
+        self.events = events
+        self.checkpoint_path = checkpoint_path
+        self.lease = DatabaseLease("health_check", config.HEALTH_CHECK_LEASE_TTL, database)
+        self.progress: dict = {}
+        self.task: asyncio.Task | None = None
+
+    def load_checkpoint(self) -> dict:
+        try:
+            with open(self.checkpoint_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_checkpoint(self):
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.progress, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    async def _probe(
+            self,
+            provider: str,
+            row: dict,
+            limit: asyncio.Semaphore,
+            rate: RateLimiter) -> tuple[str, dict | None]:
+        async with limit:
+            await rate.wait()
+            try:
+                tokens = await self.tokens.refresh(provider, row["refresh_token"])
+            except TokenRefreshError as e:
+                return ("revoked" if e.revoked else "error"), None
+            except Exception as e:
+                logger.warning("Probing %s for user %s failed: %s", provider, row["user_id"], e)
+                return "error", None
+        return "healthy", token_record(tokens, row["refresh_token"])
+
+    @staticmethod
+    def _chunks(user_ids: list[str]) -> list[list[str]]:
+        return chunk_by_length(user_ids, config.STATUS_BATCH_URL_BUDGET)
+
+    async def _store_healthy(self, provider: str, healthy: dict[str, tuple[dict, str]]):
+        """
+        Stores the refreshed tokens of a page's healthy connections.
+
+        Args:
+            provider (str): Provider name.
+            healthy (dict[str, tuple[dict, str]]): Per user id, the new
+                tokens and the refresh token they were obtained with.
+        """
+        if not healthy:
+            return
+        rows = [
+            {"user_id": user_id, **record, "previous_refresh_token": previous}
+            for user_id, (record, previous) in healthy.items()
+        ]
+        try:
+            stored = await self.db.rpc(
+                "store_refreshed_tokens",
+                {"p_table": PROVIDERS[provider].table, "p_rows": rows}
+            )
+        except (DatabaseError, httpx.HTTPError) as e:
+            # the old refresh tokens may be spent already; hand each pair to
+            # TokenService, which retries and keeps unsaved tokens in memory
+            logger.warning("Storing %d refreshed %s tokens failed (%s); storing them one by one",
+                           len(rows), provider, e)
+            await asyncio.gather(*(
+                self.tokens.store(provider, user_id, record, previous)
+                for user_id, (record, previous) in healthy.items()
+            ), return_exceptions=True)
+            return
+        stored = {str(user_id) for user_id in stored}
+        for user_id, (record, _) in healthy.items():
+            if user_id in stored:
+                self.tokens.remember(provider, user_id, record)
+            else:
+                # rotated elsewhere in the meantime; the stored tokens are current
+                self.tokens.forget(provider, user_id)
+
+    async def _write_back(self, provider: str, revoked: list[str]):
+        if not revoked:
+            return
+        for user_id in revoked:
+            self.tokens.forget(provider, user_id)
+            self.scheduler.unschedule(provider, user_id)
+        await asyncio.gather(*(
+            self.db.update(
+                PROVIDERS[provider].table,
+                {"access_token": None, "refresh_token": None, "expires_at": None},
+                {"user_id": in_filter(chunk)}
+            )
+            for chunk in self._chunks(revoked)
+        ))
+        connected = await still_connected(self.db, PROVIDERS[provider].flag, [provider], revoked)
+        disconnected = [user_id for user_id in revoked if user_id not in connected]
+        await asyncio.gather(*(
+            self.db.update("users", {PROVIDERS[provider].flag: False}, {"id": in_filter(chunk)})
+            for chunk in self._chunks(disconnected)
+        ))
+        flag = PROVIDERS[provider].flag
+        for user_id in disconnected:
+            self.statuses.invalidate(user_id)
+            self.events.publish({
+                "user_id": user_id,
+                "provider": provider,
+                "flag": flag,
+                "connected": False,
+                "status": None,
+            })
+
+    async def check_provider(self, provider: str):
+        """
+        Checks every stored connection of one provider, page by page,
+        starting after the checkpointed user.
+        """
+        state = self.progress["providers"].setdefault(provider, {
+            "last_user_id": None, "done": False,
+            "checked": 0, "healthy": 0, "revoked": 0, "error": 0,
+        })
+        if state["done"]:
+            return
+        limit = asyncio.Semaphore(config.HEALTH_CHECK_CONCURRENCY)
+        rate = RateLimiter(config.HEALTH_CHECK_RATE)
+        table = PROVIDERS[provider].table
+
+        while True:
+            filters = {
+                "refresh_token": "not.is.null",
+                "order": "user_id",
+                "limit": str(config.HEALTH_CHECK_PAGE_SIZE),
+            }
+            if state["last_user_id"] is not None:
+                filters["user_id"] = f"gt.{state['last_user_id']}"
+            rows = await self.db.select(table, "user_id, refresh_token", filters)
+
+            probes = await asyncio.gather(*(self._probe(provider, row, limit, rate) for row in rows))
+            healthy = {
+                str(row["user_id"]): (record, row["refresh_token"])
+                for row, (result, record) in zip(rows, probes) if result == "healthy"
+            }
+            revoked = [str(row["user_id"]) for row, (result, _) in zip(rows, probes) if result == "revoked"]
+            await self._store_healthy(provider, healthy)
+            await self._write_back(provider, revoked)
+
+            for result, _ in probes:
+                state[result] += 1
+            state["checked"] += len(rows)
+            if rows:
+                state["last_user_id"] = str(rows[-1]["user_id"])
+            state["done"] = len(rows) < config.HEALTH_CHECK_PAGE_SIZE
+            self.progress["updated_at"] = time.time()
+            await asyncio.to_thread(self._save_checkpoint)
+            if state["done"]:
+                return
+
+    async def run(self, providers: list[str] | None = None, restart: bool = False) -> dict:
+        """
+        Runs the health check, resuming the previous run unless
+        `restart` is set or that run has finished.
+
+        Only one run at a time across all instances: the run holds the
+        `health_check` lease in Supabase. The checkpoint is a local file,
+        so a run resumes only on the host that was interrupted.
+
+        Args:
+            providers (list[str] | None): Providers to check; all by default.
+            restart (bool): Ignore the checkpoint and start over.
+
+        Returns:
+            dict: Per-provider counts of checked, healthy, revoked and
+            errored connections.
+        """
+        if not await self.lease.try_acquire():
+            raise RuntimeError("A health check is already running")
+        return await self._run(providers, restart)
+
+    async def _run(self, providers: list[str] | None, restart: bool) -> dict:
+        async with self.lease.hold():
+            try:
+                providers = providers or list(PROVIDERS)
+                progress = {} if restart else self.load_checkpoint()
+                if progress.get("finished_at") or progress.get("scope") != providers:
+                    progress = {}
+                self.progress = progress or {
+                    "scope": providers, "started_at": time.time(), "finished_at": None, "providers": {}
+                }
+                self.progress["running"] = True
+                for provider in providers:
+                    await self.check_provider(provider)
+                self.progress["finished_at"] = time.time()
+                return self.progress
+            finally:
+                self.progress["running"] = False
+                await asyncio.to_thread(self._save_checkpoint)
+
+    async def start(self, providers: list[str] | None = None, restart: bool = False) -> bool:
+        """
+        Starts a run in the background unless one is in progress in this
+        or another process.
+
+        Returns:
+            bool: Whether a new run was started.
+        """
+        if self.task is not None and not self.task.done():
+            return False
+        if not await self.lease.try_acquire():
+            return False
+        self.task = asyncio.create_task(self._run(providers, restart))
+        self.task.add_done_callback(self._log_result)
+        return True
+
+    @staticmethod
+    def _log_result(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Health check failed: %s", task.exception())
+
+
+connection_health_check = ConnectionHealthCheck()
+
+
+async def main(argv: list[str] | None = None):
+    from app.services.http import http_clients
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--provider", action="append", choices=list(PROVIDERS),
+                        help="Provider to check; repeat for several (default: all).")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and start over.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    await http_clients.start()
+    # so the workers' status caches and streams hear about revoked connections
+    await status_broker.start()
+    try:
+        progress = await connection_health_check.run(args.provider, args.restart)
+    finally:
+        await status_broker.stop()
+        await http_clients.close()
+    print(json.dumps(progress["providers"], indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,146 @@
+import asyncio
+import importlib.util
+import time
+
+import httpx
+import app.config as config
+from app.services.metrics import (
+    CIRCUIT_OPEN,
+    POOL_CONNECTIONS,
+    UPSTREAM_DURATION,
+    UPSTREAM_RESPONSES,
+    registry
+)
+from app.services.providers import HOST_GROUPS
+from app.services.resilience import CircuitBreaker, ResilientTransport
+
+
+class HttpClients:
+    """
+    Holds one pooled `httpx.AsyncClient` per upstream host group.
+
+    Clients are created in the FastAPI lifespan (`start`) and closed on
+    shutdown (`close`), so connections, DNS lookups and TLS sessions are
+    reused across requests instead of being rebuilt for every call.
+
+    Every client has the group's connect/read/total timeouts from its
+    `HostGroup` in `HOST_GROUPS` and sends through a `ResilientTransport`, which
+    retries idempotent requests and keeps a circuit breaker per host.
+    """
+
+    def __init__(self):
+        self._clients: dict[str, httpx.AsyncClient] = {}
+        # host -> breaker, shared by every group that calls the host
+        self.breakers: dict[str, CircuitBreaker] = {}
+
+    def _build_client(self, group: str) -> httpx.AsyncClient:
+        limits = httpx.Limits(
+            max_connections=config.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=config.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY,
+        )
+        host = HOST_GROUPS[group]
+        http2 = (
+            config.HTTP2_ENABLED
+            and host.http2
+            and importlib.util.find_spec("h2") is not None
+        )
+        connect, read, total = host.timeouts
+        transport = ResilientTransport(
+            httpx.AsyncHTTPTransport(limits=limits, http2=http2),
+            group,
+            total,
+            self.breakers
+        )
+        return httpx.AsyncClient(
+            transport=transport,
+            timeout=httpx.Timeout(read, connect=connect, pool=connect),
+            event_hooks={
+                "request": [self._on_request],
+                "response": [self._response_hook(group)],
+            }
+        )
+
+    @staticmethod
+    async def _on_request(request: httpx.Request):
+        request.extensions["started"] = time.perf_counter()
+
+    @staticmethod
+    def _response_hook(group: str):
+        async def _on_response(response: httpx.Response):
+            request = response.request
+            host = request.url.host
+            started = request.extensions.get("started")
+            if started is not None:
+                UPSTREAM_DURATION.observe(group, host, value=time.perf_counter() - started)
+            UPSTREAM_RESPONSES.inc(group, host, response.status_code)
+        return _on_response
+
+    def pool_stats(self) -> dict[str, dict[str, int]]:
+        """
+        Returns active and idle connection counts per host group.
+        """
+        stats = {}
+        for group, client in self._clients.items():
+            transport = getattr(client, "_transport", None)
+            pool = getattr(getattr(transport, "transport", transport), "_pool", None)
+            connections = getattr(pool, "connections", [])
+            idle = sum(1 for connection in connections if connection.is_idle())
+            stats[group] = {"active": len(connections) - idle, "idle": idle}
+        return stats
+
+    async def start(self):
+        """
+        Creates the pooled clients and optionally warms up connections.
+        """
+        for group in HOST_GROUPS:
+            if group not in self._clients:
+                self._clients[group] = self._build_client(group)
+        if config.HTTP_WARMUP:
+            await self.warm_up()
+
+    async def warm_up(self):
+        """
+        Opens a connection to every host group so the first real request
+        skips DNS, TCP and TLS setup. Failures are ignored.
+        """
+        async def _touch(group: str, url: str):
+            try:
+                await self._clients[group].head(url, timeout=config.HTTP_WARMUP_TIMEOUT)
+            except httpx.HTTPError:
+                pass
+
+        await asyncio.gather(*(
+            _touch(group, host.warmup_url) for group, host in HOST_GROUPS.items() if host.warmup_url
+        ))
+
+    async def close(self):
+        """
+        Closes every pooled client and releases its connections.
+        """
+        clients, self._clients = self._clients, {}
+        await asyncio.gather(*(client.aclose() for client in clients.values()))
+
+    def get(self, group: str) -> httpx.AsyncClient:
+        """
+        Returns the pooled client for a host group.
+
+        A client is created on demand if the lifespan has not run yet
+        (e.g. when a service is used outside the application).
+        """
+        client = self._clients.get(group)
+        if client is None:
+            client = self._clients[group] = self._build_client(group)
+        return client
+
+
+http_clients = HttpClients()
+
+
+@registry.collector
+def _collect_pool_stats():
+    for group, stats in http_clients.pool_stats().items():
+        for state, count in stats.items():
+            POOL_CONNECTIONS.set(group, state, value=count)
+    for host, breaker in http_clients.breakers.items():
+        CIRCUIT_OPEN.set(host, value=int(breaker.state != CircuitBreaker.CLOSED))
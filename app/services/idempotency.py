@@ -0,0 +1,69 @@
+import asyncio
+import hashlib
+from typing import Any, Awaitable, Callable
+
+from app.config import CALLBACK_DEDUP_TTL, CALLBACK_DEDUP_SIZE
+from app.services.cache import TTLCache
+
+
+class CallbackDeduplicator:
+    """
+    Runs each OAuth callback at most once per authorization code.
+
+    Concurrent duplicates of a callback (double redirects, retries,
+    prefetchers) await the exchange already in flight instead of starting
+    their own, and completed callbacks are remembered for a short TTL so
+    repeats return the first result immediately. Failures are not
+    remembered.
+    """
+
+    def __init__(self, ttl: float = CALLBACK_DEDUP_TTL, maxsize: int = CALLBACK_DEDUP_SIZE):
+        self._inflight: dict[tuple[str, str], asyncio.Task] = {}
+        self._completed = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    @staticmethod
+    def _key(provider: str, code: str, state: str) -> tuple[str, str]:
+        digest = hashlib.sha256(f"{code}\0{state}".encode()).hexdigest()
+        return provider, digest
+
+    async def run(
+            self,
+            provider: str,
+            code: str,
+            state: str,
+            handler: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Runs `handler` unless the same callback is running or just completed.
+
+        Args:
+            provider (str): Provider name.
+            code (str): Authorization code from the callback.
+            state (str): State from the callback.
+            handler (Callable): Coroutine factory performing the callback.
+
+        Returns:
+            Any: The handler's result, possibly from an earlier run.
+        """
+        key = self._key(provider, code, state)
+        completed = self._completed.get(key)
+        if completed is not None:
+            return completed[0]
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(handler())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task)
+
+    def _finish(self, key: tuple[str, str], task: asyncio.Task):
+        self._inflight.pop(key, None)
+        if not task.cancelled() and task.exception() is None:
+            # wrapped so that a None result still counts as a cache hit
+            self._completed.set(key, (task.result(),))
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._inflight), **self._completed.stats()}
+
+
+callback_deduplicator = CallbackDeduplicator()
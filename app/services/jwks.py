@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import time
+
+import jwt
+
+import app.config as config
+from app.services.http import HttpClients, http_clients
+from app.services.providers import PROVIDERS
+
+logger = logging.getLogger(__name__)
+
+
+# Providers whose id_tokens are verified locally
+OPENID_PROVIDERS = {name: provider for name, provider in PROVIDERS.items() if provider.discovery_url}
+
+
+class IdTokenError(Exception):
+    """
+    Raised when an id_token cannot be verified.
+    """
+
+
+class JwksCache:
+    """
+    Verifies OpenID `id_token`s against each provider's published keys.
+
+    Discovery documents and key sets are cached for `JWKS_CACHE_TTL`.
+    A token signed with an unknown `kid` triggers one early key-set
+    reload (at most every `JWKS_MIN_REFRESH_INTERVAL` seconds), which
+    picks up key rotations without letting bad tokens hammer the provider.
+    """
+
+    def __init__(self, clients: HttpClients = http_clients):
+        self.clients = clients
+        # provider -> (fetched_at, issuer, {kid: key})
+        self._keys: dict[str, tuple[float, str, dict]] = {}
+        self._locks = {provider: asyncio.Lock() for provider in OPENID_PROVIDERS}
+
+    async def _fetch(self, provider: str) -> tuple[float, str, dict]:
+        openid = OPENID_PROVIDERS[provider]
+        client = self.clients.get(openid.group)
+        discovery_resp = await client.get(openid.discovery_url)
+        discovery_resp.raise_for_status()
+        discovery = discovery_resp.json()
+        jwks_resp = await client.get(discovery["jwks_uri"])
+        jwks_resp.raise_for_status()
+        keys = {}
+        for jwk in jwks_resp.json().get("keys", []):
+            try:
+                keys[jwk.get("kid")] = jwt.PyJWK(jwk)
+            except jwt.PyJWTError:
+                continue
+        return time.monotonic(), discovery["issuer"], keys
+
+    async def _key_set(self, provider: str, kid: str | None) -> tuple[str, dict]:
+        entry = self._keys.get(provider)
+        now = time.monotonic()
+        if entry is not None:
+            fetched_at, issuer, keys = entry
+            fresh = now - fetched_at < config.JWKS_CACHE_TTL
+            may_reload = now - fetched_at >= config.JWKS_MIN_REFRESH_INTERVAL
+            if fresh and (kid in keys or not may_reload):
+                return issuer, keys
+
+        async with self._locks[provider]:
+            # another request may have reloaded the keys while we waited
+            if self._keys.get(provider) is entry:
+                self._keys[provider] = await self._fetch(provider)
+            _, issuer, keys = self._keys[provider]
+            return issuer, keys
+
+    async def warm_up(self):
+        """
+        Loads every provider's keys ahead of the first callback.
+        Failures are logged and retried lazily on first use.
+        """
+        async def _load(provider: str):
+            try:
+                await self._key_set(provider, None)
+            except Exception as e:
+                logger.warning("Could not preload %s signing keys: %s", provider, e)
+
+        await asyncio.gather(*(_load(provider) for provider in OPENID_PROVIDERS))
+
+    async def verify(self, provider: str, id_token: str) -> dict:
+        """
+        Verifies an id_token's signature, audience, issuer and expiry.
+
+        Args:
+            provider (str): Provider name, a key of `OPENID_PROVIDERS`.
+            id_token (str): Token from the provider's token response.
+
+        Returns:
+            dict: Verified claims.
+        """
+        openid = OPENID_PROVIDERS[provider]
+        try:
+            kid = jwt.get_unverified_header(id_token).get("kid")
+            issuer, keys = await self._key_set(provider, kid)
+            key = keys.get(kid)
+            if key is None:
+                raise IdTokenError(f"Unknown signing key {kid!r}")
+            return jwt.decode(
+                id_token,
+                key.key,
+                algorithms=[key.algorithm_name],
+                audience=openid.client_id,
+                issuer=[issuer, *openid.issuers],
+                leeway=config.JWKS_CLOCK_LEEWAY
+            )
+        except IdTokenError:
+            raise
+        except Exception as e:
+            raise IdTokenError(str(e)) from e
+
+
+jwks_cache = JwksCache()
@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable
+
+from app.services.database import SupabaseRest, db
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseLease:
+    """
+    Elects one process across all instances to run a singleton job.
+
+    Every process races for a lease row in Supabase (see
+    `app/services/sql/leader_lease.sql`) that expires after `ttl`
+    seconds. The holder renews it every `ttl / 3` seconds; followers try
+    to take it at the same interval and take over once the leader stops
+    renewing. A leader that cannot renew before its lease runs out
+    resigns, so the job never keeps running in two places.
+    """
+
+    def __init__(self, name: str, ttl: float, database: SupabaseRest = db):
+        self.name = name
+        self.ttl = ttl
+        self.db = database
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._leader = False
+        self._renewed_at = 0.0
+        self._task: asyncio.Task | None = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self._leader
+
+    async def try_acquire(self) -> bool:
+        """
+        Takes or renews the lease.
+        """
+        acquired = await self.db.rpc("try_acquire_lease", {
+            "p_name": self.name,
+            "p_holder": self.holder,
+            "p_ttl_seconds": self.ttl
+        })
+        if acquired:
+            self._renewed_at = time.monotonic()
+        return bool(acquired)
+
+    @asynccontextmanager
+    async def hold(self):
+        """
+        Keeps a lease taken with `try_acquire` for the duration of a
+        one-off job and releases it afterwards.
+
+        The lease is renewed in the background. If it cannot be renewed
+        before it runs out, the job (the task entering the context) is
+        cancelled, so it never runs in two places.
+        """
+        job = asyncio.current_task()
+
+        async def renew():
+            while True:
+                await asyncio.sleep(self.ttl / 3)
+                try:
+                    if await self.try_acquire():
+                        continue
+                except Exception as e:
+                    logger.warning("Renewing lease %s failed: %s", self.name, e)
+                    if time.monotonic() - self._renewed_at < self.ttl * 2 / 3:
+                        continue
+                logger.warning("%s lost the lease for %s, stopping the job", self.holder, self.name)
+                job.cancel()
+                return
+
+        renewer = asyncio.create_task(renew())
+        try:
+            yield
+        finally:
+            renewer.cancel()
+            await asyncio.gather(renewer, return_exceptions=True)
+            await self._release()
+
+    async def _release(self):
+        try:
+            await self.db.rpc("release_lease", {"p_name": self.name, "p_holder": self.holder})
+        except Exception as e:
+            logger.warning("Releasing lease %s failed: %s", self.name, e)
+
+    async def _run(self, on_elected: Callable[[], Awaitable[None]], on_resign: Callable[[], Awaitable[None]]):
+        while True:
+            try:
+                acquired = await self.try_acquire()
+            except Exception as e:
+                logger.warning("Renewing lease %s failed: %s", self.name, e)
+                # keep leading only while the last renewal is still valid
+                acquired = self._leader and time.monotonic() - self._renewed_at < self.ttl * 2 / 3
+            if acquired and not self._leader:
+                logger.info("%s is the leader for %s", self.holder, self.name)
+                self._leader = True
+                await on_elected()
+            elif not acquired and self._leader:
+                logger.warning("%s lost the lease for %s", self.holder, self.name)
+                self._leader = False
+                await on_resign()
+            await asyncio.sleep(self.ttl / 3)
+
+    async def start(self, on_elected: Callable[[], Awaitable[None]], on_resign: Callable[[], Awaitable[None]]):
+        """
+        Contends for the lease in the background, running `on_elected`
+        on winning it and `on_resign` on losing it.
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(on_elected, on_resign))
+
+    async def stop(self, on_resign: Callable[[], Awaitable[None]]):
+        """
+        Stops contending; a leader runs `on_resign` and then releases the
+        lease so another instance takes over without waiting for expiry.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._leader:
+            await on_resign()
+            self._leader = False
+            await self._release()
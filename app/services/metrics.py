@@ -0,0 +1,498 @@
+import asyncio
+import bisect
+import copy
+import glob
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterable
+
+import app.config as config
+
+try:
+    import fcntl
+except ImportError:  # Windows: snapshots are read and folded without a lock
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def snapshot(self) -> list:
+        """
+        Returns the samples as JSON-serializable [labels, value] pairs.
+        """
+        return [[list(labels), value] for labels, value in self._values.items()]
+
+    def merged(self, snapshots: list[list]) -> "_Metric":
+        """
+        Returns a copy holding the combined samples of several snapshots.
+        """
+        metric = copy.copy(self)
+        metric._values = {}
+        for samples in snapshots:
+            for labels, value in samples:
+                metric._merge(tuple(labels), value)
+        return metric
+
+    def _merge(self, labels: tuple, value):
+        self._values[labels] = self._values.get(labels, 0.0) + value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def set(self, *labels, value: float):
+        """
+        Sets the running total, for collectors mirroring a count kept elsewhere.
+        """
+        self._values[labels] = value
+
+    def render(self) -> list[str]:
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+            for labels, value in self._values.items()
+        ]
+
+
+class Gauge(_Metric):
+    """
+    A value that goes up and down. Across worker processes the live
+    workers' values are summed, or with `multiprocess_mode="max"` the
+    largest is reported.
+    """
+    kind = "gauge"
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            labelnames: Iterable[str] = (),
+            multiprocess_mode: str = "sum"):
+        super().__init__(name, documentation, labelnames)
+        self.multiprocess_mode = multiprocess_mode
+        self._values: dict[tuple, float] = {}
+
+    def _merge(self, labels: tuple, value):
+        if self.multiprocess_mode == "max" and labels in self._values:
+            self._values[labels] = max(self._values[labels], value)
+        else:
+            super()._merge(labels, value)
+
+    def set(self, *labels, value: float):
+        self._values[labels] = value
+
+    def inc(self, *labels, amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def dec(self, *labels, amount: float = 1.0):
+        self.inc(*labels, amount=-amount)
+
+    def render(self) -> list[str]:
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+            for labels, value in self._values.items()
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            labelnames: Iterable[str] = (),
+            buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts..., +Inf count], sum
+        self._values: dict[tuple, tuple[list[int], list[float]]] = {}
+
+    def observe(self, *labels, value: float):
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+        counts, total = entry
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def snapshot(self) -> list:
+        return [[list(labels), [counts, total[0]]] for labels, (counts, total) in self._values.items()]
+
+    def _merge(self, labels: tuple, value):
+        counts, total = value
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+        for i, count in enumerate(counts[:len(entry[0])]):
+            entry[0][i] += count
+        entry[1][0] += total
+
+    @contextmanager
+    def time(self, *labels):
+        """
+        Observes the duration of the wrapped block in seconds.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(*labels, value=time.perf_counter() - started)
+
+    def render(self) -> list[str]:
+        lines = self.header()
+        for labels, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total[0]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """
+    Holds metrics and renders them in the Prometheus text format.
+
+    Collectors are callbacks run at scrape (and snapshot) time, used to
+    publish values that live elsewhere (pool and cache statistics).
+    """
+
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+        self._collectors: list[Callable[[], None]] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, func: Callable[[], None]):
+        self._collectors.append(func)
+        return func
+
+    def collect(self):
+        for collect in self._collectors:
+            collect()
+
+    def snapshot(self) -> dict:
+        """
+        Returns the current samples of every metric, keyed by metric name.
+        """
+        self.collect()
+        return {metric.name: metric.snapshot() for metric in self._metrics}
+
+    def gauge_names(self) -> set[str]:
+        return {metric.name for metric in self._metrics if metric.kind == "gauge"}
+
+    def merge(self, snapshots: list[dict]) -> dict:
+        """
+        Combines the counters and histograms of several snapshots into one.
+        """
+        return {
+            metric.name: metric.merged([snapshot.get(metric.name, []) for snapshot in snapshots]).snapshot()
+            for metric in self._metrics
+            if metric.kind != "gauge"
+        }
+
+    def render(self, snapshots: list[dict] | None = None) -> str:
+        """
+        Renders this process's metrics, or the merge of `snapshots`.
+        """
+        if snapshots is None:
+            self.collect()
+            metrics = self._metrics
+        else:
+            metrics = [
+                metric.merged([snapshot.get(metric.name, []) for snapshot in snapshots])
+                for metric in self._metrics
+            ]
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def clear_multiprocess_dir(directory: str):
+    """
+    Removes the snapshots of a previous run; called by `app.server`
+    before workers start.
+    """
+    for path in glob.glob(os.path.join(directory, "*.json")):
+        os.remove(path)
+
+
+# counters and histograms of exited workers, folded into one file
+ARCHIVE = "exited.json"
+
+
+class MultiprocessMetrics:
+    """
+    Aggregates metrics across the worker processes of one instance.
+
+    Every worker writes a snapshot of its registry to `<directory>/<pid>.json`
+    every `interval` seconds and at shutdown. A scrape, whichever worker
+    serves it, merges its own fresh snapshot with the others: counters and
+    histograms are summed, including those of exited workers, and gauges
+    are combined over live workers only. Without a directory only this
+    process's metrics are rendered.
+
+    On start, a worker folds the snapshots of exited workers into
+    `ARCHIVE` and deletes them, so restarts under any launcher leave one
+    file per live worker plus the archive.
+    """
+
+    def __init__(self, registry: Registry, directory: str, interval: float):
+        self.registry = registry
+        self.directory = directory
+        self.interval = interval
+        self._task: asyncio.Task | None = None
+
+    def _path(self, pid: int) -> str:
+        return os.path.join(self.directory, f"{pid}.json")
+
+    def _write(self, snapshot: dict):
+        path = self._path(os.getpid())
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(snapshot, f)
+        os.replace(f"{path}.tmp", path)
+
+    @contextmanager
+    def _locked(self, exclusive: bool):
+        """
+        Keeps scrapes from reading while exited workers are being folded.
+        """
+        if fcntl is None:
+            yield
+            return
+        fd = os.open(os.path.join(self.directory, ".lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def _load(path: str) -> dict | None:
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _snapshots(self) -> list[tuple[int | None, str]]:
+        """
+        Lists the snapshot files with their worker's pid; None for the archive.
+        """
+        snapshots = []
+        for path in glob.glob(os.path.join(self.directory, "*.json")):
+            name = os.path.basename(path)
+            snapshots.append((None if name == ARCHIVE else int(name[:-len(".json")]), path))
+        return snapshots
+
+    def _read_others(self) -> list[dict]:
+        gauges = self.registry.gauge_names()
+        snapshots = []
+        with self._locked(exclusive=False):
+            for pid, path in self._snapshots():
+                if pid == os.getpid():
+                    continue
+                snapshot = self._load(path)
+                if snapshot is None:
+                    continue
+                if pid is not None and not _alive(pid):
+                    snapshot = {name: samples for name, samples in snapshot.items() if name not in gauges}
+                snapshots.append(snapshot)
+        return snapshots
+
+    def _fold_exited(self):
+        """
+        Merges the snapshots of exited workers into the archive and
+        deletes them.
+        """
+        with self._locked(exclusive=True):
+            exited = [
+                path for pid, path in self._snapshots()
+                if pid is not None and pid != os.getpid() and not _alive(pid)
+            ]
+            if not exited:
+                return
+            archive = os.path.join(self.directory, ARCHIVE)
+            snapshots = [self._load(path) for path in [archive, *exited]]
+            merged = self.registry.merge([snapshot for snapshot in snapshots if snapshot is not None])
+            with open(f"{archive}.tmp", "w") as f:
+                json.dump(merged, f)
+            os.replace(f"{archive}.tmp", archive)
+            for path in exited:
+                os.remove(path)
+
+    async def write(self):
+        await asyncio.to_thread(self._write, self.registry.snapshot())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.write()
+            except OSError as e:
+                logger.warning("Writing the metrics snapshot failed: %s", e)
+
+    async def start(self):
+        if not self.directory or self._task is not None:
+            return
+        await asyncio.to_thread(os.makedirs, self.directory, exist_ok=True)
+        try:
+            await asyncio.to_thread(self._fold_exited)
+        except OSError as e:
+            logger.warning("Folding metrics snapshots of exited workers failed: %s", e)
+        await self.write()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        # keeps this worker's counters in the instance totals
+        await self.write()
+
+    async def render(self) -> str:
+        """
+        Renders the metrics of every worker of this instance.
+        """
+        if self._task is None:
+            return self.registry.render()
+        own = self.registry.snapshot()
+        others = await asyncio.to_thread(self._read_others)
+        return self.registry.render([own, *others])
+
+
+registry = Registry()
+
+REQUEST_DURATION = registry.register(Histogram(
+    "http_request_duration_seconds",
+    "Latency of handled HTTP requests.",
+    ("method", "route", "status")
+))
+REQUESTS_IN_FLIGHT = registry.register(Gauge(
+    "http_requests_in_flight",
+    "HTTP requests currently being handled.",
+    ("route",)
+))
+OAUTH_STAGE_DURATION = registry.register(Histogram(
+    "oauth_stage_duration_seconds",
+    "Latency of OAuth callback stages (token_exchange, profile_fetch, db_write).",
+    ("provider", "stage")
+))
+DB_QUERY_DURATION = registry.register(Histogram(
+    "db_query_duration_seconds",
+    "Latency of Supabase PostgREST calls.",
+    ("operation", "table")
+))
+UPSTREAM_DURATION = registry.register(Histogram(
+    "upstream_request_duration_seconds",
+    "Latency of outbound HTTP requests.",
+    ("group", "host")
+))
+UPSTREAM_RESPONSES = registry.register(Counter(
+    "upstream_responses_total",
+    "Outbound HTTP responses by status code.",
+    ("group", "host", "status")
+))
+UPSTREAM_RETRIES = registry.register(Counter(
+    "upstream_retries_total",
+    "Outbound requests sent again after a failure.",
+    ("group", "host")
+))
+CIRCUIT_OPEN = registry.register(Gauge(
+    "upstream_circuit_open",
+    "1 while a host's circuit breaker rejects requests in any worker.",
+    ("host",),
+    multiprocess_mode="max"
+))
+POOL_CONNECTIONS = registry.register(Gauge(
+    "http_pool_connections",
+    "Connections held by the pooled upstream HTTP clients.",
+    ("group", "state")
+))
+CACHE_SIZE = registry.register(Gauge("cache_entries", "Entries held by in-process caches.", ("cache",)))
+CACHE_HITS = registry.register(Counter("cache_hits_total", "Lookups served by in-process caches.", ("cache",)))
+CACHE_MISSES = registry.register(Counter("cache_misses_total", "Lookups missed by in-process caches.", ("cache",)))
+REQUESTS_REJECTED = registry.register(Counter(
+    "http_requests_rejected_total",
+    "Requests shed by admission control.",
+    ("reason",)
+))
+LOOP_LAG = registry.register(Histogram(
+    "event_loop_lag_seconds",
+    "Delay of the diagnostics heartbeat beyond its scheduled wake-up.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+))
+LOOP_BLOCKS = registry.register(Counter(
+    "event_loop_blocks_total",
+    "Event loop stalls longer than DIAGNOSTICS_BLOCK_THRESHOLD."
+))
+DISCONNECTS = registry.register(Counter(
+    "provider_disconnects_total",
+    "Provider connections handled by bulk disconnect, by revocation result.",
+    ("provider", "result")
+))
+STATUS_STREAMS = registry.register(Gauge("status_streams_open", "Open /auth/status/stream connections."))
+
+multiprocess_metrics = MultiprocessMetrics(registry, config.METRICS_MULTIPROC_DIR, config.METRICS_WRITE_INTERVAL)
+
+
+def stage(provider: str, name: str):
+    """
+    Times one stage of an OAuth callback.
+
+    Usage:
+        with stage("google", "token_exchange"):
+            ...
+    """
+    return OAUTH_STAGE_DURATION.time(provider, name)
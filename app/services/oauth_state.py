@@ -0,0 +1,116 @@
+import secrets
+import time
+from typing import NamedTuple
+
+import jwt
+
+import app.config as config
+
+STATE_PURPOSE = "oauth_state"
+
+
+class OAuthStateError(Exception):
+    """
+    Raised when an OAuth state token is malformed, forged, expired
+    or not bound to the caller's browser.
+    """
+
+
+class OAuthUser(NamedTuple):
+    """
+    The user an OAuth flow was started for.
+    """
+    user_id: str
+    user_hash: str
+
+    @property
+    def state(self) -> str:
+        """
+        The `user_id/user_hash` form the frontend expects back.
+        """
+        return f"{self.user_id}/{self.user_hash}"
+
+
+def cookie_name(provider: str) -> str:
+    return f"oauth_nonce_{provider}"
+
+
+class OAuthStateSigner:
+    """
+    Issues and verifies signed, expiring OAuth `state` tokens.
+
+    A token is a JWT signed with `JWT_SECRET` carrying the user, a random
+    nonce and an expiry. The nonce is also set as a cookie on the login
+    redirect; the callback accepts the state only if the cookie matches,
+    which stops cross-site request forgery of the callback. Verification
+    is local, so callbacks need no database lookup to trust the state.
+    """
+
+    def __init__(self, secret: str | None, algorithm: str = config.JWT_ALGORITHM):
+        if not secret:
+            # a per-process key would reject callbacks served by another
+            # worker or instance than the one that issued the state
+            raise RuntimeError("JWT_SECRET must be set to sign OAuth state tokens")
+        self.secret = secret
+        self.algorithm = algorithm
+
+    def issue(self, user: OAuthUser) -> tuple[str, str]:
+        """
+        Creates a state token for a verified user.
+
+        Returns:
+            tuple[str, str]: (state token, nonce)
+        """
+        nonce = secrets.token_urlsafe(16)
+        now = int(time.time())
+        token = jwt.encode({
+            "sub": user.user_id,
+            "hash": user.user_hash,
+            "nonce": nonce,
+            "purpose": STATE_PURPOSE,
+            "iat": now,
+            "exp": now + int(config.OAUTH_STATE_TTL)
+        }, self.secret, algorithm=self.algorithm)
+        return token, nonce
+
+    def verify(
+            self,
+            token: str,
+            nonce: str | None = None,
+            bind: bool = config.OAUTH_STATE_BIND_COOKIE) -> OAuthUser:
+        """
+        Validates a state token.
+
+        Args:
+            token (str): State token from the query string.
+            nonce (str | None): Nonce cookie sent by the browser.
+            bind (bool): Require `nonce` to match the token's nonce.
+
+        Returns:
+            OAuthUser: The user the flow was started for.
+        """
+        try:
+            claims = jwt.decode(
+                token,
+                self.secret,
+                algorithms=[self.algorithm],
+                options={"require": ["sub", "exp", "nonce"]}
+            )
+        except jwt.PyJWTError as e:
+            raise OAuthStateError(str(e)) from e
+        if claims.get("purpose") != STATE_PURPOSE:
+            raise OAuthStateError("Not an OAuth state token")
+        if bind and (
+                not nonce or not secrets.compare_digest(nonce, claims["nonce"])):
+            raise OAuthStateError("State is not bound to this browser")
+        return OAuthUser(claims["sub"], claims.get("hash", ""))
+
+    @staticmethod
+    def is_signed(state: str) -> bool:
+        """
+        Tells a signed state token apart from a raw `user_id/user_hash` state.
+        """
+        return state.count(".") == 2 and "/" not in state
+
+
+oauth_state = OAuthStateSigner(config.JWT_SECRET)
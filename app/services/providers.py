@@ -0,0 +1,337 @@
+"""
+Declarative descriptions of the OAuth providers.
+
+Everything provider-specific lives in `PROVIDERS`: endpoints, scopes,
+client authentication, the HTTP host group and its timeouts, follow-up
+fetches after the code exchange, how id_token claims and API responses
+map onto the provider's Supabase table and `users` flag, the callback's
+query parameters, and where the browser lands afterwards. The routers,
+the callback engine in `OAuthService`, token refresh, id_token
+verification, the HTTP client pools and the SQL functions (which take
+the table and flag from here) are generic, so adding a provider is a
+new entry.
+"""
+import base64
+from typing import Callable, NamedTuple
+from urllib.parse import quote, urlencode
+
+import app.config as config
+
+
+class HostGroup(NamedTuple):
+    """
+    Upstream hosts sharing one pooled HTTP client.
+
+    Attributes:
+        name (str): Group name, used for the client and in metrics.
+        warmup_url (str | None): Base URL opened by the connection warm-up.
+        timeouts (tuple[float, float, float]): (connect, read, total)
+            timeouts in seconds; `total` bounds a call including retries.
+        http2 (bool): Whether the hosts negotiate HTTP/2.
+    """
+    name: str
+    warmup_url: str | None
+    timeouts: tuple[float, float, float]
+    http2: bool = False
+
+
+class FollowUp(NamedTuple):
+    """
+    A request made with the fresh access token after the code exchange.
+
+    Attributes:
+        name (str): Key of the decoded response in the fetch results.
+        url (str): URL requested with `Authorization: Bearer <access_token>`.
+        required (bool): Whether a failure aborts the callback. Optional
+            follow-ups resolve to None on failure.
+    """
+    name: str
+    url: str
+    required: bool = True
+
+
+class Provider(NamedTuple):
+    """
+    One OAuth provider.
+
+    Attributes:
+        name (str): Provider name used in routes, metrics and tables.
+        title (str): Human-readable name for docs.
+        host (HostGroup): HTTP client host group of the provider's
+            endpoints; its name is `group`.
+        table (str): Supabase table holding the connection.
+        flag (str): `users` column set when the provider is connected.
+        authorize_url (str): Consent page URL.
+        client_id (str): OAuth client ID.
+        client_secret (str): OAuth client secret.
+        redirect_uri (str): Registered callback URL.
+        scopes (tuple[str, ...]): Requested scopes.
+        token_url (str): Token endpoint URL.
+        profile (Callable[[dict, dict], dict]): Builds the provider
+            columns of the connection row from the follow-up results
+            and the callback's extra query parameters. A `tenants` key
+            is not a column: it is synced to `xero_tenants` instead.
+        frontend_url (str): Where the browser lands after connecting.
+        error_url (str): Where the browser lands when the provider or
+            Supabase is unavailable during the callback.
+        authorize_params (dict): Extra authorize URL parameters.
+        basic_auth (bool): Send client credentials as HTTP Basic auth
+            instead of in the form body.
+        token_params (dict): Extra form fields for token requests.
+        follow_ups (tuple[FollowUp, ...]): Requests run concurrently
+            after the code exchange.
+        id_token_profile (Callable[[dict], dict] | None): Builds the
+            `user_info` follow-up result from verified id_token claims,
+            which skips the userinfo request.
+        discovery_url (str | None): OpenID discovery document for
+            id_token verification.
+        issuers (tuple[str, ...]): Accepted `iss` values in addition to
+            the discovery document's issuer.
+        store_id_token (bool): Keep the raw id_token in the row.
+        callback_params (tuple[str, ...]): Required query parameters of
+            the callback besides `code` and `state`.
+        revoke_url (str | None): Token revocation endpoint; None when the
+            provider has none and disconnecting only deletes the row.
+        revoke_json (bool): Send the revocation request as JSON instead
+            of a form.
+    """
+    name: str
+    title: str
+    host: HostGroup
+    table: str
+    flag: str
+    authorize_url: str
+    client_id: str
+    client_secret: str
+    redirect_uri: str
+    scopes: tuple[str, ...]
+    token_url: str
+    profile: Callable[[dict, dict], dict]
+    frontend_url: str
+    error_url: str
+    authorize_params: dict = {}
+    basic_auth: bool = False
+    token_params: dict = {}
+    follow_ups: tuple[FollowUp, ...] = ()
+    id_token_profile: Callable[[dict], dict] | None = None
+    discovery_url: str | None = None
+    issuers: tuple[str, ...] = ()
+    store_id_token: bool = False
+    callback_params: tuple[str, ...] = ()
+    revoke_url: str | None = None
+    revoke_json: bool = False
+
+    @property
+    def group(self) -> str:
+        return self.host.name
+
+
+def _first_tenant(results: dict, key: str):
+    connections = results["connections"]
+    return connections[0].get(key) if connections else None
+
+
+def _tenants(results: dict) -> list[dict]:
+    return [
+        {
+            "tenant_id": connection.get("tenantId"),
+            "tenant_name": connection.get("tenantName"),
+            "tenant_type": connection.get("tenantType"),
+            "connection_id": connection.get("id"),
+        }
+        for connection in results["connections"]
+        if connection.get("tenantId")
+    ]
+
+
+PROVIDERS = {provider.name: provider for provider in (
+    Provider(
+        name="google",
+        title="Google",
+        host=HostGroup(
+            "google",
+            "https://oauth2.googleapis.com",
+            config.http_timeouts("google", 3, 10, 15),
+            http2=True
+        ),
+        table="google_users",
+        flag="is_email_service_connected",
+        authorize_url=config.GOOGLE_AUTH_URL,
+        client_id=config.GOOGLE_CLIENT_ID,
+        client_secret=config.GOOGLE_CLIENT_SECRET,
+        redirect_uri=config.GOOGLE_REDIRECT_URI,
+        scopes=(
+            "openid", "email", "profile",
+            "https://www.googleapis.com/auth/gmail.readonly",
+            "https://www.googleapis.com/auth/gmail.compose",
+        ),
+        authorize_params={"access_type": "offline", "prompt": "consent"},
+        token_url=config.GOOGLE_TOKEN_URL,
+        revoke_url=config.GOOGLE_REVOKE_URL,
+        follow_ups=(FollowUp("user_info", config.GOOGLE_USERINFO_URL),),
+        id_token_profile=lambda claims: {
+            "id": claims["sub"],
+            "email": claims.get("email"),
+            "given_name": claims.get("given_name"),
+            "family_name": claims.get("family_name"),
+            "picture": claims.get("picture"),
+        },
+        discovery_url=config.GOOGLE_DISCOVERY_URL,
+        issuers=("accounts.google.com",),
+        profile=lambda results, params: {
+            "google_id": results["user_info"]["id"],
+            "email": results["user_info"]["email"],
+            "given_name": results["user_info"].get("given_name"),
+            "family_name": results["user_info"].get("family_name"),
+            "picture": results["user_info"].get("picture"),
+        },
+        frontend_url=config.FRONTEND_GOOGLE_URL,
+        error_url="https://invnudge.com/setup-3?service=google&status=error",
+    ),
+    Provider(
+        name="outlook",
+        title="Outlook",
+        host=HostGroup(
+            "microsoft",
+            "https://login.microsoftonline.com",
+            config.http_timeouts("microsoft", 3, 10, 15),
+            http2=True
+        ),
+        table="outlook_users",
+        flag="is_email_service_connected",
+        authorize_url=config.OUTLOOK_AUTH_URL,
+        client_id=config.OUTLOOK_CLIENT_ID,
+        client_secret=config.OUTLOOK_CLIENT_SECRET,
+        redirect_uri=config.OUTLOOK_REDIRECT_URI,
+        scopes=("openid", "profile", "email", "offline_access", "Mail.Read", "Mail.ReadWrite", "Mail.Send"),
+        authorize_params={"response_mode": "query"},
+        token_url=config.OUTLOOK_TOKEN_URL,
+        token_params={"scope": config.OUTLOOK_TOKEN_SCOPE},
+        follow_ups=(FollowUp("user_info", config.OUTLOOK_USERINFO_URL),),
+        profile=lambda results, params: {
+            "outlook_id": results["user_info"].get("id"),
+            "email": results["user_info"].get("userPrincipalName"),
+            "display_name": results["user_info"].get("displayName"),
+            "given_name": results["user_info"].get("givenName"),
+            "surname": results["user_info"].get("surname"),
+        },
+        frontend_url=config.FRONTEND_OUTLOOK_URL,
+        error_url="https://invnudge.com/setup-3?service=outlook&status=error",
+    ),
+    Provider(
+        name="xero",
+        title="Xero",
+        host=HostGroup(
+            "xero",
+            "https://identity.xero.com",
+            config.http_timeouts("xero", 3, 10, 15)
+        ),
+        table="xero_users",
+        flag="is_invoice_service_connected",
+        authorize_url=config.XERO_AUTH_URL,
+        client_id=config.XERO_CLIENT_ID,
+        client_secret=config.XERO_CLIENT_SECRET,
+        redirect_uri=config.XERO_REDIRECT_URI,
+        scopes=("openid", "profile", "email", "offline_access", "accounting.transactions", "accounting.contacts"),
+        token_url=config.XERO_TOKEN_URL,
+        revoke_url=config.XERO_REVOKE_URL,
+        basic_auth=True,
+        follow_ups=(
+            FollowUp("connections", config.XERO_CONNECTIONS_URL),
+            FollowUp("user_info", config.XERO_USERINFO_URL, required=False),
+        ),
+        id_token_profile=lambda claims: {
+            "email": claims.get("email"),
+        },
+        discovery_url=config.XERO_DISCOVERY_URL,
+        store_id_token=True,
+        profile=lambda results, params: {
+            "tenant_id": _first_tenant(results, "tenantId"),
+            "tenant_name": _first_tenant(results, "tenantName"),
+            "email": (results["user_info"] or {}).get("email"),
+            "tenants": _tenants(results),
+        },
+        frontend_url=config.FRONTEND_XERO_URL,
+        error_url="https://invnudge.com/setup-2?service=xero&status=error",
+    ),
+    Provider(
+        name="quickbooks",
+        title="QuickBooks",
+        host=HostGroup(
+            "intuit",
+            "https://oauth.platform.intuit.com",
+            config.http_timeouts("intuit", 3, 10, 15)
+        ),
+        table="quickbooks_users",
+        flag="is_invoice_service_connected",
+        authorize_url=config.QUICKBOOKS_AUTH_URL,
+        client_id=config.QUICKBOOKS_CLIENT_ID,
+        client_secret=config.QUICKBOOKS_CLIENT_SECRET,
+        redirect_uri=config.QUICKBOOKS_REDIRECT_URI,
+        scopes=("com.intuit.quickbooks.accounting", "openid", "profile", "email", "phone", "address"),
+        token_url=config.QUICKBOOKS_TOKEN_URL,
+        revoke_url=config.QUICKBOOKS_REVOKE_URL,
+        revoke_json=True,
+        basic_auth=True,
+        follow_ups=(FollowUp("user_info", config.QUICKBOOKS_USERINFO_URL),),
+        id_token_profile=lambda claims: {
+            "email": claims.get("email"),
+            "givenName": claims.get("given_name"),
+            "familyName": claims.get("family_name"),
+        },
+        discovery_url=config.QUICKBOOKS_DISCOVERY_URL,
+        store_id_token=True,
+        callback_params=("realmId",),
+        profile=lambda results, params: {
+            "realm_id": params["realmId"],
+            "email": results["user_info"].get("email"),
+            "given_name": results["user_info"].get("givenName"),
+            "family_name": results["user_info"].get("familyName"),
+        },
+        frontend_url=config.FRONTEND_QUICKBOOKS_URL,
+        error_url="https://invnudge.com/setup-2?service=quickbooks&status=error",
+    ),
+)}
+
+
+def build_authorize_url(provider: Provider) -> str:
+    """
+    Encodes a provider's static authorize URL; a login only appends
+    `&state=<token>`.
+    """
+    params = {
+        "client_id": provider.client_id,
+        "response_type": "code",
+        "redirect_uri": provider.redirect_uri,
+        "scope": " ".join(provider.scopes),
+        **provider.authorize_params,
+    }
+    return f"{provider.authorize_url}?{urlencode(params, quote_via=quote)}"
+
+
+def build_token_auth(provider: Provider) -> tuple[dict, dict]:
+    """
+    Returns the form fields and headers that authenticate the client
+    on the provider's token endpoint.
+    """
+    headers = {"Content-Type": "application/x-www-form-urlencoded"}
+    if provider.basic_auth:
+        credentials = base64.b64encode(f"{provider.client_id}:{provider.client_secret}".encode()).decode()
+        return dict(provider.token_params), {**headers, "Authorization": f"Basic {credentials}"}
+    fields = {"client_id": provider.client_id, "client_secret": provider.client_secret, **provider.token_params}
+    return fields, headers
+
+
+SUPABASE = HostGroup(
+    "supabase",
+    config.SUPABASE_URL,
+    config.http_timeouts("supabase", 2, 5, 8),
+    http2=True
+)
+
+# Every upstream host group, by name: Supabase and the providers'.
+HOST_GROUPS = {SUPABASE.name: SUPABASE, **{provider.group: provider.host for provider in PROVIDERS.values()}}
+
+# Built once at import, never per request.
+AUTHORIZE_URLS = {name: build_authorize_url(provider) for name, provider in PROVIDERS.items()}
+TOKEN_AUTH = {name: build_token_auth(provider) for name, provider in PROVIDERS.items()}
@@ -0,0 +1,175 @@
+import logging
+import time
+from collections import OrderedDict
+
+import app.config as config
+
+logger = logging.getLogger(__name__)
+
+# KEYS[1] = bucket; ARGV = rate, burst, now. Returns seconds to wait, "0" if admitted.
+REDIS_TOKEN_BUCKET = """
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+
+class LocalBuckets:
+    """
+    Token buckets held in this process.
+
+    At most `maxsize` buckets are kept; the least recently used one is
+    evicted first. Evicting a bucket left alone for `burst / rate`
+    seconds loses nothing, as it is full again by then. An evicted bucket
+    that was still draining restarts full, though, which grants its key
+    a fresh burst; this only happens when more than `maxsize` keys are
+    active within one refill period, so size `RATE_LIMIT_MAX_KEYS`
+    above that.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        # key -> (tokens, updated_at)
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        """
+        Takes one token from a bucket.
+
+        Returns:
+            float: 0 if admitted, otherwise seconds until a token is available.
+        """
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.pop(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated_at) * rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / rate
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.maxsize:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+class RedisBuckets:
+    """
+    Token buckets shared by every worker through Redis.
+
+    Each bucket is a Redis hash updated atomically by a Lua script and
+    expires once it would be full again. Needs the optional `redis`
+    package. While Redis is unreachable, buckets fall back to `fallback`
+    so a Redis outage never takes the auth routes down.
+    """
+
+    def __init__(self, url: str, fallback: LocalBuckets):
+        import redis.asyncio as redis
+
+        self.client = redis.from_url(url)
+        self.script = self.client.register_script(REDIS_TOKEN_BUCKET)
+        self.fallback = fallback
+        self._failing = False
+
+    def __len__(self) -> int:
+        return len(self.fallback)
+
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        try:
+            wait = float(await self.script(keys=[f"ratelimit:{key}"], args=[rate, burst, time.time()]))
+        except Exception as e:
+            if not self._failing:
+                logger.warning("Redis rate limiting unavailable, limiting per worker: %s", e)
+                self._failing = True
+            return await self.fallback.take(key, rate, burst)
+        self._failing = False
+        return wait
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class AdmissionControl:
+    """
+    Decides whether an /auth request may proceed.
+
+    Requests draw from a token bucket per client IP and, when the
+    request carries a verified user, a bucket per user id. OAuth callbacks are
+    additionally capped in flight per worker; beyond the cap they are
+    shed at once instead of queueing behind slow provider calls.
+    """
+
+    def __init__(
+            self,
+            ip_limit: tuple[float, float] = (config.RATE_LIMIT_IP_RATE, config.RATE_LIMIT_IP_BURST),
+            user_limit: tuple[float, float] = (config.RATE_LIMIT_USER_RATE, config.RATE_LIMIT_USER_BURST),
+            callback_concurrency: int = config.RATE_LIMIT_CALLBACK_CONCURRENCY,
+            max_keys: int = config.RATE_LIMIT_MAX_KEYS,
+            redis_url: str = config.RATE_LIMIT_REDIS_URL):
+        self.ip_limit = ip_limit
+        self.user_limit = user_limit
+        self.callback_concurrency = callback_concurrency
+        self.callbacks_in_flight = 0
+        self.buckets: LocalBuckets | RedisBuckets = LocalBuckets(max_keys)
+        if redis_url:
+            try:
+                self.buckets = RedisBuckets(redis_url, self.buckets)
+            except ImportError:
+                logger.warning("RATE_LIMIT_REDIS_URL is set but redis is not installed; limiting per worker")
+
+    async def check(self, ip: str | None, user_id: str | None) -> tuple[str, float] | None:
+        """
+        Takes a token from the caller's buckets.
+
+        Args:
+            ip (str | None): Client IP address.
+            user_id (str | None): Verified user of the request, if any.
+
+        Returns:
+            tuple[str, float] | None: None if admitted, otherwise the
+            limit hit ("ip" or "user") and seconds until retrying makes sense.
+        """
+        if ip:
+            wait = await self.buckets.take(f"ip:{ip}", *self.ip_limit)
+            if wait:
+                return "ip", wait
+        if user_id:
+            wait = await self.buckets.take(f"user:{user_id}", *self.user_limit)
+            if wait:
+                return "user", wait
+        return None
+
+    def try_enter_callback(self) -> bool:
+        """
+        Reserves an in-flight callback slot; release it with `exit_callback`.
+        """
+        if self.callbacks_in_flight >= self.callback_concurrency:
+            return False
+        self.callbacks_in_flight += 1
+        return True
+
+    def exit_callback(self):
+        self.callbacks_in_flight -= 1
+
+    async def close(self):
+        if isinstance(self.buckets, RedisBuckets):
+            await self.buckets.close()
+
+
+admission_control = AdmissionControl()
@@ -0,0 +1,160 @@
+import asyncio
+import random
+import time
+
+import httpx
+import app.config as config
+from app.services.metrics import UPSTREAM_RETRIES
+
+# Methods that are safe to send again after a failure.
+IDEMPOTENT_METHODS = {"GET", "HEAD"}
+
+# Gateway-style responses worth retrying and counted as host failures.
+RETRY_STATUS_CODES = {502, 503, 504}
+
+
+class UpstreamError(Exception):
+    """
+    Raised when an upstream answers with an unusable response.
+
+    Attributes:
+        service (str): Provider or host group that failed.
+        status_code (int | None): HTTP status of the response, if any.
+    """
+
+    def __init__(self, service: str, message: str, status_code: int | None = None):
+        super().__init__(f"{service}: {message}" + (f" ({status_code})" if status_code else ""))
+        self.service = service
+        self.status_code = status_code
+
+
+class CircuitOpenError(httpx.TransportError):
+    """
+    Raised without contacting the host while its circuit is open.
+    """
+
+
+class CircuitBreaker:
+    """
+    Fails fast for a host after repeated failures.
+
+    The circuit opens after `failure_threshold` consecutive failures
+    (transport errors and 5xx responses). After `reset_timeout` seconds
+    one trial request is let through: success closes the circuit,
+    failure opens it again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+
+    def allow(self) -> bool:
+        """
+        Returns whether a request may be sent now.
+        """
+        if self.state == self.CLOSED:
+            return True
+        now = time.monotonic()
+        # a trial that never reported back is replaced after another timeout
+        if now - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self.opened_at = now
+            return True
+        return False
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+def backoff(attempt: int) -> float:
+    """
+    Returns the "full jitter" delay before retry number `attempt` (1-based).
+    """
+    return random.uniform(0, min(config.HTTP_RETRY_BACKOFF_MAX, config.HTTP_RETRY_BACKOFF * 2 ** attempt))
+
+
+class ResilientTransport(httpx.AsyncBaseTransport):
+    """
+    Wraps a transport with a total deadline, retries and circuit breakers.
+
+    - Every request, including its retries and response body, must
+      complete within `total_timeout` seconds.
+    - GET and HEAD requests are retried on transport errors and
+      502/503/504 responses with jittered exponential backoff. Other
+      methods (token exchanges) are never sent twice.
+    - Each host has a circuit breaker; while it is open, requests fail
+      immediately with `CircuitOpenError` instead of queueing on a
+      degraded upstream.
+    """
+
+    def __init__(
+            self,
+            transport: httpx.AsyncBaseTransport,
+            group: str,
+            total_timeout: float,
+            breakers: dict[str, CircuitBreaker]):
+        self.transport = transport
+        self.group = group
+        self.total_timeout = total_timeout
+        self.breakers = breakers
+
+    def _breaker(self, host: str) -> CircuitBreaker:
+        breaker = self.breakers.get(host)
+        if breaker is None:
+            breaker = self.breakers[host] = CircuitBreaker(
+                config.CIRCUIT_FAILURE_THRESHOLD,
+                config.CIRCUIT_RESET_TIMEOUT
+            )
+        return breaker
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        try:
+            async with asyncio.timeout(self.total_timeout):
+                return await self._send(request)
+        except TimeoutError:
+            raise httpx.TimeoutException(
+                f"{request.url.host} did not answer within {self.total_timeout:g}s",
+                request=request
+            )
+
+    async def _send(self, request: httpx.Request) -> httpx.Response:
+        breaker = self._breaker(request.url.host)
+        retries = config.HTTP_RETRY_ATTEMPTS if request.method in IDEMPOTENT_METHODS else 0
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                raise CircuitOpenError(f"Circuit open for {request.url.host}", request=request)
+            try:
+                response = await self.transport.handle_async_request(request)
+                await response.aread()
+            except httpx.TransportError:
+                breaker.record_failure()
+                if attempt >= retries:
+                    raise
+            else:
+                if response.status_code < 500:
+                    breaker.record_success()
+                    return response
+                breaker.record_failure()
+                if attempt >= retries or response.status_code not in RETRY_STATUS_CODES:
+                    return response
+                await response.aclose()
+
+            attempt += 1
+            UPSTREAM_RETRIES.inc(self.group, request.url.host)
+            await asyncio.sleep(backoff(attempt))
+
+    async def aclose(self):
+        await self.transport.aclose()
@@ -0,0 +1,100 @@
+-- Persists an OAuth provider connection in a single round trip.
+--
+-- Upserts the provider row and sets the provider's connection flag on
+-- `users` in one transaction, then returns the user's resulting status
+-- with the same columns /auth/status selects. The table and flag come
+-- from the provider registry (app/services/providers.py); the function
+-- only accepts a table with a `user_id` key and token columns and a
+-- boolean `is_*_connected` flag of `users` (see `check_provider_target`).
+-- For Xero, a `tenants` list in the record is not a column: it replaces
+-- the user's `xero_tenants` rows through `sync_xero_tenants` (see
+-- xero_tenants.sql) in the same transaction.
+--
+-- Called by OAuthService through PostgREST: POST /rest/v1/rpc/connect_provider
+
+-- Rejects anything but a provider table and, when given, a connection
+-- flag; shared by the functions that take them as parameters.
+create or replace function public.check_provider_target(p_table text, p_flag text default null)
+returns void
+language plpgsql
+stable
+set search_path = public
+as $$
+begin
+    if (
+        select count(*) from information_schema.columns
+         where table_schema = 'public'
+           and table_name = p_table
+           and column_name in ('user_id', 'access_token', 'refresh_token', 'expires_at')
+    ) < 4 then
+        raise exception 'Not a provider table: %', p_table using errcode = '22023';
+    end if;
+    if p_flag is not null and not exists (
+        select 1 from information_schema.columns
+         where table_schema = 'public'
+           and table_name = 'users'
+           and column_name = p_flag
+           and column_name like 'is\_%\_connected'
+           and data_type = 'boolean'
+    ) then
+        raise exception 'Not a connection flag: %', p_flag using errcode = '22023';
+    end if;
+end;
+$$;
+
+create or replace function public.connect_provider(
+    p_table text,
+    p_flag text,
+    p_user_id uuid,
+    p_record jsonb
+)
+returns jsonb
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_columns text;
+    v_updates text;
+    v_status jsonb;
+    v_tenants jsonb;
+begin
+    perform check_provider_target(p_table, p_flag);
+
+    v_tenants := p_record -> 'tenants';
+    p_record := (p_record - 'tenants') || jsonb_build_object('user_id', p_user_id);
+
+    select string_agg(format('%I', key), ', '),
+           string_agg(format('%I = excluded.%I', key, key), ', ')
+             filter (where key <> 'user_id')
+      into v_columns, v_updates
+      from jsonb_object_keys(p_record) as key;
+
+    execute format(
+        'insert into %I (%s) select %s from jsonb_populate_record(null::%I, $1) '
+        'on conflict (user_id) do update set %s',
+        p_table, v_columns, v_columns, p_table, v_updates
+    ) using p_record;
+
+    if jsonb_typeof(v_tenants) = 'array' then
+        perform sync_xero_tenants(jsonb_build_object(p_user_id::text, v_tenants));
+    end if;
+
+    execute format(
+        'update users set %I = true where id = $1 '
+        'returning jsonb_build_object('
+        '''id'', id, ''user_hash'', user_hash, ''name'', name, ''email'', email, '
+        '''status'', status, ''email_provider'', email_provider, '
+        '''invoice_provider'', invoice_provider, '
+        '''is_email_service_connected'', is_email_service_connected, '
+        '''is_invoice_service_connected'', is_invoice_service_connected)',
+        p_flag
+    ) into v_status using p_user_id;
+
+    return v_status;
+end;
+$$;
+
+revoke all on function public.check_provider_target(text, text) from public, anon, authenticated;
+revoke all on function public.connect_provider(text, text, uuid, jsonb) from public, anon, authenticated;
+grant execute on function public.connect_provider(text, text, uuid, jsonb) to service_role;
@@ -0,0 +1,54 @@
+-- Leader leases for singleton background jobs across all instances.
+--
+-- A lease is held by one process until `expires_at`; the holder renews it
+-- well before then. PostgREST runs every call in its own transaction, so a
+-- session-level pg_try_advisory_lock cannot be held between calls; an
+-- expiring lease row gives the same single-leader guarantee and lets
+-- another instance take over when the leader dies.
+--
+-- Called by DatabaseLease (app/services/leader.py) through PostgREST:
+-- POST /rest/v1/rpc/try_acquire_lease and /rest/v1/rpc/release_lease
+
+create table if not exists public.leader_leases (
+    name text primary key,
+    holder text not null,
+    expires_at timestamptz not null
+);
+
+alter table public.leader_leases enable row level security;
+
+-- Takes or renews a lease; true while p_holder holds it.
+create or replace function public.try_acquire_lease(p_name text, p_holder text, p_ttl_seconds double precision)
+returns boolean
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    insert into leader_leases (name, holder, expires_at)
+    values (p_name, p_holder, now() + make_interval(secs => p_ttl_seconds))
+    on conflict (name) do update
+       set holder = excluded.holder,
+           expires_at = excluded.expires_at
+     where leader_leases.holder = excluded.holder
+        or leader_leases.expires_at < now();
+    return found;
+end;
+$$;
+
+create or replace function public.release_lease(p_name text, p_holder text)
+returns boolean
+language sql
+security definer
+set search_path = public
+as $$
+    with released as (
+        delete from leader_leases where name = p_name and holder = p_holder returning 1
+    )
+    select exists (select 1 from released);
+$$;
+
+revoke all on function public.try_acquire_lease(text, text, double precision) from public, anon, authenticated;
+revoke all on function public.release_lease(text, text) from public, anon, authenticated;
+grant execute on function public.try_acquire_lease(text, text, double precision) to service_role;
+grant execute on function public.release_lease(text, text) to service_role;
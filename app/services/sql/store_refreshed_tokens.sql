@@ -0,0 +1,44 @@
+-- Stores a batch of refreshed provider tokens in a single round trip.
+--
+-- Each row only replaces the stored tokens if the stored refresh token is
+-- still the one the new tokens were obtained with (`previous_refresh_token`),
+-- so a write never overwrites a rotation stored by another worker in the
+-- meantime.
+-- Returns the ids of the users whose tokens were written. The table comes
+-- from the provider registry and is checked by `check_provider_target`
+-- (see connect_provider.sql).
+--
+-- Called by TokenService (one row) and ConnectionHealthCheck (a batch)
+-- through PostgREST, so refresh tokens travel in the request body:
+-- POST /rest/v1/rpc/store_refreshed_tokens
+
+create or replace function public.store_refreshed_tokens(
+    p_table text,
+    p_rows jsonb
+)
+returns setof uuid
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    perform check_provider_target(p_table);
+
+    return query execute format(
+        'update %I as stored '
+        '   set access_token = incoming.access_token, '
+        '       refresh_token = incoming.refresh_token, '
+        '       expires_at = incoming.expires_at '
+        '  from jsonb_to_recordset($1) as incoming('
+        '       user_id uuid, access_token text, refresh_token text, '
+        '       expires_at timestamptz, previous_refresh_token text) '
+        ' where stored.user_id = incoming.user_id '
+        '   and stored.refresh_token = incoming.previous_refresh_token '
+        'returning stored.user_id',
+        p_table
+    ) using p_rows;
+end;
+$$;
+
+revoke all on function public.store_refreshed_tokens(text, jsonb) from public, anon, authenticated;
+grant execute on function public.store_refreshed_tokens(text, jsonb) to service_role;
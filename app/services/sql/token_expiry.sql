@@ -0,0 +1,7 @@
+-- Stores access-token expiry next to the tokens OAuthService persists,
+-- so the background refresh scheduler can order refreshes by expiry.
+
+alter table public.google_users add column if not exists expires_at timestamptz;
+alter table public.outlook_users add column if not exists expires_at timestamptz;
+alter table public.xero_users add column if not exists expires_at timestamptz;
+alter table public.quickbooks_users add column if not exists expires_at timestamptz;
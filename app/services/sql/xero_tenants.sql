@@ -0,0 +1,68 @@
+-- Every Xero organisation (tenant) a user authorised, not just the first.
+--
+-- Rows are replaced wholesale per user by `sync_xero_tenants`, which
+-- upserts the user's current tenants and prunes the ones no longer in the
+-- `/connections` response in a single statement. Rows go away with the
+-- user's xero_users row.
+--
+-- Read by invoice workers through GET /internal/xero/tenants/{user_id}.
+
+create table if not exists public.xero_tenants (
+    user_id uuid not null references public.xero_users (user_id) on delete cascade,
+    tenant_id text not null,
+    tenant_name text,
+    tenant_type text,
+    connection_id text,
+    updated_at timestamptz not null default now(),
+    primary key (user_id, tenant_id)
+);
+
+alter table public.xero_tenants enable row level security;
+
+-- p_tenants maps user ids to their complete tenant lists:
+-- {"<user_id>": [{"tenant_id": ..., "tenant_name": ..., "tenant_type": ..., "connection_id": ...}], ...}
+-- A user with an empty list loses all tenant rows. Returns the number of
+-- tenant rows written.
+create or replace function public.sync_xero_tenants(p_tenants jsonb)
+returns integer
+language sql
+security definer
+set search_path = public
+as $$
+    with incoming as (
+        select distinct on (entry.key, tenant.tenant_id)
+               entry.key::uuid as user_id,
+               tenant.tenant_id,
+               tenant.tenant_name,
+               tenant.tenant_type,
+               tenant.connection_id
+          from jsonb_each(p_tenants) as entry,
+               jsonb_to_recordset(entry.value) as tenant(
+                   tenant_id text, tenant_name text, tenant_type text, connection_id text
+               )
+         where tenant.tenant_id is not null
+    ),
+    pruned as (
+        delete from xero_tenants as stored
+         where stored.user_id in (select key::uuid from jsonb_object_keys(p_tenants) as key)
+           and not exists (
+               select 1 from incoming
+                where incoming.user_id = stored.user_id
+                  and incoming.tenant_id = stored.tenant_id
+           )
+    ),
+    written as (
+        insert into xero_tenants (user_id, tenant_id, tenant_name, tenant_type, connection_id, updated_at)
+        select user_id, tenant_id, tenant_name, tenant_type, connection_id, now() from incoming
+        on conflict (user_id, tenant_id) do update
+           set tenant_name = excluded.tenant_name,
+               tenant_type = excluded.tenant_type,
+               connection_id = excluded.connection_id,
+               updated_at = excluded.updated_at
+        returning 1
+    )
+    select count(*)::integer from written;
+$$;
+
+revoke all on function public.sync_xero_tenants(jsonb) from public, anon, authenticated;
+grant execute on function public.sync_xero_tenants(jsonb) to service_role;
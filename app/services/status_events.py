@@ -0,0 +1,207 @@
+import asyncio
+import json
+import logging
+from typing import Callable
+
+import app.config as config
+from app.services.metrics import STATUS_STREAMS, registry
+
+logger = logging.getLogger(__name__)
+
+
+class StreamLimitError(Exception):
+    """
+    Raised when a worker already serves `STATUS_STREAM_MAX_CONNECTIONS` streams.
+    """
+
+
+class Subscription:
+    """
+    A bounded queue of status events for one stream.
+
+    Events are status snapshots, so when a slow client lets the buffer
+    fill up the oldest event is dropped; the latest one always wins.
+    """
+
+    def __init__(self, broker: "StatusBroker", user_id: str, buffer_size: int):
+        self.broker = broker
+        self.user_id = user_id
+        self.queue: asyncio.Queue[dict] = asyncio.Queue(maxsize=buffer_size)
+        self.dropped = 0
+
+    def put(self, event: dict):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+    async def next(self, timeout: float) -> dict | None:
+        """
+        Waits for the next event.
+
+        Returns:
+            dict | None: The event, or None after `timeout` seconds.
+        """
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+    def __enter__(self) -> "Subscription":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class StatusBroker:
+    """
+    In-process pub/sub of connection status changes, keyed by user id.
+
+    The OAuth callbacks publish as soon as a connection is stored and
+    `/auth/status/stream` subscribers receive the event. Workers do not
+    share memory, so with `STATUS_STREAM_DATABASE_URL` set events go
+    through Postgres LISTEN/NOTIFY (via the optional `asyncpg` package)
+    and every worker, including the publisher, delivers them to its own
+    subscribers. Without it, events only reach streams served by the
+    publishing worker.
+
+    Listeners added with `add_listener` see every event the worker
+    receives, whether or not a stream is subscribed to its user; the
+    status cache uses this to stay current across workers.
+    """
+
+    def __init__(
+            self,
+            max_connections: int = config.STATUS_STREAM_MAX_CONNECTIONS,
+            buffer_size: int = config.STATUS_STREAM_BUFFER,
+            database_url: str = config.STATUS_STREAM_DATABASE_URL,
+            channel: str = config.STATUS_STREAM_CHANNEL):
+        self.max_connections = max_connections
+        self.buffer_size = buffer_size
+        self.database_url = database_url
+        self.channel = channel
+        self.subscribers: dict[str, set[Subscription]] = {}
+        self.listeners: list[Callable[[dict], None]] = []
+        self.connections = 0
+        self._listener = None
+        self._notifier = None
+        self._tasks: set[asyncio.Task] = set()
+
+    def subscribe(self, user_id: str) -> Subscription:
+        """
+        Registers a stream for a user's events.
+
+        Raises:
+            StreamLimitError: If this worker is at its connection cap.
+        """
+        if self.connections >= self.max_connections:
+            raise StreamLimitError(f"{self.connections} status streams open")
+        subscription = Subscription(self, str(user_id), self.buffer_size)
+        self.subscribers.setdefault(subscription.user_id, set()).add(subscription)
+        self.connections += 1
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscriptions = self.subscribers.get(subscription.user_id)
+        if not subscriptions or subscription not in subscriptions:
+            return
+        subscriptions.discard(subscription)
+        if not subscriptions:
+            del self.subscribers[subscription.user_id]
+        self.connections -= 1
+
+    def add_listener(self, listener: Callable[[dict], None]):
+        """
+        Registers a callback for every event this worker receives.
+        """
+        self.listeners.append(listener)
+
+    def deliver(self, event: dict):
+        """
+        Hands an event to this worker's listeners and subscribers of its user.
+        """
+        for listener in self.listeners:
+            try:
+                listener(event)
+            except Exception:
+                logger.exception("Status event listener failed")
+        for subscription in self.subscribers.get(str(event["user_id"]), ()):
+            subscription.put(event)
+
+    def publish(self, event: dict):
+        """
+        Publishes a status event without blocking the caller.
+
+        Args:
+            event (dict): Event with at least a `user_id` key.
+        """
+        if self._notifier is None:
+            self.deliver(event)
+            return
+        task = asyncio.create_task(self._notify(event))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _notify(self, event: dict):
+        try:
+            await self._notifier.execute("select pg_notify($1, $2)", self.channel, json.dumps(event, default=str))
+        except Exception as e:
+            logger.warning("Status event NOTIFY failed, delivering locally only: %s", e)
+            self.deliver(event)
+
+    def _on_notification(self, connection, pid, channel, payload):
+        try:
+            self.deliver(json.loads(payload))
+        except (ValueError, KeyError) as e:
+            logger.warning("Ignoring malformed status event: %s", e)
+
+    async def start(self):
+        """
+        Starts listening for other workers' events when
+        `STATUS_STREAM_DATABASE_URL` is set.
+        """
+        if not self.database_url or self._listener is not None:
+            return
+        try:
+            import asyncpg
+        except ImportError:
+            logger.warning("STATUS_STREAM_DATABASE_URL is set but asyncpg is not installed; "
+                           "status events stay within each worker")
+            return
+        try:
+            self._listener = await asyncpg.connect(self.database_url)
+            await self._listener.add_listener(self.channel, self._on_notification)
+            self._notifier = await asyncpg.connect(self.database_url)
+        except Exception as e:
+            logger.error("Could not listen for status events, staying local: %s", e)
+            await self.stop()
+
+    async def stop(self):
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        for connection in (self._listener, self._notifier):
+            if connection is not None:
+                await connection.close()
+        self._listener = self._notifier = None
+
+    def stats(self) -> dict:
+        """
+        Returns the number of open streams and subscribed users.
+        """
+        return {
+            "connections": self.connections,
+            "users": len(self.subscribers),
+            "fan_out": "postgres" if self._notifier is not None else "local",
+        }
+
+
+status_broker = StatusBroker()
+
+
+@registry.collector
+def _collect_stream_stats():
+    STATUS_STREAMS.set(value=status_broker.connections)
@@ -0,0 +1,244 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+from datetime import datetime, timezone
+
+import app.config as config
+from app.services.database import SupabaseRest, db
+from app.services.leader import DatabaseLease
+from app.services.providers import PROVIDERS
+from app.services.tokens import (
+    TokenRefreshError,
+    TokenService,
+    parse_timestamp,
+    token_service
+)
+
+logger = logging.getLogger(__name__)
+
+
+class TokenRefreshScheduler:
+    """
+    Refreshes provider access tokens shortly before they expire.
+
+    Pending refreshes live in a min-heap ordered by refresh time. The
+    scheduler loop wakes at the earliest due entry and takes every entry
+    due within the batch window. Each refresh waits for its due time plus
+    random jitter and runs under a per-provider concurrency limit.
+    Rescheduling a user replaces its previous entry (stale heap entries
+    are skipped when popped).
+
+    Only the lease leader runs the scheduler, while users connect on any
+    worker, so the leader also rescans the token tables every
+    `TOKEN_REFRESH_RESCAN_INTERVAL` seconds for tokens expiring before
+    the next rescan.
+    """
+
+    def __init__(self, tokens: TokenService = token_service, database: SupabaseRest = db):
+        self.tokens = tokens
+        self.db = database
+        self._heap: list[tuple[float, int, str, str]] = []
+        self._entries: dict[tuple[str, str], int] = {}
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._loader: asyncio.Task | None = None
+        self._rescan: asyncio.Task | None = None
+        self._running: set[asyncio.Task] = set()
+        self._limits = {
+            provider: asyncio.Semaphore(config.TOKEN_REFRESH_CONCURRENCY)
+            for provider in PROVIDERS
+        }
+        self._failures: dict[tuple[str, str], int] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def running(self) -> bool:
+        """
+        Whether this process runs the scheduler (holds the lease).
+        """
+        return self._task is not None
+
+    def schedule(self, provider: str, user_id: str, expires_at: float | None):
+        """
+        Schedules (or reschedules) a refresh ahead of a token's expiry.
+
+        Args:
+            provider (str): Provider name.
+            user_id (str): ID of the user.
+            expires_at (float | None): Expiry as epoch seconds; None
+                schedules an immediate refresh.
+        """
+        refresh_at = time.time()
+        if expires_at is not None:
+            refresh_at = max(refresh_at, expires_at - config.TOKEN_REFRESH_LEAD)
+        seq = next(self._counter)
+        self._entries[(provider, user_id)] = seq
+        heapq.heappush(self._heap, (refresh_at, seq, provider, user_id))
+        self._wakeup.set()
+
+    def unschedule(self, provider: str, user_id: str):
+        """
+        Stops refreshing a user's tokens for a provider.
+        """
+        self._entries.pop((provider, user_id), None)
+
+    async def start(self):
+        """
+        Starts the scheduler loop and loads stored token expiries in the
+        background, so a cold start does not wait for the full table.
+        """
+        if self._task is not None:
+            return
+        self._task = asyncio.create_task(self._run())
+        self._loader = asyncio.create_task(self._load_all())
+        self._rescan = asyncio.create_task(self._rescan_loop())
+
+    async def _load_all(self, expires_before: float | None = None):
+        for provider in PROVIDERS:
+            try:
+                await self._load(provider, expires_before)
+            except Exception:
+                logger.exception("Loading stored %s tokens for refresh failed", provider)
+
+    async def _rescan_loop(self):
+        interval = config.TOKEN_REFRESH_RESCAN_INTERVAL
+        while True:
+            await asyncio.sleep(interval)
+            await self.rescan()
+
+    async def rescan(self):
+        """
+        Schedules stored tokens that expire before the next rescan and are
+        not scheduled yet, e.g. connections made on other workers.
+        """
+        horizon = (
+            time.time() + config.TOKEN_REFRESH_RESCAN_INTERVAL
+            + config.TOKEN_REFRESH_LEAD + config.TOKEN_REFRESH_BATCH_WINDOW
+        )
+        await self._load_all(expires_before=horizon)
+
+    async def stop(self):
+        """
+        Stops the loop and cancels refreshes that are still running.
+        """
+        tasks = list(self._running)
+        for task in (self._task, self._loader, self._rescan):
+            if task is not None:
+                tasks.append(task)
+        self._task = self._loader = self._rescan = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # a later start (e.g. on regaining leadership) reloads from Supabase
+        self._heap.clear()
+        self._entries.clear()
+
+    async def _load(self, provider: str, expires_before: float | None = None):
+        """
+        Schedules every stored token of a provider, paging by `user_id`.
+
+        With `expires_before` (epoch seconds) only tokens expiring earlier,
+        or without a known expiry, are loaded, and users that are already
+        scheduled keep their entry.
+        """
+        table = PROVIDERS[provider].table
+        last_user_id = None
+        while True:
+            filters = {
+                "refresh_token": "not.is.null",
+                "order": "user_id",
+                "limit": str(config.TOKEN_REFRESH_PAGE_SIZE),
+            }
+            if expires_before is not None:
+                cutoff = datetime.fromtimestamp(expires_before, timezone.utc).isoformat()
+                filters["or"] = f'(expires_at.is.null,expires_at.lt."{cutoff}")'
+            if last_user_id is not None:
+                filters["user_id"] = f"gt.{last_user_id}"
+            rows = await self.db.select(table, "user_id, expires_at", filters)
+            for row in rows:
+                user_id = str(row["user_id"])
+                if expires_before is not None and (provider, user_id) in self._entries:
+                    continue
+                self.schedule(provider, user_id, parse_timestamp(row.get("expires_at")))
+            if len(rows) < config.TOKEN_REFRESH_PAGE_SIZE:
+                return
+            last_user_id = rows[-1]["user_id"]
+
+    def _pop_due(self) -> list[tuple[float, str, str]]:
+        horizon = time.time() + config.TOKEN_REFRESH_BATCH_WINDOW
+        batch = []
+        while self._heap and len(batch) < config.TOKEN_REFRESH_BATCH_SIZE:
+            refresh_at, seq, provider, user_id = self._heap[0]
+            if self._entries.get((provider, user_id)) != seq:
+                heapq.heappop(self._heap)
+                continue
+            if refresh_at > horizon:
+                break
+            heapq.heappop(self._heap)
+            del self._entries[(provider, user_id)]
+            batch.append((refresh_at, provider, user_id))
+        return batch
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            batch = self._pop_due()
+            for refresh_at, provider, user_id in batch:
+                task = asyncio.create_task(self._refresh(provider, user_id, refresh_at))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+            if batch:
+                continue
+
+            timeout = None
+            if self._heap:
+                timeout = max(0.0, self._heap[0][0] - time.time())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _refresh(self, provider: str, user_id: str, refresh_at: float):
+        delay = max(0.0, refresh_at - time.time())
+        await asyncio.sleep(delay + random.uniform(0, config.TOKEN_REFRESH_JITTER))
+        async with self._limits[provider]:
+            try:
+                record = await self.tokens.refresh_user(provider, user_id)
+            except TokenRefreshError as e:
+                if e.revoked:
+                    logger.warning("Dropping revoked %s token for user %s", provider, user_id)
+                    self._failures.pop((provider, user_id), None)
+                    return
+                self._retry(provider, user_id, e)
+                return
+            except Exception as e:
+                self._retry(provider, user_id, e)
+                return
+
+        self._failures.pop((provider, user_id), None)
+        if (provider, user_id) not in self._entries:
+            self.schedule(provider, user_id, parse_timestamp(record["expires_at"]))
+
+    def _retry(self, provider: str, user_id: str, error: Exception):
+        failures = self._failures.get((provider, user_id), 0) + 1
+        self._failures[(provider, user_id)] = failures
+        delay = min(config.TOKEN_REFRESH_RETRY_MAX, config.TOKEN_REFRESH_RETRY_BASE * 2 ** (failures - 1))
+        logger.warning(
+            "Refreshing %s token for user %s failed (%s), retrying in %.0fs",
+            provider, user_id, error, delay
+        )
+        if (provider, user_id) not in self._entries:
+            # expiry is unknown here; schedule() subtracts the lead again
+            self.schedule(provider, user_id, time.time() + delay + config.TOKEN_REFRESH_LEAD)
+
+
+token_refresh_scheduler = TokenRefreshScheduler()
+
+# Only one process across all instances runs the scheduler.
+token_refresh_leader = DatabaseLease("token_refresh", config.TOKEN_REFRESH_LEASE_TTL)
@@ -0,0 +1,331 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+
+import app.config as config
+from app.services.cache import TTLCache
+import httpx
+from app.services.database import DatabaseError, SupabaseRest, db
+from app.services.http import HttpClients, http_clients
+from app.services.providers import PROVIDERS, TOKEN_AUTH
+
+logger = logging.getLogger(__name__)
+
+
+class TokenRefreshError(Exception):
+    """
+    Raised when a provider rejects a refresh request.
+
+    `revoked` is True when the refresh token is no longer valid
+    (`invalid_grant`) and retrying cannot succeed.
+    """
+
+    def __init__(self, provider: str, status_code: int, error: str):
+        super().__init__(f"{provider} token refresh failed ({status_code}): {error}")
+        self.provider = provider
+        self.status_code = status_code
+        self.error = error
+        self.revoked = error == "invalid_grant"
+
+
+def expires_at(tokens: dict) -> str | None:
+    """
+    Converts a token response's `expires_in` into an ISO-8601 UTC timestamp.
+    """
+    expires_in = tokens.get("expires_in")
+    if expires_in is None:
+        return None
+    moment = datetime.now(timezone.utc) + timedelta(seconds=int(expires_in))
+    return moment.isoformat()
+
+
+def parse_timestamp(value: str | None) -> float | None:
+    """
+    Converts an ISO-8601 timestamp from Supabase into epoch seconds.
+    """
+    if not value:
+        return None
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+def token_record(tokens: dict, refresh_token: str) -> dict:
+    """
+    Picks the columns stored for a refresh response; providers that do
+    not rotate refresh tokens keep the one used.
+    """
+    return {
+        "access_token": tokens["access_token"],
+        "refresh_token": tokens.get("refresh_token") or refresh_token,
+        "expires_at": expires_at(tokens),
+    }
+
+
+class TokenService:
+    """
+    Refreshes provider access tokens and stores the results in the
+    provider's `*_users` table.
+
+    Valid access tokens are kept in an in-process cache until shortly
+    before they expire. Refreshes are single-flight per (provider, user)
+    within a process: concurrent callers share one in-flight call to the
+    token endpoint. Across workers and instances, the new tokens are only
+    stored if the refresh token used is still the stored one, so a
+    refresh racing with another never overwrites a newer rotation.
+
+    A rotated refresh token replaces the only valid one, so it must not
+    be lost when storing it fails: the write is retried, and if it still
+    fails the tokens are kept in memory (and used by this process) while
+    a background task keeps retrying the write.
+    """
+
+    def __init__(self, clients: HttpClients = http_clients, database: SupabaseRest = db):
+        self.clients = clients
+        self.db = database
+        # (provider, user_id) -> stored token record
+        self.cache = TTLCache(maxsize=config.TOKEN_CACHE_SIZE, ttl=0)
+        self._inflight: dict[tuple[str, str], asyncio.Task] = {}
+        # (provider, user_id) -> (record, refresh token it replaces), not yet stored
+        self._unsaved: dict[tuple[str, str], tuple[dict, str]] = {}
+        self._persist_task: asyncio.Task | None = None
+
+    def remember(self, provider: str, user_id: str, record: dict):
+        """
+        Caches a stored token record until shortly before it expires.
+        """
+        expiry = parse_timestamp(record.get("expires_at"))
+        if expiry is None:
+            return
+        ttl = expiry - time.time() - config.TOKEN_VENDING_MIN_TTL
+        if ttl > 0:
+            self.cache.set((provider, user_id), record, ttl=ttl)
+
+    def forget(self, provider: str, user_id: str):
+        """
+        Drops a user's cached access token.
+        """
+        self.cache.invalidate((provider, user_id))
+
+    async def get_access_token(self, provider: str, user_id: str) -> dict:
+        """
+        Returns a currently valid access token, refreshing it if needed.
+
+        Served from the in-process cache when possible; otherwise the
+        stored token is used if it is valid for at least
+        `TOKEN_VENDING_MIN_TTL` seconds, else it is refreshed.
+
+        Args:
+            provider (str): Provider name.
+            user_id (str): ID of the user in the `users` table.
+
+        Returns:
+            dict: access_token and expires_at.
+        """
+        record = self.cache.get((provider, user_id))
+        if record is None:
+            stored = await self.load(provider, user_id)
+            if not stored:
+                raise TokenRefreshError(provider, 404, "not_connected")
+            expiry = parse_timestamp(stored.get("expires_at"))
+            if expiry is not None and expiry - time.time() > config.TOKEN_VENDING_MIN_TTL:
+                record = stored
+                self.remember(provider, user_id, record)
+            else:
+                record = await self.refresh_user(provider, user_id, stored.get("refresh_token"))
+        return {"access_token": record["access_token"], "expires_at": record["expires_at"]}
+
+    async def refresh(self, provider: str, refresh_token: str) -> dict:
+        """
+        Exchanges a refresh token for a new access token.
+
+        Args:
+            provider (str): Provider name, a key of `PROVIDERS`.
+            refresh_token (str): Current refresh token.
+
+        Returns:
+            dict: Token response from the provider.
+        """
+        endpoint = PROVIDERS[provider]
+        fields, headers = TOKEN_AUTH[provider]
+        data = {"grant_type": "refresh_token", "refresh_token": refresh_token, **fields}
+        resp = await self.clients.get(endpoint.group).post(endpoint.token_url, data=data, headers=headers)
+        try:
+            tokens = resp.json()
+        except ValueError:
+            tokens = {}
+        if resp.status_code != 200 or "access_token" not in tokens:
+            raise TokenRefreshError(provider, resp.status_code, tokens.get("error") or resp.text)
+        return tokens
+
+    async def load(self, provider: str, user_id: str) -> dict | None:
+        """
+        Reads a user's stored tokens for a provider.
+
+        Returns:
+            dict | None: access_token, refresh_token and expires_at,
+            or None if the user has not connected the provider.
+        """
+        unsaved = self._unsaved.get((provider, user_id))
+        if unsaved is not None:
+            return unsaved[0]
+        return await self.db.select(
+            PROVIDERS[provider].table,
+            "access_token, refresh_token, expires_at",
+            {"user_id": f"eq.{user_id}"},
+            single=True
+        )
+
+    async def refresh_user(
+            self,
+            provider: str,
+            user_id: str,
+            refresh_token: str | None = None) -> dict:
+        """
+        Refreshes a user's access token and persists the new tokens.
+
+        Xero and QuickBooks rotate refresh tokens, so a returned refresh
+        token always replaces the stored one. Concurrent calls for the
+        same user and provider in this process share a single refresh.
+        Another process may refresh the same token at the same time; the
+        update is conditional on the refresh token used, and if another
+        refresh was stored first, its tokens are returned instead.
+
+        Args:
+            provider (str): Provider name.
+            user_id (str): ID of the user in the `users` table.
+            refresh_token (str | None): Refresh token to use; read from
+                Supabase when None.
+
+        Returns:
+            dict: Stored access_token, refresh_token and expires_at.
+        """
+        key = (provider, user_id)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._refresh_user(provider, user_id, refresh_token))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _refresh_user(
+            self,
+            provider: str,
+            user_id: str,
+            refresh_token: str | None) -> dict:
+        if refresh_token is None:
+            stored = await self.load(provider, user_id)
+            if not stored or not stored.get("refresh_token"):
+                raise TokenRefreshError(provider, 404, "invalid_grant")
+            refresh_token = stored["refresh_token"]
+
+        record = token_record(await self.refresh(provider, refresh_token), refresh_token)
+        return await self.store(provider, user_id, record, refresh_token)
+
+    async def store(self, provider: str, user_id: str, record: dict, refresh_token: str) -> dict:
+        """
+        Stores tokens obtained with `refresh_token`, unless another
+        refresh was stored first.
+
+        Args:
+            provider (str): Provider name.
+            user_id (str): ID of the user in the `users` table.
+            record (dict): New access_token, refresh_token and expires_at.
+            refresh_token (str): Refresh token the new tokens were obtained with.
+
+        Returns:
+            dict: The current tokens: `record`, or the other refresh's.
+        """
+        # while earlier tokens are unsaved, the stored refresh token is the one they replace
+        previous = self._unsaved.get((provider, user_id), (None, refresh_token))[1]
+        try:
+            stored = await self._persist(provider, user_id, record, previous)
+        except (DatabaseError, httpx.HTTPError) as e:
+            logger.error(
+                "Storing refreshed %s tokens of user %s failed (%s); keeping them in memory and retrying",
+                provider, user_id, e
+            )
+            self._keep_unsaved(provider, user_id, record, previous)
+            self.remember(provider, user_id, record)
+            return record
+        self._unsaved.pop((provider, user_id), None)
+        if not stored:
+            # another worker or instance rotated the token first; its tokens are current
+            current = await self.load(provider, user_id)
+            if not current or not current.get("access_token"):
+                raise TokenRefreshError(provider, 404, "not_connected")
+            record = current
+        self.remember(provider, user_id, record)
+        return record
+
+    async def _persist(
+            self,
+            provider: str,
+            user_id: str,
+            record: dict,
+            previous: str,
+            attempts: int = config.TOKEN_PERSIST_RETRIES) -> list:
+        """
+        Stores refreshed tokens if `previous` is still the stored refresh
+        token, retrying transient failures with backoff.
+
+        The compare-and-set runs in the `store_refreshed_tokens` Postgres
+        function, so neither refresh token ends up in a request URL.
+
+        Returns:
+            list: The updated user ids; empty if another refresh was stored first.
+        """
+        row = {"user_id": user_id, **record, "previous_refresh_token": previous}
+        for attempt in range(attempts + 1):
+            try:
+                return await self.db.rpc("store_refreshed_tokens", {
+                    "p_table": PROVIDERS[provider].table,
+                    "p_rows": [row]
+                })
+            except DatabaseError as e:
+                if e.status_code < 500 or attempt == attempts:
+                    raise
+            except httpx.HTTPError:
+                if attempt == attempts:
+                    raise
+            await asyncio.sleep(config.TOKEN_PERSIST_BACKOFF * 2 ** attempt)
+
+    def _keep_unsaved(self, provider: str, user_id: str, record: dict, previous: str):
+        self._unsaved[(provider, user_id)] = (record, previous)
+        if self._persist_task is None or self._persist_task.done():
+            self._persist_task = asyncio.create_task(self._persist_unsaved())
+
+    async def flush_unsaved(self):
+        """
+        Tries once to store every refreshed token pair kept in memory.
+        """
+        for key, (record, previous) in list(self._unsaved.items()):
+            provider, user_id = key
+            try:
+                await self._persist(provider, user_id, record, previous, attempts=0)
+            except (DatabaseError, httpx.HTTPError) as e:
+                logger.warning("Storing refreshed %s tokens of user %s failed again: %s", provider, user_id, e)
+                continue
+            # stored, or superseded by another process's refresh
+            if self._unsaved.get(key, (None,))[0] is record:
+                del self._unsaved[key]
+
+    async def _persist_unsaved(self):
+        while self._unsaved:
+            await asyncio.sleep(config.TOKEN_PERSIST_RETRY_INTERVAL)
+            await self.flush_unsaved()
+
+    async def close(self):
+        """
+        Stops the background retry after one last attempt to store
+        refreshed tokens kept in memory; tokens still unsaved are logged.
+        """
+        if self._persist_task is not None:
+            self._persist_task.cancel()
+            await asyncio.gather(self._persist_task, return_exceptions=True)
+            self._persist_task = None
+        await self.flush_unsaved()
+        for provider, user_id in self._unsaved:
+            logger.error("Refreshed %s tokens of user %s were never stored", provider, user_id)
+
+
+token_service = TokenService()
@@ -0,0 +1,190 @@
+import asyncio
+import hashlib
+import json
+
+from app.config import (
+    STATUS_CACHE_TTL,
+    STATUS_CACHE_SIZE,
+    STATUS_BATCH_URL_BUDGET,
+    STATUS_BATCH_CONCURRENCY,
+    WRITE_BEHIND_ENABLED
+)
+from app.services.cache import TTLCache
+from app.services.database import SupabaseRest, chunk_by_length, db, in_filter
+from app.services.status_events import StatusBroker, status_broker
+from app.services.users import USER_STATUS_COLUMNS
+from app.services.write_behind import WriteBehindQueue, write_behind_queue
+
+
+def compute_etag(status: dict) -> str:
+    """
+    Returns a weak ETag for a status payload.
+    """
+    body = json.dumps(status, sort_keys=True, separators=(",", ":"), default=str)
+    return f'W/"{hashlib.sha1(body.encode()).hexdigest()}"'
+
+
+class UserStatusService:
+    """
+    Serves `users` status rows through an in-process cache.
+
+    Rows are cached per user id; session ids map to user ids, so a single
+    write-through `put` or `invalidate` from the OAuth callbacks covers
+    lookups by either key.
+
+    Other workers' changes arrive as status events: an event carrying the
+    new status is written through, any other drops the cached row. With
+    `STATUS_STREAM_DATABASE_URL` unset events stay within each worker, and
+    a row changed elsewhere is served until `STATUS_CACHE_TTL` expires it.
+
+    In write-behind mode, connection flags of journaled connections that
+    may not have reached Supabase yet are overlaid on every row served.
+    """
+
+    def __init__(
+            self,
+            database: SupabaseRest = db,
+            journal: WriteBehindQueue = write_behind_queue,
+            events: StatusBroker = status_broker):
+        self.db = database
+        self.journal = journal
+        # user_id -> (status, etag)
+        self.rows = TTLCache(maxsize=STATUS_CACHE_SIZE, ttl=STATUS_CACHE_TTL)
+        # session_id -> user_id
+        self.sessions = TTLCache(maxsize=STATUS_CACHE_SIZE, ttl=STATUS_CACHE_TTL)
+        events.add_listener(self._on_event)
+
+    async def get(
+            self,
+            user_id: str | None = None,
+            session_id: str | None = None) -> tuple[dict, str] | None:
+        """
+        Returns a user's status and its ETag, reading Supabase on a miss.
+
+        Args:
+            user_id (str | None): ID of the user.
+            session_id (str | None): Session ID, used when `user_id` is None.
+
+        Returns:
+            tuple[dict, str] | None: (status, etag), or None if the user
+            does not exist.
+        """
+        if user_id is None and session_id is not None:
+            user_id = self.sessions.get(session_id)
+
+        if user_id is not None:
+            cached = self.rows.get(str(user_id))
+            if cached is not None:
+                return await self.with_pending_writes(cached)
+            filters = {"id": f"eq.{user_id}"}
+        else:
+            filters = {"session_id": f"eq.{session_id}"}
+
+        status = await self.db.select("users", USER_STATUS_COLUMNS, filters, single=True)
+        if not status:
+            return None
+        if session_id is not None:
+            self.sessions.set(session_id, str(status["id"]))
+        return await self.with_pending_writes(self.put(status))
+
+    async def get_many(
+            self,
+            user_ids: list[str],
+            session_ids: list[str]) -> dict:
+        """
+        Resolves many users' statuses with chunked `in.(...)` queries.
+
+        Always reads Supabase (the cache is written through, not read),
+        so bulk jobs see current data.
+
+        Args:
+            user_ids (list[str]): User IDs to resolve.
+            session_ids (list[str]): Session IDs to resolve.
+
+        Returns:
+            dict: {"users": {user_id: status | None},
+                   "sessions": {session_id: status | None}},
+            where None marks an ID that matched no user.
+        """
+        semaphore = asyncio.Semaphore(STATUS_BATCH_CONCURRENCY)
+
+        async def _fetch(column: str, chunk: list[str]) -> list[dict]:
+            async with semaphore:
+                return await self.db.select(
+                    "users",
+                    f"{USER_STATUS_COLUMNS}, session_id",
+                    {column: in_filter(chunk)}
+                )
+
+        user_ids = list(dict.fromkeys(str(user_id) for user_id in user_ids))
+        session_ids = list(dict.fromkeys(session_ids))
+        queries = [
+            ("id", chunk) for chunk in chunk_by_length(user_ids, STATUS_BATCH_URL_BUDGET)
+        ] + [
+            ("session_id", chunk) for chunk in chunk_by_length(session_ids, STATUS_BATCH_URL_BUDGET)
+        ]
+        responses = await asyncio.gather(*(_fetch(column, chunk) for column, chunk in queries))
+        pending = await self.journal.connected_flags(
+            [row["id"] for rows in responses for row in rows]
+        ) if WRITE_BEHIND_ENABLED else {}
+
+        users = dict.fromkeys(user_ids)
+        sessions = dict.fromkeys(session_ids)
+        for row in (row for rows in responses for row in rows):
+            session_id = row.pop("session_id", None)
+            status, _ = self._overlay(self.put(row), pending.get(str(row["id"]), {}))
+            if str(row["id"]) in users:
+                users[str(row["id"])] = status
+            if session_id in sessions:
+                sessions[session_id] = status
+                self.sessions.set(session_id, str(row["id"]))
+        return {"users": users, "sessions": sessions}
+
+    def put(self, status: dict) -> tuple[dict, str]:
+        """
+        Writes a fresh status row through to the cache.
+
+        Returns:
+            tuple[dict, str]: (status, etag)
+        """
+        entry = (status, compute_etag(status))
+        self.rows.set(str(status["id"]), entry)
+        return entry
+
+    async def with_pending_writes(self, entry: tuple[dict, str]) -> tuple[dict, str]:
+        """
+        Overlays connection flags still in the write-behind journal so a
+        user sees their own connection right after the redirect.
+
+        Returns:
+            tuple[dict, str]: (status, etag), unchanged if nothing is pending.
+        """
+        if not WRITE_BEHIND_ENABLED:
+            return entry
+        user_id = str(entry[0]["id"])
+        flags = await self.journal.connected_flags([user_id])
+        return self._overlay(entry, flags.get(user_id, {}))
+
+    @staticmethod
+    def _overlay(entry: tuple[dict, str], flags: dict) -> tuple[dict, str]:
+        status, _ = entry
+        if all(status.get(flag) == value for flag, value in flags.items()):
+            return entry
+        status = {**status, **flags}
+        return status, compute_etag(status)
+
+    def invalidate(self, user_id: str):
+        """
+        Drops the cached status of a user.
+        """
+        self.rows.invalidate(str(user_id))
+
+    def _on_event(self, event: dict):
+        status = event.get("status")
+        if status and str(status.get("id")) == str(event["user_id"]):
+            self.put(status)
+        else:
+            self.invalidate(event["user_id"])
+
+
+user_status_service = UserStatusService()
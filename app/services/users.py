@@ -1,20 +1,77 @@
 import httpx
-from app.config import SUPABASE_URL, SUPABASE_KEY
+from app.config import (
+    SUPABASE_URL,
+    SUPABASE_KEY,
+    USER_EXISTS_CACHE_TTL,
+    USER_EXISTS_NEGATIVE_TTL,
+    USER_EXISTS_CACHE_SIZE
+)
+from app.services.cache import TTLCache
+from app.services.http import http_clients
+from app.services.metrics import DB_QUERY_DURATION
+
+# Columns returned by /auth/status and by the `connect_provider` function;
+# the two connection flags are part of the public response (README.md).
+USER_STATUS_COLUMNS = (
+    "id, user_hash, name, email, status, email_provider, invoice_provider, "
+    "is_email_service_connected, is_invoice_service_connected"
+)
+
+# (user_id, user_hash) -> (exists, status_code, message)
+user_exists_cache = TTLCache(maxsize=USER_EXISTS_CACHE_SIZE, ttl=USER_EXISTS_CACHE_TTL)
 
 
 class UserService:
 
-    @staticmethod
-    async def user_exists(user_id: str, user_hash: str) -> tuple[bool, int, str]:
+    def __init__(self, client: httpx.AsyncClient | None = None):
+        self._client = client
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        return self._client or http_clients.get("supabase")
+
+    async def user_exists(self, user_id: str, user_hash: str) -> tuple[bool, int, str]:
         """
             Checks if a user with the given `user_id` and `user_hash`
             exists in the `users` table.
 
+            Results are cached per `(user_id, user_hash)`; "not found"
+            results are kept for a shorter time, errors are not cached.
+
         Returns:
             (exists, status_code, message)
         """
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(
+        key = (user_id, user_hash)
+        cached = user_exists_cache.get(key)
+        if cached is not None:
+            return cached
+
+        result = await self._fetch_user_exists(user_id, user_hash)
+        exists, status, _ = result
+        if exists:
+            user_exists_cache.set(key, result)
+        elif status == 404:
+            user_exists_cache.set(key, result, ttl=USER_EXISTS_NEGATIVE_TTL)
+        return result
+
+    @staticmethod
+    def invalidate(user_id: str, user_hash: str | None = None):
+        """
+        Drops cached `user_exists` results for a user, e.g. after the
+        user is deleted or its hash is rotated.
+
+        Args:
+            user_id (str): ID of the user.
+            user_hash (str | None): Drop only this hash; all hashes if None.
+        """
+        if user_hash is not None:
+            user_exists_cache.invalidate((user_id, user_hash))
+        else:
+            user_exists_cache.invalidate_where(lambda key: key[0] == user_id)
+
+    async def _fetch_user_exists(self, user_id: str, user_hash: str) -> tuple[bool, int, str]:
+        with DB_QUERY_DURATION.time("user_exists", "users"):
+            resp = await self.client.get(
                 f"{SUPABASE_URL}/rest/v1/users",
                 params={
                     "and": f"(id.eq.{user_id},user_hash.eq.{user_hash})"
@@ -25,14 +82,14 @@ class UserService:
                 }
             )
 
-            if resp.status_code != 200:
-                return False, resp.status_code, resp.text
+        if resp.status_code != 200:
+            return False, resp.status_code, resp.text
 
-            data = resp.json()
-            if not data:
-                return False, 404, "User not found"
+        data = resp.json()
+        if not data:
+            return False, 404, "User not found"
 
-            return True, 200, "User exists"
+        return True, 200, "User exists"
 
 
 user_service = UserService()
@@ -0,0 +1,359 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import httpx
+import app.config as config
+from app.services.database import DatabaseError, SupabaseRest, chunk_by_length, db, in_filter
+from app.services.providers import PROVIDERS
+from app.services.xero_tenants import XeroTenantService, xero_tenant_service
+
+logger = logging.getLogger(__name__)
+
+
+SCHEMA = """
+create table if not exists journal (
+    seq integer primary key autoincrement,
+    provider text not null,
+    user_id text not null,
+    record text not null,
+    created_at real not null,
+    attempts integer not null default 0,
+    not_before real not null default 0,
+    claimed_until real not null default 0,
+    flushed_at real,
+    error text
+);
+create index if not exists journal_user on journal (user_id);
+create index if not exists journal_pending on journal (flushed_at, error, seq);
+"""
+
+
+class WriteBehindQueue:
+    """
+    Persists provider connections after the callback has redirected.
+
+    `enqueue` appends the connection record to a SQLite journal (WAL,
+    fsync on commit) and returns; a background flusher claims pending
+    entries in batches, keeps the latest record per (provider, user),
+    and writes each provider table with one multi-row upsert followed by
+    one `xero_tenants` sync for Xero and one bulk update of the `users`
+    connection flags.
+
+    Delivery is at-least-once: entries leave the pending state only after
+    Supabase accepted them, failed batches are retried with backoff, and
+    entries still pending at shutdown are flushed on the next start.
+    Claims carry a lease, so several worker processes of one instance
+    can share one journal. The journal must live on the instance's local
+    disk: SQLite's locking does not hold on network filesystems, and
+    instances sharing a volume would each flush the other's entries. A record Supabase rejects (4xx) is isolated and kept in the
+    journal with its error instead of blocking the queue.
+
+    Flushed entries stay in the journal for `STATUS_CACHE_TTL` seconds so
+    `connected_flags` keeps answering until every worker's status cache
+    has picked up the write. All journal reads and writes run in worker
+    threads, off the event loop.
+    """
+
+    def __init__(
+            self,
+            path: str | None,
+            database: SupabaseRest = db,
+            tenants: XeroTenantService = xero_tenant_service):
+        self.path = path
+        self.db = database
+        self.tenants = tenants
+        self._conn: sqlite3.Connection | None = None
+        self._reader: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        self._read_lock = threading.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute("pragma journal_mode = wal")
+        conn.execute("pragma synchronous = full")
+        return conn
+
+    def open(self):
+        """
+        Opens the journal, creating it if needed.
+        """
+        if self._conn is not None:
+            return
+        if not self.path:
+            raise RuntimeError("WRITE_BEHIND_JOURNAL_PATH must be set to a durable path to enable write-behind")
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = self._connect()
+        self._conn.executescript(SCHEMA)
+        self._reader = self._connect()
+
+    def _execute(self, sql: str, params=()) -> list[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute("begin immediate")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("rollback")
+                raise
+            self._conn.execute("commit")
+
+    async def enqueue(self, provider: str, user_id: str, record: dict):
+        """
+        Durably records a provider connection for the flusher.
+
+        Args:
+            provider (str): Provider name, a key of `PROVIDERS`.
+            user_id (str): ID of the user in the `users` table.
+            record (dict): Columns of the provider row, without `user_id`.
+        """
+        await asyncio.to_thread(
+            self._execute,
+            "insert into journal (provider, user_id, record, created_at) values (?, ?, ?, ?)",
+            (provider, str(user_id), json.dumps(record), time.time())
+        )
+        self._wakeup.set()
+
+    async def discard(self, provider: str, user_ids: list[str]):
+        """
+        Drops journaled connections of users being disconnected, so the
+        flusher does not store them again and `connected_flags` stops
+        reporting them.
+        """
+        if self._conn is None or not user_ids:
+            return
+        await asyncio.to_thread(
+            self._execute_many,
+            "delete from journal where provider = ? and user_id = ?",
+            [(provider, str(user_id)) for user_id in user_ids]
+        )
+
+    def _read(self, sql: str, params=()) -> list[tuple]:
+        with self._read_lock:
+            if self._reader is None:
+                return []
+            return self._reader.execute(sql, params).fetchall()
+
+    def _connected_flags(self, user_ids: list[str]) -> dict[str, dict]:
+        flags: dict[str, dict] = {}
+        since = time.time() - config.STATUS_CACHE_TTL
+        # stay below SQLite's bound parameter limit
+        for start in range(0, len(user_ids), 500):
+            chunk = user_ids[start:start + 500]
+            rows = self._read(
+                "select distinct user_id, provider from journal "
+                f"where user_id in ({', '.join('?' * len(chunk))}) and error is null "
+                "and (flushed_at is null or flushed_at > ?)",
+                (*chunk, since)
+            )
+            for user_id, provider in rows:
+                if provider in PROVIDERS:
+                    flags.setdefault(user_id, {})[PROVIDERS[provider].flag] = True
+        return flags
+
+    async def connected_flags(self, user_ids: list[str]) -> dict[str, dict]:
+        """
+        Returns, per user id, the `users` flags set by connections that
+        are queued or were flushed within the status cache TTL, e.g.
+        {"<user_id>": {"is_email_service_connected": True}}. Users
+        without such connections are left out.
+        """
+        if self._reader is None or not user_ids:
+            return {}
+        return await asyncio.to_thread(self._connected_flags, [str(user_id) for user_id in user_ids])
+
+    def _claim(self, limit: int) -> list[tuple[int, str, str, str, int]]:
+        now = time.time()
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "select seq, provider, user_id, record, attempts from journal "
+                "where flushed_at is null and error is null "
+                "and not_before <= ? and claimed_until <= ? order by seq limit ?",
+                (now, now, limit)
+            ).fetchall()
+            conn.executemany(
+                "update journal set claimed_until = ? where seq = ?",
+                [(now + config.WRITE_BEHIND_CLAIM_LEASE, row[0]) for row in rows]
+            )
+        return rows
+
+    def _complete(self, entries: list[tuple[int, str, str]]):
+        """
+        Marks entries flushed, including older pending entries for the
+        same user and provider that they supersede.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            conn.executemany(
+                "update journal set flushed_at = ?, claimed_until = 0 "
+                "where provider = ? and user_id = ? and seq <= ? and flushed_at is null",
+                [(now, provider, user_id, seq) for seq, provider, user_id in entries]
+            )
+            conn.execute(
+                "delete from journal where flushed_at < ?",
+                (now - config.STATUS_CACHE_TTL,)
+            )
+
+    def _release(self, seqs: list[int], attempts: int, error: Exception):
+        delay = min(config.WRITE_BEHIND_RETRY_MAX, config.WRITE_BEHIND_RETRY_BASE * 2 ** attempts)
+        self._execute_many(
+            "update journal set attempts = attempts + 1, not_before = ?, claimed_until = 0 where seq = ?",
+            [(time.time() + delay, seq) for seq in seqs]
+        )
+        logger.warning("Write-behind flush of %d entries failed (%s), retrying in %.0fs", len(seqs), error, delay)
+
+    def _reject(self, seqs: list[int], error: Exception):
+        self._execute_many(
+            "update journal set error = ?, claimed_until = 0 where seq = ?",
+            [(str(error), seq) for seq in seqs]
+        )
+        logger.error("Write-behind entries %s rejected by Supabase: %s", seqs, error)
+
+    def _execute_many(self, sql: str, params: list[tuple]):
+        with self._transaction() as conn:
+            conn.executemany(sql, params)
+
+    async def _write(self, provider: str, entries: list[tuple[list[int], str, dict]]):
+        table, flag = PROVIDERS[provider].table, PROVIDERS[provider].flag
+        rows, tenants = [], {}
+        for _, user_id, record in entries:
+            row = {**record, "user_id": user_id}
+            if "tenants" in row:
+                tenants[user_id] = row.pop("tenants")
+            rows.append(row)
+        await self.db.upsert(table, rows, on_conflict="user_id")
+        await self.tenants.sync(tenants)
+        user_ids = [user_id for _, user_id, _ in entries]
+        await asyncio.gather(*(
+            self.db.update("users", {flag: True}, {"id": in_filter(chunk)})
+            for chunk in chunk_by_length(user_ids, config.STATUS_BATCH_URL_BUDGET)
+        ))
+
+    async def _flush_provider(self, provider: str, entries: list[tuple[list[int], str, dict]], attempts: int):
+        try:
+            await self._write(provider, entries)
+        except DatabaseError as e:
+            if e.status_code >= 500:
+                await asyncio.to_thread(self._release, [seq for seqs, _, _ in entries for seq in seqs], attempts, e)
+                return
+            if len(entries) > 1:
+                # isolate the rejected record(s)
+                for entry in entries:
+                    await self._flush_provider(provider, [entry], attempts)
+                return
+            await asyncio.to_thread(self._reject, entries[0][0], e)
+            return
+        except httpx.HTTPError as e:
+            await asyncio.to_thread(self._release, [seq for seqs, _, _ in entries for seq in seqs], attempts, e)
+            return
+        await asyncio.to_thread(
+            self._complete,
+            [(max(seqs), provider, user_id) for seqs, user_id, _ in entries]
+        )
+
+    async def flush(self) -> int:
+        """
+        Writes one batch of pending entries to Supabase.
+
+        Returns:
+            int: Number of journal entries claimed.
+        """
+        claimed = await asyncio.to_thread(self._claim, config.WRITE_BEHIND_BATCH_SIZE)
+        if not claimed:
+            return 0
+
+        # keep the latest record per (provider, user); older ones are superseded
+        latest: dict[tuple[str, str], tuple[list[int], dict]] = {}
+        # backoff per provider, so one failing table does not delay the others
+        attempts: dict[str, int] = {}
+        for seq, provider, user_id, record, entry_attempts in claimed:
+            seqs = latest.get((provider, user_id), ([], None))[0]
+            latest[(provider, user_id)] = (seqs + [seq], json.loads(record))
+            attempts[provider] = max(attempts.get(provider, 0), entry_attempts)
+
+        by_provider: dict[str, list[tuple[list[int], str, dict]]] = {}
+        for (provider, user_id), (seqs, record) in latest.items():
+            by_provider.setdefault(provider, []).append((seqs, user_id, record))
+
+        await asyncio.gather(*(
+            self._flush_provider(provider, entries, attempts[provider])
+            for provider, entries in by_provider.items()
+        ))
+        return len(claimed)
+
+    async def _run(self):
+        while True:
+            try:
+                if await self.flush() >= config.WRITE_BEHIND_BATCH_SIZE:
+                    continue
+            except Exception:
+                logger.exception("Write-behind flush failed")
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), config.WRITE_BEHIND_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def start(self):
+        """
+        Opens the journal and starts the background flusher; entries
+        left over from a previous run are flushed first.
+        """
+        if self._task is not None:
+            return
+        await asyncio.to_thread(self.open)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Stops the flusher and drains the journal for up to
+        `WRITE_BEHIND_SHUTDOWN_TIMEOUT` seconds; the rest stays journaled.
+        """
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        try:
+            async with asyncio.timeout(config.WRITE_BEHIND_SHUTDOWN_TIMEOUT):
+                while await self.flush():
+                    pass
+        except TimeoutError:
+            logger.warning("Write-behind journal not drained before shutdown; resuming on next start")
+        self._conn.close()
+        with self._read_lock:
+            self._reader.close()
+            self._conn = self._reader = None
+
+    async def stats(self) -> dict:
+        """
+        Returns journal entry counts by state.
+        """
+        if self._reader is None:
+            return {}
+        rows = await asyncio.to_thread(
+            self._read,
+            "select count(*) filter (where flushed_at is null and error is null), "
+            "count(*) filter (where flushed_at is not null), "
+            "count(*) filter (where error is not null) from journal"
+        )
+        if not rows:
+            return {}
+        pending, flushed, rejected = rows[0]
+        return {"pending": pending, "flushed": flushed, "rejected": rejected}
+
+
+write_behind_queue = WriteBehindQueue(config.WRITE_BEHIND_JOURNAL_PATH)
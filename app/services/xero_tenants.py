@@ -0,0 +1,53 @@
+from app.services.database import SupabaseRest, db
+
+# Columns returned by GET /internal/xero/tenants/{user_id}.
+TENANT_COLUMNS = "tenant_id, tenant_name, tenant_type, connection_id, updated_at"
+
+
+class XeroTenantService:
+    """
+    Every Xero organisation a user authorised, stored in `xero_tenants`
+    (see `app/services/sql/xero_tenants.sql`).
+
+    The callback stores the tenants together with the connection through
+    the `connect_provider` function; the write-behind flusher syncs a
+    whole batch with one `sync_xero_tenants` call. Workers read them here
+    instead of calling Xero's `/connections` API on every job.
+    """
+
+    def __init__(self, database: SupabaseRest = db):
+        self.db = database
+
+    async def for_user(self, user_id: str) -> list[dict]:
+        """
+        Returns a user's stored Xero tenants, ordered by name.
+
+        Args:
+            user_id (str): ID of the user in the `users` table.
+
+        Returns:
+            list[dict]: Tenant rows; empty if the user has none.
+        """
+        return await self.db.select(
+            "xero_tenants",
+            TENANT_COLUMNS,
+            {"user_id": f"eq.{user_id}", "order": "tenant_name,tenant_id"}
+        )
+
+    async def sync(self, tenants: dict[str, list[dict]]) -> int:
+        """
+        Replaces the stored tenants of several users in one write.
+
+        Args:
+            tenants (dict[str, list[dict]]): Complete tenant list per user
+                id; tenants missing from a list are deleted.
+
+        Returns:
+            int: Number of tenant rows written.
+        """
+        if not tenants:
+            return 0
+        return await self.db.rpc("sync_xero_tenants", {"p_tenants": tenants})
+
+
+xero_tenant_service = XeroTenantService()
@@ -0,0 +1,60 @@
+import logging
+import os
+import subprocess
+import sys
+import time
+
+import app
+
+logger = logging.getLogger(__name__)
+
+# Filled in by app.main: seconds spent importing the app and running the lifespan startup.
+startup_timings: dict[str, float] = {}
+
+
+def mark(stage: str):
+    """
+    Records the time elapsed since the `app` package was first imported.
+
+    Args:
+        stage (str): Name of the milestone, e.g. "import" or "ready".
+    """
+    startup_timings[stage] = time.perf_counter() - app.IMPORT_STARTED
+    logger.info("Startup stage %s reached after %.3fs", stage, startup_timings[stage])
+
+
+def measure_import_time(module: str = "app.main", runs: int = 3) -> float:
+    """
+    Measures a cold import of the application in fresh interpreters.
+
+    Each run imports `module` in a new subprocess, so no module cache
+    from the current process is reused. Suitable for asserting a cold
+    start budget in tests or CI.
+
+    Args:
+        module (str): Module to import.
+        runs (int): Number of runs; the fastest one is returned.
+
+    Returns:
+        float: Import time in seconds.
+    """
+    script = (
+        "import time; started = time.perf_counter(); "
+        f"import {module}; print(time.perf_counter() - started)"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    timings = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-c", script],
+            cwd=root,
+            capture_output=True,
+            text=True,
+            check=True
+        )
+        timings.append(float(result.stdout.strip().splitlines()[-1]))
+    return min(timings)
+
+
+if __name__ == "__main__":
+    print(f"{measure_import_time():.3f}s")
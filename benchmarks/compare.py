@@ -0,0 +1,90 @@
+"""
+Compares two benchmark result files written by `benchmarks.run`.
+
+Prints throughput and latency percentiles side by side for every route
+and concurrency level present in both runs, and exits with status 1
+when a latency percentile grew, or throughput dropped, by more than
+the threshold.
+
+Usage:
+    python -m benchmarks.compare benchmarks/results/<base>.json benchmarks/results/<new>.json
+    python -m benchmarks.compare base.json new.json --threshold 0.15
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+# metric -> True when higher is better
+METRICS = {
+    "throughput": True,
+    "p50_ms": False,
+    "p95_ms": False,
+    "p99_ms": False,
+}
+
+
+def load(path: Path) -> tuple[dict, dict[tuple[str, int], dict]]:
+    report = json.loads(path.read_text())
+    rows = {(row["route"], row["concurrency"]): row for row in report["results"]}
+    return report["meta"], rows
+
+
+def change(base: float, new: float) -> float:
+    if not base:
+        return 0.0
+    return (new - base) / base
+
+
+def compare(base_path: Path, new_path: Path, threshold: float) -> list[str]:
+    """
+    Prints the comparison table.
+
+    Returns:
+        list[str]: Descriptions of regressions beyond the threshold.
+    """
+    base_meta, base_rows = load(base_path)
+    new_meta, new_rows = load(new_path)
+    print(f"base: {base_meta.get('commit')} ({base_meta.get('timestamp')})")
+    print(f"new:  {new_meta.get('commit')} ({new_meta.get('timestamp')})")
+    print()
+    print(f"{'route':<28} {'c':>4}  " + "  ".join(f"{metric:>26}" for metric in METRICS))
+
+    regressions = []
+    for key in sorted(base_rows.keys() & new_rows.keys()):
+        route, concurrency = key
+        cells = []
+        for metric, higher_is_better in METRICS.items():
+            base, new = base_rows[key][metric], new_rows[key][metric]
+            delta = change(base, new)
+            worse = -delta if higher_is_better else delta
+            flag = "!" if worse > threshold else " "
+            cells.append(f"{base:>9.1f} -> {new:>9.1f} {delta:>+5.0%}{flag}")
+            if worse > threshold:
+                regressions.append(f"{route} c={concurrency} {metric}: {base} -> {new} ({delta:+.1%})")
+        print(f"{route:<28} {concurrency:>4}  " + "  ".join(cells))
+
+    missing = base_rows.keys() ^ new_rows.keys()
+    if missing:
+        print(f"\n{len(missing)} route/concurrency pairs are only present in one run")
+    return regressions
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base", type=Path)
+    parser.add_argument("new", type=Path)
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Allowed relative regression (default 0.10).")
+    args = parser.parse_args(argv)
+
+    regressions = compare(args.base, args.new, args.threshold)
+    if regressions:
+        print("\nRegressions:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,409 @@
+"""
+Load and latency benchmark for the `/auth/*` routes.
+
+Starts the upstream stubs (`benchmarks.stubs`) and the real application
+through its production entry point (`app.server`), drives every route with a closed-loop
+load generator at increasing concurrency, prints throughput and
+p50/p95/p99 latency, and writes the results to a JSON baseline that
+`benchmarks.compare` can diff against another run.
+
+Usage:
+    python -m benchmarks.run
+    python -m benchmarks.run --concurrency 1,16,64 --duration 5 --latency 0.02
+    python -m benchmarks.run --routes /auth/google/callback,/auth/status
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Awaitable, Callable
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+PROVIDERS = ("google", "outlook", "xero", "quickbooks")
+ROUTES = (
+    *(f"/auth/{provider}" for provider in PROVIDERS),
+    *(f"/auth/{provider}/callback" for provider in PROVIDERS),
+    "/auth/status",
+)
+
+JWT_SECRET = "benchmark-state-signing-secret-0123456789"
+INTERNAL_API_KEY = "benchmark"
+
+
+def app_env(stub_url: str) -> dict[str, str]:
+    """
+    Environment that points every upstream of the app at the stubs.
+    """
+    return {
+        "SUPABASE_URL": stub_url,
+        "SUPABASE_KEY": "benchmark",
+        "JWT_SECRET": JWT_SECRET,
+        "INTERNAL_API_KEY": INTERNAL_API_KEY,
+        "HTTP_WARMUP": "false",
+        "TOKEN_REFRESH_ENABLED": "false",
+        "GOOGLE_CLIENT_ID": "bench-google",
+        "GOOGLE_CLIENT_SECRET": "secret",
+        "GOOGLE_REDIRECT_URI": "https://bench.test/auth/google/callback",
+        "GOOGLE_TOKEN_URL": f"{stub_url}/google/token",
+        "GOOGLE_USERINFO_URL": f"{stub_url}/google/userinfo",
+        "GOOGLE_DISCOVERY_URL": f"{stub_url}/google/.well-known/openid-configuration",
+        "OUTLOOK_CLIENT_ID": "bench-outlook",
+        "OUTLOOK_CLIENT_SECRET": "secret",
+        "OUTLOOK_REDIRECT_URI": "https://bench.test/auth/outlook/callback",
+        "OUTLOOK_TOKEN_URL": f"{stub_url}/microsoft/token",
+        "OUTLOOK_USERINFO_URL": f"{stub_url}/microsoft/me",
+        "XERO_CLIENT_ID": "bench-xero",
+        "XERO_CLIENT_SECRET": "secret",
+        "XERO_REDIRECT_URI": "https://bench.test/auth/xero/callback",
+        "XERO_TOKEN_URL": f"{stub_url}/xero/token",
+        "XERO_CONNECTIONS_URL": f"{stub_url}/xero/connections",
+        "XERO_USERINFO_URL": f"{stub_url}/xero/userinfo",
+        "XERO_DISCOVERY_URL": f"{stub_url}/xero/.well-known/openid-configuration",
+        "QUICKBOOKS_CLIENT_ID": "bench-quickbooks",
+        "QUICKBOOKS_CLIENT_SECRET": "secret",
+        "QUICKBOOKS_REDIRECT_URI": "https://bench.test/auth/quickbooks/callback",
+        "QUICKBOOKS_TOKEN_URL": f"{stub_url}/intuit/token",
+        "QUICKBOOKS_USERINFO_URL": f"{stub_url}/intuit/userinfo",
+        "QUICKBOOKS_DISCOVERY_URL": f"{stub_url}/intuit/.well-known/openid_configuration",
+    }
+
+
+def stub_env(args: argparse.Namespace, stub_url: str) -> dict[str, str]:
+    env = {
+        "STUB_BASE_URL": stub_url,
+        "STUB_LATENCY": str(args.latency),
+        "STUB_JITTER": str(args.jitter),
+        "STUB_ERROR_RATE": str(args.error_rate),
+        "STUB_ID_TOKENS": "true" if args.id_tokens else "false",
+    }
+    if args.supabase_latency is not None:
+        env["STUB_LATENCY_SUPABASE"] = str(args.supabase_latency)
+    return env
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def serve(command: list[str], port: int, env: dict[str, str]):
+    """
+    Runs a server command in a subprocess for the duration of the block.
+    """
+    process = subprocess.Popen(command, cwd=ROOT, env={**os.environ, **env})
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+async def wait_ready(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while True:
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+                await asyncio.sleep(0.1)
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies: list[float], errors: int, elapsed: float) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "throughput": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+    }
+
+
+class Workload:
+    """
+    Builds the request for each benchmarked route.
+
+    Users are drawn round-robin from a fixed pool, so the in-process
+    caches see a realistic mix of hits and misses. Callbacks reuse a
+    signed state (and its nonce cookie) per user with a fresh
+    authorization code on every request.
+    """
+
+    def __init__(self, client: httpx.AsyncClient, users: int):
+        self.client = client
+        self.users = [str(uuid.uuid4()) for _ in range(users)]
+        self.states: dict[str, list[tuple[str, str]]] = {}
+        self._counter = 0
+
+    def _next_user(self) -> str:
+        self._counter += 1
+        return self.users[self._counter % len(self.users)]
+
+    async def prepare(self, provider: str, count: int):
+        """
+        Runs the login redirect for a sample of users to collect signed
+        states and their nonce cookies for the callback benchmark.
+        """
+        states = []
+        for user_id in self.users[:count]:
+            resp = await self.client.get(f"/auth/{provider}", params={"state": f"{user_id}/bench"})
+            location = httpx.URL(resp.headers["location"])
+            cookie = resp.headers["set-cookie"].split(";", 1)[0]
+            states.append((location.params["state"], cookie))
+        self.states[provider] = states
+
+    def request(self, route: str) -> Callable[[], Awaitable[httpx.Response]]:
+        parts = route.strip("/").split("/")
+        if route == "/auth/status":
+            return lambda: self.client.get(route, params={"user_id": self._next_user()})
+        if len(parts) == 2:
+            return lambda: self.client.get(route, params={"state": f"{self._next_user()}/bench"})
+
+        provider = parts[1]
+
+        def _callback():
+            self._counter += 1
+            state, cookie = self.states[provider][self._counter % len(self.states[provider])]
+            params = {"code": uuid.uuid4().hex, "state": state}
+            if provider == "quickbooks":
+                params["realmId"] = "bench-realm"
+            return self.client.get(route, params=params, headers={"Cookie": cookie})
+        return _callback
+
+    @staticmethod
+    def expected_status(route: str) -> int:
+        return 200 if route == "/auth/status" else 307
+
+
+async def measure(
+        send: Callable[[], Awaitable[httpx.Response]],
+        expected_status: int,
+        concurrency: int,
+        duration: float) -> dict:
+    """
+    Runs `concurrency` closed-loop workers for `duration` seconds.
+    """
+    latencies: list[float] = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def _worker():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                resp = await send()
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            if resp.status_code == expected_status:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(_worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+async def benchmark(args: argparse.Namespace, app_url: str, windows: list[tuple[float, float]] | None = None) -> list[dict]:
+    """
+    Benchmarks each route at each concurrency level. The wall-clock span
+    of every measured (not warm-up) run is appended to `windows`, aligned
+    with the returned rows.
+    """
+    levels = [int(level) for level in args.concurrency.split(",")]
+    routes = args.routes.split(",") if args.routes else list(ROUTES)
+    limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+    results = []
+
+    async with httpx.AsyncClient(base_url=app_url, limits=limits, timeout=30.0) as client:
+        workload = Workload(client, args.users)
+        for route in routes:
+            parts = route.strip("/").split("/")
+            if parts[-1] == "callback":
+                await workload.prepare(parts[1], min(args.users, 100))
+            send = workload.request(route)
+            expected = workload.expected_status(route)
+            await measure(send, expected, min(levels), args.warmup)
+            for concurrency in levels:
+                started_at = time.time()
+                stats = await measure(send, expected, concurrency, args.duration)
+                if windows is not None:
+                    windows.append((started_at, time.time()))
+                results.append({"route": route, "concurrency": concurrency, **stats})
+                print(
+                    f"{route:<28} c={concurrency:<4} {stats['throughput']:>9.1f} req/s  "
+                    f"p50 {stats['p50_ms']:>8.2f}ms  p95 {stats['p95_ms']:>8.2f}ms  "
+                    f"p99 {stats['p99_ms']:>8.2f}ms  errors {stats['errors']}",
+                    flush=True
+                )
+    return results
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default="1,8,32,64", help="Comma-separated concurrency levels.")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per route and level.")
+    parser.add_argument("--warmup", type=float, default=1.0, help="Untimed seconds before each route.")
+    parser.add_argument("--routes", default="", help="Comma-separated subset of routes.")
+    parser.add_argument("--users", type=int, default=1000, help="Size of the simulated user pool.")
+    parser.add_argument("--latency", type=float, default=0.05, help="Injected upstream latency (s).")
+    parser.add_argument("--supabase-latency", type=float, default=None, help="Supabase latency override (s).")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Uniform latency jitter (s).")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of upstream 503s.")
+    parser.add_argument("--no-id-tokens", dest="id_tokens", action="store_false",
+                        help="Omit id_tokens so callbacks call the userinfo endpoints.")
+    parser.add_argument("--write-behind", action="store_true",
+                        help="Journal connections and persist them in the background.")
+    parser.add_argument("--rate-limit", action="store_true",
+                        help="Keep admission control on (all load comes from one IP).")
+    parser.add_argument("--fail-on-block", action="store_true",
+                        help="Run the app with loop diagnostics and exit 1 if a measured route blocks the event loop.")
+    parser.add_argument("--block-threshold", type=float, default=0.1,
+                        help="Event loop stall (s) counted as a block with --fail-on-block.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="App worker processes (WEB_CONCURRENCY); 0 sizes to the available CPUs.")
+    parser.add_argument("--output", type=Path, default=None,
+                        help="Result file (default: benchmarks/results/<commit>.json).")
+    return parser.parse_args(argv)
+
+
+def run(args: argparse.Namespace) -> list[dict]:
+    """
+    Starts the stubs and the app (through the production entry point
+    `app.server`) and benchmarks it.
+    """
+    stub_port, app_port = free_port(), free_port()
+    stub_url = f"http://127.0.0.1:{stub_port}"
+    stub_command = [
+        sys.executable, "-m", "uvicorn", "benchmarks.stubs:app",
+        "--host", "127.0.0.1", "--port", str(stub_port),
+        "--log-level", "warning", "--no-access-log",
+    ]
+    app_server_env = {
+        **app_env(stub_url),
+        "HOST": "127.0.0.1",
+        "PORT": str(app_port),
+        "WEB_CONCURRENCY": str(args.workers),
+        "WRITE_BEHIND_ENABLED": "true" if args.write_behind else "false",
+        "WRITE_BEHIND_JOURNAL_PATH": os.path.join(tempfile.mkdtemp(prefix="bench-"), "journal.sqlite3"),
+        "RATE_LIMIT_ENABLED": "true" if args.rate_limit else "false",
+    }
+    event_log = None
+    if args.fail_on_block:
+        event_log = Path(tempfile.mkdtemp(prefix="bench-")) / "diagnostics.jsonl"
+        app_server_env.update({
+            "DIAGNOSTICS_ENABLED": "true",
+            "DIAGNOSTICS_EVENT_LOG": str(event_log),
+            "DIAGNOSTICS_BLOCK_THRESHOLD": str(args.block_threshold),
+        })
+
+    windows: list[tuple[float, float]] = []
+    with serve(stub_command, stub_port, stub_env(args, stub_url)), \
+            serve([sys.executable, "-m", "app.server"], app_port, app_server_env) as app_url:
+        asyncio.run(wait_ready(f"{stub_url}/healthz"))
+        asyncio.run(wait_ready(f"{app_url}/metrics"))
+        results = asyncio.run(benchmark(args, app_url, windows))
+    if event_log is not None:
+        attribute_loop_blocks(results, windows, event_log)
+    return results
+
+
+def attribute_loop_blocks(results: list[dict], windows: list[tuple[float, float]], event_log: Path):
+    """
+    Counts the app's event loop block events inside each measured run
+    (`loop_blocks` per result row) and prints where the loop was held.
+    Blocks during start-up and warm-up are ignored.
+    """
+    blocks = []
+    if event_log.exists():
+        for line in event_log.read_text().splitlines():
+            event = json.loads(line)
+            if event.get("event") == "event_loop_blocked":
+                blocks.append(event)
+    for row, (started_at, finished_at) in zip(results, windows):
+        row_blocks = [block for block in blocks if started_at <= block["at"] <= finished_at]
+        row["loop_blocks"] = len(row_blocks)
+        for block in row_blocks:
+            print(
+                f"Event loop blocked for {block['duration'] or block['stalled_for']:.3f}s "
+                f"during {row['route']} c={row['concurrency']}:",
+                *block["stack"][-4:], sep="\n", flush=True
+            )
+
+
+def main(argv: list[str] | None = None):
+    args = parse_args(argv)
+    results = run(args)
+
+    commit = git_commit()
+    report = {
+        "meta": {
+            "commit": commit,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "settings": {
+                key: (str(value) if isinstance(value, Path) else value)
+                for key, value in vars(args).items()
+            },
+        },
+        "results": results,
+    }
+    output = args.output or RESULTS_DIR / f"{commit or 'local'}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2) + "\n")
+    print(f"Saved {output}")
+
+    if args.fail_on_block:
+        blocked = sum(row["loop_blocks"] for row in results)
+        if blocked:
+            print(f"FAIL: the event loop was blocked {blocked} time(s)")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
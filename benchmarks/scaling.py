@@ -0,0 +1,64 @@
+"""
+Throughput scaling of the production server across worker counts.
+
+Runs `benchmarks.run` once per worker count and prints throughput per
+route next to the single-worker figure. Scaling stops being linear once
+workers exceed the CPUs available to the machine (or to the load
+generator, which runs in this process).
+
+Usage:
+    python -m benchmarks.scaling
+    python -m benchmarks.scaling --workers 1,2,4 --concurrency 64 --routes /auth/status
+"""
+import argparse
+import json
+from datetime import datetime, timezone
+from pathlib import Path
+
+from benchmarks.run import RESULTS_DIR, git_commit, parse_args, run
+from app.server import available_cpus
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4", help="Comma-separated worker counts.")
+    parser.add_argument("--output", type=Path, default=None,
+                        help="Result file (default: benchmarks/results/scaling-<commit>.json).")
+    args, run_argv = parser.parse_known_args(argv)
+    if not any(arg.startswith("--concurrency") for arg in run_argv):
+        run_argv += ["--concurrency", "64"]
+    run_args = parse_args(run_argv)
+
+    runs = {}
+    for workers in (int(count) for count in args.workers.split(",")):
+        print(f"--- {workers} worker(s)")
+        run_args.workers = workers
+        runs[workers] = run(run_args)
+
+    base_workers = min(runs)
+    base = {(row["route"], row["concurrency"]): row["throughput"] for row in runs[base_workers]}
+    print(f"\n{'route':<28} {'c':>4} {'workers':>8} {'req/s':>10} {'speedup':>8}")
+    for workers, rows in runs.items():
+        for row in rows:
+            baseline = base.get((row["route"], row["concurrency"])) or 0
+            speedup = row["throughput"] / baseline if baseline else 0.0
+            print(f"{row['route']:<28} {row['concurrency']:>4} {workers:>8} {row['throughput']:>10.1f} {speedup:>7.2f}x")
+
+    commit = git_commit()
+    report = {
+        "meta": {
+            "commit": commit,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "available_cpus": available_cpus(),
+            "settings": {key: value for key, value in vars(run_args).items() if key not in ("workers", "output")},
+        },
+        "runs": [{"workers": workers, "results": rows} for workers, rows in runs.items()],
+    }
+    output = args.output or RESULTS_DIR / f"scaling-{commit or 'local'}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2) + "\n")
+    print(f"Saved {output}")
+
+
+if __name__ == "__main__":
+    main()
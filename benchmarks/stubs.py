@@ -0,0 +1,251 @@
+"""
+Local stand-ins for the OAuth providers and Supabase PostgREST.
+
+One FastAPI app serves every upstream the service talks to, each under
+its own path prefix (`/google`, `/microsoft`, `/xero`, `/intuit`) plus
+`/rest/v1` for Supabase. Responses carry the fields the callbacks read,
+and id_tokens are signed with a key published at `/jwks`, so local
+id_token verification runs exactly as it does in production.
+
+Behaviour is configured through environment variables:
+
+    STUB_LATENCY            Added latency per request, in seconds (default 0.05).
+    STUB_LATENCY_<GROUP>    Per-upstream override; GROUP is GOOGLE, MICROSOFT,
+                            XERO, INTUIT or SUPABASE.
+    STUB_JITTER             Uniform +/- jitter around the latency (default 0).
+    STUB_ERROR_RATE         Fraction of requests answered with 503 (default 0).
+    STUB_ERROR_RATE_<GROUP> Per-upstream override.
+    STUB_ID_TOKENS          "false" omits id_tokens, forcing userinfo calls.
+    STUB_BASE_URL           URL the stub is reachable at, used for issuers.
+
+Run with:
+    uvicorn benchmarks.stubs:app --port 9100
+"""
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+from jwt.algorithms import RSAAlgorithm
+
+GROUPS = ("google", "microsoft", "xero", "intuit", "supabase")
+
+BASE_URL = os.getenv("STUB_BASE_URL", "http://127.0.0.1:9100")
+ID_TOKENS = os.getenv("STUB_ID_TOKENS", "true").lower() == "true"
+JITTER = float(os.getenv("STUB_JITTER", "0"))
+
+
+def _per_group(name: str, default: str) -> dict[str, float]:
+    value = float(os.getenv(name, default))
+    return {
+        group: float(os.getenv(f"{name}_{group.upper()}", value))
+        for group in GROUPS
+    }
+
+
+LATENCY = _per_group("STUB_LATENCY", "0.05")
+ERROR_RATE = _per_group("STUB_ERROR_RATE", "0")
+
+# Audiences of the id_tokens; the benchmark runner passes the same
+# client ids to the app.
+CLIENT_IDS = {
+    "google": os.getenv("GOOGLE_CLIENT_ID", "bench-google"),
+    "xero": os.getenv("XERO_CLIENT_ID", "bench-xero"),
+    "intuit": os.getenv("QUICKBOOKS_CLIENT_ID", "bench-quickbooks"),
+}
+
+SIGNING_KEY = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+KID = "bench"
+JWK = {**json.loads(RSAAlgorithm.to_jwk(SIGNING_KEY.public_key())), "kid": KID, "alg": "RS256", "use": "sig"}
+
+app = FastAPI(title="Benchmark upstream stubs")
+
+
+async def upstream(group: str) -> Response | None:
+    """
+    Applies the group's injected latency and returns an error response
+    when the request is picked to fail.
+    """
+    delay = LATENCY[group]
+    if JITTER:
+        delay = max(0.0, delay + random.uniform(-JITTER, JITTER))
+    if delay:
+        await asyncio.sleep(delay)
+    if ERROR_RATE[group] and random.random() < ERROR_RATE[group]:
+        return JSONResponse({"error": "temporarily_unavailable"}, status_code=503)
+    return None
+
+
+def id_token(group: str, email: str) -> str:
+    now = int(time.time())
+    claims = {
+        "iss": f"{BASE_URL}/{group}",
+        "aud": CLIENT_IDS[group],
+        "sub": uuid.uuid4().hex,
+        "email": email,
+        "given_name": "Bench",
+        "family_name": "User",
+        "iat": now,
+        "exp": now + 3600,
+    }
+    return jwt.encode(claims, SIGNING_KEY, algorithm="RS256", headers={"kid": KID})
+
+
+def token_response(group: str) -> dict:
+    tokens = {
+        "access_token": uuid.uuid4().hex,
+        "refresh_token": uuid.uuid4().hex,
+        "token_type": "Bearer",
+        "expires_in": 3600,
+    }
+    if ID_TOKENS and group in CLIENT_IDS:
+        tokens["id_token"] = id_token(group, "bench@example.com")
+    return tokens
+
+
+@app.get("/healthz")
+async def healthz():
+    return {"ok": True}
+
+
+@app.get("/jwks")
+async def jwks():
+    return {"keys": [JWK]}
+
+
+@app.get("/{group}/.well-known/openid-configuration")
+@app.get("/{group}/.well-known/openid_configuration")
+async def discovery(group: str):
+    return {"issuer": f"{BASE_URL}/{group}", "jwks_uri": f"{BASE_URL}/jwks"}
+
+
+@app.post("/{group}/token")
+async def token(group: str):
+    return await upstream(group) or token_response(group)
+
+
+@app.get("/google/userinfo")
+async def google_userinfo():
+    return await upstream("google") or {
+        "id": uuid.uuid4().hex,
+        "email": "bench@example.com",
+        "given_name": "Bench",
+        "family_name": "User",
+        "picture": None,
+    }
+
+
+@app.get("/microsoft/me")
+async def microsoft_me():
+    return await upstream("microsoft") or {
+        "id": uuid.uuid4().hex,
+        "userPrincipalName": "bench@example.com",
+        "displayName": "Bench User",
+        "givenName": "Bench",
+        "surname": "User",
+    }
+
+
+@app.get("/xero/connections")
+async def xero_connections():
+    return await upstream("xero") or [
+        {"id": uuid.uuid4().hex, "tenantId": uuid.uuid4().hex, "tenantName": "Bench Ltd", "tenantType": "ORGANISATION"},
+        {"id": uuid.uuid4().hex, "tenantId": uuid.uuid4().hex, "tenantName": "Bench Holdings", "tenantType": "ORGANISATION"},
+    ]
+
+
+@app.get("/xero/userinfo")
+async def xero_userinfo():
+    return await upstream("xero") or {"email": "bench@example.com"}
+
+
+@app.get("/intuit/userinfo")
+async def intuit_userinfo():
+    return await upstream("intuit") or {
+        "email": "bench@example.com",
+        "givenName": "Bench",
+        "familyName": "User",
+    }
+
+
+def user_row(user_id: str) -> dict:
+    return {
+        "id": user_id,
+        "user_hash": "bench",
+        "name": "Bench User",
+        "email": "bench@example.com",
+        "status": "active",
+        "email_provider": "google",
+        "invoice_provider": "xero",
+        "is_email_service_connected": True,
+        "is_invoice_service_connected": True,
+    }
+
+
+def _filter_values(value: str) -> list[str]:
+    """
+    Extracts the values of a PostgREST `eq.` or `in.(...)` filter.
+    """
+    if value.startswith("eq."):
+        return [value[3:]]
+    if value.startswith("in.(") and value.endswith(")"):
+        return [item.strip('"') for item in value[4:-1].split(",") if item]
+    return []
+
+
+@app.get("/rest/v1/users")
+async def select_users(request: Request):
+    error = await upstream("supabase")
+    if error:
+        return error
+    params = request.query_params
+    if "and" in params:
+        # user_exists: and=(id.eq.<id>,user_hash.eq.<hash>)
+        user_id = params["and"].strip("()").split(",")[0].removeprefix("id.eq.")
+        return [{"id": user_id}]
+
+    rows = [user_row(user_id) for user_id in _filter_values(params.get("id", ""))]
+    for session_id in _filter_values(params.get("session_id", "")):
+        rows.append({**user_row(str(uuid.uuid5(uuid.NAMESPACE_OID, session_id))), "session_id": session_id})
+    if "session_id" in params.get("select", ""):
+        rows = [{"session_id": None, **row} for row in rows]
+
+    if request.headers.get("accept") == "application/vnd.pgrst.object+json":
+        if len(rows) != 1:
+            return JSONResponse({"code": "PGRST116"}, status_code=406)
+        return rows[0]
+    return rows
+
+
+@app.post("/rest/v1/rpc/connect_provider")
+async def connect_provider(request: Request):
+    error = await upstream("supabase")
+    if error:
+        return error
+    params = await request.json()
+    return user_row(params["p_user_id"])
+
+
+@app.post("/rest/v1/rpc/sync_xero_tenants")
+async def sync_xero_tenants(request: Request):
+    error = await upstream("supabase")
+    if error:
+        return error
+    params = await request.json()
+    return sum(len(tenants) for tenants in params["p_tenants"].values())
+
+
+@app.get("/rest/v1/{table}")
+async def select_rows(table: str):
+    return await upstream("supabase") or []
+
+
+@app.api_route("/rest/v1/{table}", methods=["POST", "PATCH", "DELETE"])
+async def write_rows(table: str):
+    return await upstream("supabase") or Response(status_code=204)
@@ -0,0 +1,6 @@
+import os
+
+# app.services.oauth_state signs with JWT_SECRET at import time
+os.environ.setdefault("JWT_SECRET", "test-state-signing-secret-32-bytes")
+os.environ.setdefault("SUPABASE_URL", "https://supabase.test")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
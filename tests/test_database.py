@@ -0,0 +1,26 @@
+from urllib.parse import quote_plus
+
+from app.services.database import chunk_by_length, in_filter
+
+
+def encoded(values) -> int:
+    return len(quote_plus(in_filter(values)))
+
+
+def test_chunks_stay_within_the_encoded_budget():
+    values = [f"{i:08d}-4b1e-4f3a-9c1d-{i:012d}" for i in range(2000)]
+    chunks = chunk_by_length(values, 6000)
+    assert [value for chunk in chunks for value in chunk] == values
+    assert all(encoded(chunk) <= 6000 for chunk in chunks)
+    # each chunk is as full as the budget allows
+    assert all(encoded(chunk + [following[0]]) > 6000 for chunk, following in zip(chunks, chunks[1:]))
+
+
+def test_counts_escaped_characters():
+    values = ['a, "b" \\ c'] * 300
+    assert all(encoded(chunk) <= 500 for chunk in chunk_by_length(values, 500))
+
+
+def test_oversized_value_gets_its_own_chunk():
+    assert chunk_by_length(["x" * 100, "y"], 50) == [["x" * 100], ["y"]]
+    assert chunk_by_length([], 50) == []
@@ -0,0 +1,55 @@
+import asyncio
+import re
+
+from app.services.disconnect import DisconnectService
+from app.services.providers import PROVIDERS
+
+FLAG = "is_email_service_connected"
+
+
+class FakeDatabase:
+    """
+    Provider rows in memory; records updates of the `users` table.
+    """
+
+    def __init__(self, tables: dict[str, list[dict]]):
+        self.tables = tables
+        self.updates = []
+
+    async def select(self, table, columns, filters):
+        user_ids = set(re.findall(r'"([^"]*)"', filters["user_id"]))
+        rows = [row for row in self.tables.get(table, []) if row["user_id"] in user_ids]
+        if filters.get("refresh_token") == "not.is.null":
+            rows = [row for row in rows if row["refresh_token"] is not None]
+        return rows
+
+    async def update(self, table, values, filters):
+        self.updates.append((table, values, sorted(re.findall(r'"([^"]*)"', filters["id"]))))
+
+
+def reset_flags(tables, results, force=False):
+    service = DisconnectService(database=FakeDatabase(tables))
+    reset = asyncio.run(service._reset_flags(["google"], results, force))
+    return reset, service.db.updates
+
+
+def test_peer_connection_keeps_the_flag():
+    tables = {PROVIDERS["outlook"].table: [{"user_id": "u1", "refresh_token": "r"}]}
+    reset, updates = reset_flags(tables, {"u1": {"google": "revoked"}, "u2": {"google": "revoked"}})
+
+    assert reset == {FLAG: ["u2"]}
+    assert updates == [("users", {FLAG: False}, ["u2"])]
+
+
+def test_peer_revoked_by_the_health_check_does_not_keep_the_flag():
+    tables = {PROVIDERS["outlook"].table: [{"user_id": "u1", "refresh_token": None}]}
+    reset, _ = reset_flags(tables, {"u1": {"google": "revoked"}})
+
+    assert reset == {FLAG: ["u1"]}
+
+
+def test_failed_revocation_keeps_the_flag_unless_forced():
+    results = {"u1": {"google": "failed"}}
+
+    assert reset_flags({}, results) == ({}, [])
+    assert reset_flags({}, results, force=True)[0] == {FLAG: ["u1"]}
@@ -0,0 +1,144 @@
+import asyncio
+import re
+
+import pytest
+
+import app.config as config
+from app.services.health_check import ConnectionHealthCheck
+from app.services.leader import DatabaseLease
+from app.services.providers import PROVIDERS
+from app.services.tokens import TokenRefreshError
+
+
+class FakeDatabase:
+    """
+    Provider rows in memory plus the lease and token RPCs; `leased`
+    tells whether another process holds the lease.
+    """
+
+    def __init__(self, tables: dict[str, list[dict]] | None = None, leased: bool = False):
+        self.tables = tables or {}
+        self.leased = leased
+        self.calls = []
+
+    async def rpc(self, function, params):
+        self.calls.append(function)
+        if function == "try_acquire_lease":
+            return not self.leased
+        if function == "store_refreshed_tokens":
+            return [row["user_id"] for row in params["p_rows"]]
+        return None
+
+    async def select(self, table, columns, filters):
+        rows = [row for row in self.tables.get(table, []) if row["refresh_token"] is not None]
+        if filters.get("user_id", "").startswith("gt."):
+            return []
+        if filters.get("user_id", "").startswith("in."):
+            user_ids = set(re.findall(r'"([^"]*)"', filters["user_id"]))
+            rows = [row for row in rows if row["user_id"] in user_ids]
+        return rows
+
+    async def update(self, table, values, filters):
+        self.calls.append(("update", table, values, sorted(re.findall(r'"([^"]*)"', next(iter(filters.values()))))))
+
+
+class FakeTokens:
+    def __init__(self, revoked: set[str] = frozenset()):
+        self.revoked = revoked
+
+    async def refresh(self, provider, refresh_token):
+        if refresh_token in self.revoked:
+            raise TokenRefreshError(provider, 400, "invalid_grant")
+        return {"access_token": f"new-{refresh_token}", "expires_in": 3600}
+
+    def remember(self, provider, user_id, record):
+        pass
+
+    def forget(self, provider, user_id):
+        pass
+
+
+class FakeScheduler:
+    def unschedule(self, provider, user_id):
+        pass
+
+
+class FakeStatuses:
+    def invalidate(self, user_id):
+        pass
+
+
+class FakeEvents:
+    def __init__(self):
+        self.events = []
+
+    def publish(self, event):
+        self.events.append(event)
+
+
+def make_check(tmp_path, database, tokens=None) -> ConnectionHealthCheck:
+    return ConnectionHealthCheck(
+        tokens=tokens or FakeTokens(), database=database, statuses=FakeStatuses(),
+        scheduler=FakeScheduler(), events=FakeEvents(), checkpoint_path=str(tmp_path / "checkpoint.json")
+    )
+
+
+def test_run_refuses_while_another_process_holds_the_lease(tmp_path):
+    database = FakeDatabase(leased=True)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(make_check(tmp_path, database).run(["xero"]))
+    assert database.calls == ["try_acquire_lease"]
+
+
+def test_run_releases_the_lease(tmp_path):
+    database = FakeDatabase()
+
+    asyncio.run(make_check(tmp_path, database).run(["xero"]))
+
+    assert database.calls[0] == "try_acquire_lease"
+    assert database.calls[-1] == "release_lease"
+
+
+def test_losing_the_lease_cancels_the_job():
+    database = FakeDatabase()
+    lease = DatabaseLease("job", ttl=0.03, database=database)
+
+    async def job():
+        assert await lease.try_acquire()
+        database.leased = True
+        async with lease.hold():
+            await asyncio.sleep(1)
+
+    async def scenario():
+        return (await asyncio.gather(asyncio.create_task(job()), return_exceptions=True))[0]
+
+    assert isinstance(asyncio.run(scenario()), asyncio.CancelledError)
+    assert database.calls[-1] == "release_lease"
+
+
+def test_revoked_connections_are_cleared_and_flags_recomputed(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "HEALTH_CHECK_RATE", 1000)
+    xero, quickbooks = PROVIDERS["xero"], PROVIDERS["quickbooks"]
+    database = FakeDatabase({
+        xero.table: [{"user_id": f"u{i}", "refresh_token": f"r{i}"} for i in range(1, 5)],
+        quickbooks.table: [
+            {"user_id": "u3", "refresh_token": "live"},
+            # revoked by an earlier run: row kept, tokens cleared
+            {"user_id": "u4", "refresh_token": None},
+        ],
+    })
+    check = make_check(tmp_path, database, FakeTokens(revoked={"r2", "r3", "r4"}))
+
+    progress = asyncio.run(check.run(["xero"]))
+
+    assert progress["providers"]["xero"] == {
+        "last_user_id": "u4", "done": True, "checked": 4, "healthy": 1, "revoked": 3, "error": 0
+    }
+    assert "store_refreshed_tokens" in database.calls
+    updates = [call[1:] for call in database.calls if call[0] == "update"]
+    assert (xero.table, {"access_token": None, "refresh_token": None, "expires_at": None},
+            ["u2", "u3", "u4"]) in updates
+    assert ("users", {xero.flag: False}, ["u2", "u4"]) in updates
+    assert [event["user_id"] for event in check.events.events] == ["u2", "u4"]
+    assert check.load_checkpoint()["finished_at"] is not None
@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+from app.services.idempotency import CallbackDeduplicator
+
+
+class Handler:
+    """
+    Counts its runs; fails while `failures` is positive.
+    """
+
+    def __init__(self, failures: int = 0):
+        self.runs = 0
+        self.failures = failures
+
+    async def __call__(self):
+        self.runs += 1
+        await asyncio.sleep(0.01)
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("token exchange failed")
+        return {"run": self.runs}
+
+
+def test_concurrent_duplicates_share_the_exchange():
+    deduplicator, handler = CallbackDeduplicator(), Handler()
+
+    async def scenario():
+        return await asyncio.gather(*(deduplicator.run("google", "code", "state", handler) for _ in range(3)))
+
+    assert asyncio.run(scenario()) == [{"run": 1}] * 3
+    assert handler.runs == 1
+
+
+def test_completed_callbacks_are_remembered():
+    deduplicator, handler = CallbackDeduplicator(), Handler()
+
+    asyncio.run(deduplicator.run("google", "code", "state", handler))
+    assert asyncio.run(deduplicator.run("google", "code", "state", handler)) == {"run": 1}
+    asyncio.run(deduplicator.run("google", "other-code", "state", handler))
+    asyncio.run(deduplicator.run("outlook", "code", "state", handler))
+
+    assert handler.runs == 3
+
+
+def test_failures_are_not_remembered():
+    deduplicator, handler = CallbackDeduplicator(), Handler(failures=1)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(deduplicator.run("xero", "code", "state", handler))
+    assert asyncio.run(deduplicator.run("xero", "code", "state", handler)) == {"run": 2}
+    assert deduplicator.stats()["in_flight"] == 0
+
+
+def test_none_results_count_as_completed():
+    deduplicator = CallbackDeduplicator()
+    runs = []
+
+    async def handler():
+        runs.append(1)
+
+    asyncio.run(deduplicator.run("quickbooks", "code", "state", handler))
+    asyncio.run(deduplicator.run("quickbooks", "code", "state", handler))
+
+    assert runs == [1]
@@ -0,0 +1,107 @@
+import asyncio
+import json
+import time
+
+import httpx
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+import app.config as config
+import app.services.jwks as jwks
+from app.services.jwks import IdTokenError, JwksCache
+
+ISSUER = "https://accounts.google.com"
+CLIENT_ID = "client-id"
+
+
+def make_key(kid: str) -> tuple[rsa.RSAPrivateKey, dict]:
+    private = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    public = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private.public_key()))
+    return private, {**public, "kid": kid, "alg": "RS256", "use": "sig"}
+
+
+def id_token(private, kid: str, **claims) -> str:
+    now = int(time.time())
+    payload = {"iss": ISSUER, "aud": CLIENT_ID, "sub": "123", "iat": now, "exp": now + 300, **claims}
+    return jwt.encode(payload, private, algorithm="RS256", headers={"kid": kid})
+
+
+class Provider:
+    """
+    Serves a discovery document and the current key set; counts fetches.
+    """
+
+    def __init__(self, *keys: dict):
+        self.keys = list(keys)
+        self.fetches = 0
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("openid-configuration"):
+            return httpx.Response(200, json={"issuer": ISSUER, "jwks_uri": "https://idp.test/certs"})
+        self.fetches += 1
+        return httpx.Response(200, json={"keys": self.keys})
+
+    def get(self, group: str) -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=httpx.MockTransport(self.handler))
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    google = jwks.OPENID_PROVIDERS["google"]
+    monkeypatch.setitem(jwks.OPENID_PROVIDERS, "google", google._replace(
+        client_id=CLIENT_ID, discovery_url="https://idp.test/.well-known/openid-configuration"
+    ))
+    clock = Clock()
+    monkeypatch.setattr(jwks.time, "monotonic", clock.monotonic)
+    return clock
+
+
+def verify(cache, token):
+    return asyncio.run(cache.verify("google", token))
+
+
+def test_verifies_against_cached_keys(clock):
+    private, public = make_key("k1")
+    provider = Provider(public)
+    cache = JwksCache(provider)
+
+    assert verify(cache, id_token(private, "k1", email="a@example.com"))["email"] == "a@example.com"
+    verify(cache, id_token(private, "k1"))
+    assert provider.fetches == 1
+
+
+def test_rejects_another_audience_or_signer(clock):
+    private, public = make_key("k1")
+    forger, _ = make_key("k1")
+    cache = JwksCache(Provider(public))
+
+    with pytest.raises(IdTokenError):
+        verify(cache, id_token(private, "k1", aud="someone-else"))
+    with pytest.raises(IdTokenError):
+        verify(cache, id_token(forger, "k1"))
+
+
+def test_unknown_kid_reloads_at_most_once_per_interval(clock):
+    old, old_public = make_key("k1")
+    new, new_public = make_key("k2")
+    provider = Provider(old_public)
+    cache = JwksCache(provider)
+    verify(cache, id_token(old, "k1"))
+    provider.keys = [new_public]
+
+    with pytest.raises(IdTokenError):
+        verify(cache, id_token(new, "k2"))
+    assert provider.fetches == 1
+
+    clock.now += config.JWKS_MIN_REFRESH_INTERVAL
+    assert verify(cache, id_token(new, "k2"))["sub"] == "123"
+    assert provider.fetches == 2
@@ -0,0 +1,59 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+
+from app.services.metrics import ARCHIVE, Counter, Gauge, MultiprocessMetrics, Registry
+
+
+def exited_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def make_registry():
+    registry = Registry()
+    requests = registry.register(Counter("requests_total", "Requests."))
+    registry.register(Gauge("in_flight", "In flight."))
+    return registry, requests
+
+
+def write(directory, name, snapshot):
+    with open(os.path.join(directory, name), "w") as f:
+        json.dump(snapshot, f)
+
+
+def test_start_folds_exited_workers_into_the_archive(tmp_path):
+    registry, requests = make_registry()
+    requests.inc()
+    pid = exited_pid()
+    write(tmp_path, f"{pid}.json", {"requests_total": [[[], 3.0]], "in_flight": [[[], 4.0]]})
+    write(tmp_path, ARCHIVE, {"requests_total": [[[], 2.0]]})
+    metrics = MultiprocessMetrics(registry, str(tmp_path), interval=60)
+
+    async def scenario():
+        await metrics.start()
+        try:
+            return await metrics.render()
+        finally:
+            await metrics.stop()
+
+    rendered = asyncio.run(scenario())
+
+    assert not os.path.exists(tmp_path / f"{pid}.json")
+    assert json.loads((tmp_path / ARCHIVE).read_text()) == {"requests_total": [[[], 5.0]]}
+    assert "requests_total 6.0" in rendered
+    assert "\nin_flight" not in rendered
+
+
+def test_without_a_directory_only_this_worker_is_rendered(tmp_path):
+    registry, requests = make_registry()
+    requests.inc()
+    write(tmp_path, f"{exited_pid()}.json", {"requests_total": [[[], 3.0]]})
+    metrics = MultiprocessMetrics(registry, "", interval=60)
+
+    asyncio.run(metrics.start())
+
+    assert "requests_total 1.0" in asyncio.run(metrics.render())
@@ -0,0 +1,87 @@
+import asyncio
+import time
+
+import jwt
+import pytest
+from fastapi import HTTPException
+
+import app.config as config
+from app.api.dependencies import get_login_user
+from app.services.oauth_state import OAuthStateError, OAuthStateSigner, OAuthUser, oauth_state
+
+USER = OAuthUser("3f0c1c1e-8f51-4e3b-9a57-6f2d1b0c9e11", "hash")
+SECRET = "state-signing-secret-of-32-bytes!"
+
+
+@pytest.fixture
+def signer():
+    return OAuthStateSigner(SECRET)
+
+
+def test_round_trip(signer):
+    token, nonce = signer.issue(USER)
+    assert signer.verify(token, nonce, bind=True) == USER
+
+
+def test_state_is_bound_to_the_nonce_cookie(signer):
+    token, _ = signer.issue(USER)
+    with pytest.raises(OAuthStateError):
+        signer.verify(token, "another-nonce", bind=True)
+    with pytest.raises(OAuthStateError):
+        signer.verify(token, None, bind=True)
+    assert signer.verify(token, None, bind=False) == USER
+
+
+def test_rejects_a_state_signed_with_another_secret(signer):
+    token, nonce = OAuthStateSigner(SECRET[::-1]).issue(USER)
+    with pytest.raises(OAuthStateError):
+        signer.verify(token, nonce, bind=True)
+
+
+def test_rejects_a_tampered_state(signer):
+    token, nonce = signer.issue(USER)
+    header, payload, signature = token.split(".")
+    tampered = ".".join((header, payload, signature[::-1]))
+    with pytest.raises(OAuthStateError):
+        signer.verify(tampered, nonce, bind=True)
+
+
+def test_rejects_an_expired_state(signer, monkeypatch):
+    monkeypatch.setattr(config, "OAUTH_STATE_TTL", -1)
+    token, nonce = signer.issue(USER)
+    with pytest.raises(OAuthStateError):
+        signer.verify(token, nonce, bind=True)
+
+
+def test_rejects_a_token_issued_for_another_purpose(signer):
+    token = jwt.encode(
+        {"sub": USER.user_id, "nonce": "n", "exp": int(time.time()) + 60, "purpose": "session"},
+        SECRET,
+        algorithm=config.JWT_ALGORITHM
+    )
+    with pytest.raises(OAuthStateError):
+        signer.verify(token, "n", bind=True)
+
+
+def test_requires_a_secret():
+    with pytest.raises(RuntimeError):
+        OAuthStateSigner("")
+    with pytest.raises(RuntimeError):
+        OAuthStateSigner(None)
+
+
+def test_tells_signed_and_raw_states_apart(signer):
+    token, _ = signer.issue(USER)
+    assert OAuthStateSigner.is_signed(token)
+    assert not OAuthStateSigner.is_signed(USER.state)
+
+
+def test_login_does_not_accept_a_signed_state():
+    class Users:
+        async def user_exists(self, user_id, user_hash):
+            return False, 404, "User not found"
+
+    token, _ = oauth_state.issue(USER)
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(get_login_user(token, Users()))
+    assert error.value.status_code == 404
@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+
+import app.services.rate_limit as rate_limit
+from app.middleware import request_user_id
+from app.services.oauth_state import OAuthUser, cookie_name, oauth_state
+from app.services.rate_limit import AdmissionControl, LocalBuckets
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock.monotonic)
+    return clock
+
+
+def take(buckets, key, rate=1.0, burst=2.0):
+    return asyncio.run(buckets.take(key, rate, burst))
+
+
+def test_bucket_admits_a_burst_then_refills(clock):
+    buckets = LocalBuckets(maxsize=10)
+
+    assert take(buckets, "a") == 0
+    assert take(buckets, "a") == 0
+    assert take(buckets, "a") == pytest.approx(1.0)
+    clock.now += 1
+    assert take(buckets, "a") == 0
+
+
+def test_least_recently_used_bucket_is_evicted(clock):
+    buckets = LocalBuckets(maxsize=2)
+    take(buckets, "a")
+    take(buckets, "b")
+    take(buckets, "a")
+    take(buckets, "c")
+
+    assert list(buckets._buckets) == ["a", "c"]
+
+
+def test_user_bucket_is_checked_after_the_ip_bucket(clock):
+    control = AdmissionControl(ip_limit=(1.0, 5.0), user_limit=(1.0, 1.0), redis_url="")
+
+    assert asyncio.run(control.check("10.0.0.1", "u1")) is None
+    assert asyncio.run(control.check("10.0.0.2", "u1"))[0] == "user"
+    assert asyncio.run(control.check("10.0.0.2", None)) is None
+
+
+def callback_scope(state, cookie=None, path="/auth/google/callback"):
+    headers = [(b"cookie", f"{cookie_name('google')}={cookie}".encode())] if cookie else []
+    return {"type": "http", "path": path, "query_string": f"code=c&state={state}".encode(), "headers": headers}
+
+
+def test_callback_user_comes_from_a_bound_signed_state():
+    token, nonce = oauth_state.issue(OAuthUser("u1", "h"))
+
+    assert request_user_id(callback_scope(token, nonce)) == "u1"
+    assert request_user_id(callback_scope(token, "other-nonce")) is None
+    assert request_user_id(callback_scope(token)) is None
+
+
+def test_unverified_user_ids_are_not_keyed():
+    assert request_user_id({"type": "http", "path": "/auth/status", "query_string": b"user_id=u1"}) is None
+    assert request_user_id({"type": "http", "path": "/auth/google", "query_string": b"state=u1/h"}) is None
+    assert request_user_id(callback_scope("u1/h")) is None
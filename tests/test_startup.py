@@ -0,0 +1,21 @@
+import os
+import subprocess
+import sys
+
+from app.startup import measure_import_time
+
+# generous for slow CI runners; a regression to import-time clients or SDKs blows well past it
+COLD_IMPORT_BUDGET = float(os.getenv("COLD_IMPORT_BUDGET", "3.0"))
+
+
+def test_cold_import_fits_the_budget():
+    assert measure_import_time(runs=2) < COLD_IMPORT_BUDGET
+
+
+def test_import_creates_no_clients():
+    script = (
+        "import app.main; from app.services.http import http_clients; "
+        "print(len(http_clients._clients))"
+    )
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True)
+    assert result.stdout.split()[-1] == "0"
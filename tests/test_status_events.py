@@ -0,0 +1,76 @@
+import asyncio
+import json
+
+import pytest
+
+from app.api.status import sse_event
+from app.services.status_events import StatusBroker, StreamLimitError
+
+
+def make_broker(**kwargs) -> StatusBroker:
+    return StatusBroker(**{"max_connections": 10, "buffer_size": 2, "database_url": "", **kwargs})
+
+
+def test_events_reach_only_the_users_subscribers():
+    broker = make_broker()
+
+    async def scenario():
+        with broker.subscribe("u1") as mine, broker.subscribe("u2") as other:
+            broker.publish({"user_id": "u1", "flag": "is_email_service_connected"})
+            return await mine.next(0.1), await other.next(0.01)
+
+    assert asyncio.run(scenario()) == ({"user_id": "u1", "flag": "is_email_service_connected"}, None)
+
+
+def test_full_buffer_drops_the_oldest_event():
+    broker = make_broker()
+
+    async def scenario():
+        with broker.subscribe("u1") as subscription:
+            for seq in range(3):
+                broker.deliver({"user_id": "u1", "seq": seq})
+            events = [await subscription.next(0.01) for _ in range(2)]
+            return subscription.dropped, [event["seq"] for event in events]
+
+    assert asyncio.run(scenario()) == (1, [1, 2])
+
+
+def test_connection_cap_and_unsubscribe():
+    broker = make_broker(max_connections=1)
+    subscription = broker.subscribe("u1")
+
+    with pytest.raises(StreamLimitError):
+        broker.subscribe("u2")
+    subscription.close()
+    subscription.close()
+
+    assert broker.connections == 0 and broker.subscribers == {}
+    broker.subscribe("u2")
+
+
+def test_failing_listener_does_not_block_delivery():
+    broker = make_broker()
+    seen = []
+
+    def failing(event):
+        raise RuntimeError("listener bug")
+
+    broker.add_listener(failing)
+    broker.add_listener(seen.append)
+
+    async def scenario():
+        with broker.subscribe("u1") as subscription:
+            broker.deliver({"user_id": "u1"})
+            return await subscription.next(0.1)
+
+    assert asyncio.run(scenario()) == {"user_id": "u1"}
+    assert seen == [{"user_id": "u1"}]
+
+
+def test_sse_event_format():
+    event = sse_event({"id": "u1", "is_email_service_connected": True}, 'W/"abc"')
+
+    lines = event.split("\n")
+    assert lines[:2] == ["event: status", 'id: W/"abc"']
+    assert json.loads(lines[2].removeprefix("data: ")) == {"id": "u1", "is_email_service_connected": True}
+    assert event.endswith("\n\n")
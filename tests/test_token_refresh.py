@@ -0,0 +1,101 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import app.config as config
+from app.services.OAuthService import OAuthService
+from app.services.providers import PROVIDERS
+from app.services.token_refresh import TokenRefreshScheduler
+
+
+def expires_in(seconds: float) -> str:
+    return (datetime.now(timezone.utc) + timedelta(seconds=seconds)).isoformat()
+
+
+class FakeDatabase:
+    """
+    Keeps provider rows in memory; `connect_provider` stores one.
+    """
+
+    def __init__(self):
+        self.tables: dict[str, list[dict]] = {}
+
+    async def rpc(self, function, params):
+        assert function == "connect_provider"
+        row = {"user_id": params["p_user_id"], **params["p_record"]}
+        self.tables.setdefault(params["p_table"], []).append(row)
+        return {"id": params["p_user_id"]}
+
+    async def select(self, table, columns, filters):
+        return [
+            {"user_id": row["user_id"], "expires_at": row.get("expires_at")}
+            for row in self.tables.get(table, [])
+            if "user_id" not in filters
+        ]
+
+
+class FakeTokens:
+    def __init__(self):
+        self.refreshed = asyncio.Event()
+        self.calls = []
+
+    def remember(self, provider, user_id, record):
+        pass
+
+    async def refresh_user(self, provider, user_id):
+        self.calls.append((provider, user_id))
+        self.refreshed.set()
+        return {"expires_at": expires_in(3600)}
+
+
+class FakeStatuses:
+    def put(self, status):
+        pass
+
+    def invalidate(self, user_id):
+        pass
+
+
+class FakeEvents:
+    def publish(self, event):
+        pass
+
+
+def test_leader_refreshes_connections_made_on_other_workers(monkeypatch):
+    monkeypatch.setattr(config, "WRITE_BEHIND_ENABLED", False)
+    monkeypatch.setattr(config, "TOKEN_REFRESH_RESCAN_INTERVAL", 0.01)
+    monkeypatch.setattr(config, "TOKEN_REFRESH_JITTER", 0)
+
+    async def scenario():
+        database = FakeDatabase()
+        tokens = FakeTokens()
+        leader = TokenRefreshScheduler(tokens, database)
+        follower = TokenRefreshScheduler(tokens, database)
+        service = OAuthService(
+            database=database, statuses=FakeStatuses(), scheduler=follower,
+            tokens=tokens, events=FakeEvents()
+        )
+        await leader.start()
+        try:
+            await service.connect_provider("google", "u1", {
+                "access_token": "access", "refresh_token": "refresh", "expires_at": expires_in(60)
+            })
+            assert len(follower) == 0
+            await asyncio.wait_for(tokens.refreshed.wait(), 2)
+        finally:
+            await leader.stop()
+        return tokens.calls
+
+    assert asyncio.run(scenario()) == [("google", "u1")]
+
+
+def test_rescan_keeps_scheduled_entries(monkeypatch):
+    database = FakeDatabase()
+    table = PROVIDERS["google"].table
+    database.tables[table] = [{"user_id": "u1", "expires_at": expires_in(60)}]
+    scheduler = TokenRefreshScheduler(FakeTokens(), database)
+    scheduler.schedule("google", "u1", None)
+    seq = scheduler._entries[("google", "u1")]
+
+    asyncio.run(scheduler.rescan())
+
+    assert scheduler._entries[("google", "u1")] == seq
@@ -0,0 +1,117 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.services.providers import PROVIDERS
+from app.services.tokens import TokenRefreshError, TokenService
+
+
+class FakeDatabase:
+    """
+    One stored token row per (table, user); `store_refreshed_tokens`
+    applies the compare-and-set the Postgres function does.
+    """
+
+    def __init__(self, rows: dict | None = None):
+        self.rows = rows or {}
+        self.calls = []
+
+    async def rpc(self, function, params):
+        self.calls.append((function, params))
+        stored = []
+        for row in params["p_rows"]:
+            key = (params["p_table"], row["user_id"])
+            current = self.rows.get(key)
+            if current and current["refresh_token"] == row["previous_refresh_token"]:
+                self.rows[key] = {
+                    "access_token": row["access_token"],
+                    "refresh_token": row["refresh_token"],
+                    "expires_at": row["expires_at"],
+                }
+                stored.append(row["user_id"])
+        return stored
+
+    async def select(self, table, columns, filters, single=False):
+        return self.rows.get((table, filters["user_id"].removeprefix("eq.")))
+
+
+TABLE = PROVIDERS["xero"].table
+NEW = {"access_token": "a2", "refresh_token": "r2", "expires_at": "2030-01-01T00:00:00+00:00"}
+
+
+def test_store_sends_the_previous_token_in_the_body():
+    database = FakeDatabase({(TABLE, "u1"): {"access_token": "a1", "refresh_token": "r1", "expires_at": None}})
+    tokens = TokenService(database=database)
+
+    assert asyncio.run(tokens.store("xero", "u1", NEW, "r1")) == NEW
+    [(function, params)] = database.calls
+    assert function == "store_refreshed_tokens"
+    assert params["p_rows"] == [{"user_id": "u1", **NEW, "previous_refresh_token": "r1"}]
+
+
+def test_store_returns_the_tokens_of_a_refresh_stored_first():
+    rotated = {"access_token": "a3", "refresh_token": "r3", "expires_at": "2030-01-01T00:00:00+00:00"}
+    database = FakeDatabase({(TABLE, "u1"): rotated})
+    tokens = TokenService(database=database)
+
+    assert asyncio.run(tokens.store("xero", "u1", NEW, "r1")) == rotated
+    assert database.rows[(TABLE, "u1")] == rotated
+
+
+def expiring_in(seconds: float) -> str:
+    return (datetime.now(timezone.utc) + timedelta(seconds=seconds)).isoformat()
+
+
+def counting_refresh(tokens: TokenService) -> list:
+    calls = []
+
+    async def refresh(provider, refresh_token):
+        calls.append(refresh_token)
+        await asyncio.sleep(0.01)
+        return {"access_token": "a2", "refresh_token": "r2", "expires_in": 3600}
+
+    tokens.refresh = refresh
+    return calls
+
+
+def test_vends_a_stored_token_that_is_still_valid():
+    stored = {"access_token": "a1", "refresh_token": "r1", "expires_at": expiring_in(3600)}
+    database = FakeDatabase({(TABLE, "u1"): stored})
+    tokens = TokenService(database=database)
+    calls = counting_refresh(tokens)
+
+    async def scenario():
+        first = await tokens.get_access_token("xero", "u1")
+        database.rows.clear()
+        # served from the cache now
+        return first, await tokens.get_access_token("xero", "u1")
+
+    first, second = asyncio.run(scenario())
+
+    assert first == second == {"access_token": "a1", "expires_at": stored["expires_at"]}
+    assert calls == []
+
+
+def test_concurrent_requests_share_one_refresh():
+    stored = {"access_token": "a1", "refresh_token": "r1", "expires_at": expiring_in(10)}
+    database = FakeDatabase({(TABLE, "u1"): stored})
+    tokens = TokenService(database=database)
+    calls = counting_refresh(tokens)
+
+    async def scenario():
+        return await asyncio.gather(*(tokens.get_access_token("xero", "u1") for _ in range(5)))
+
+    vended = asyncio.run(scenario())
+
+    assert calls == ["r1"]
+    assert {token["access_token"] for token in vended} == {"a2"}
+    assert database.rows[(TABLE, "u1")]["refresh_token"] == "r2"
+
+
+def test_vending_an_unconnected_user_fails():
+    tokens = TokenService(database=FakeDatabase())
+
+    with pytest.raises(TokenRefreshError) as error:
+        asyncio.run(tokens.get_access_token("xero", "u1"))
+    assert error.value.error == "not_connected"
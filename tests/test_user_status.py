@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import app.api.status as status_api
+from app.services.status_events import StatusBroker
+from app.services.user_status import UserStatusService, compute_etag
+
+USER = {"id": "u1", "name": "Ada", "is_email_service_connected": False}
+
+
+class FakeDatabase:
+    def __init__(self, row: dict | None = USER):
+        self.row = row
+        self.selects = []
+
+    async def select(self, table, columns, filters, single=False):
+        self.selects.append(filters)
+        return dict(self.row) if self.row else None
+
+
+def make_service(database=None):
+    broker = StatusBroker(database_url="")
+    return UserStatusService(database or FakeDatabase(), events=broker), broker
+
+
+def test_rows_are_cached_by_user_and_session():
+    service, _ = make_service()
+
+    async def scenario():
+        await service.get(session_id="s1")
+        await service.get(user_id="u1")
+        await service.get(session_id="s1")
+
+    asyncio.run(scenario())
+
+    assert service.db.selects == [{"session_id": "eq.s1"}]
+
+
+def test_unknown_users_are_not_cached():
+    service, _ = make_service(FakeDatabase(row=None))
+
+    assert asyncio.run(service.get(user_id="u2")) is None
+    asyncio.run(service.get(user_id="u2"))
+    assert len(service.db.selects) == 2
+
+
+def test_events_write_through_or_invalidate():
+    service, broker = make_service()
+    asyncio.run(service.get(user_id="u1"))
+    connected = {**USER, "is_email_service_connected": True}
+
+    broker.deliver({"user_id": "u1", "status": connected})
+    assert asyncio.run(service.get(user_id="u1")) == (connected, compute_etag(connected))
+
+    broker.deliver({"user_id": "u1", "status": None})
+    asyncio.run(service.get(user_id="u1"))
+    assert len(service.db.selects) == 2
+
+
+def test_etag_follows_the_content():
+    assert compute_etag(dict(USER)) == compute_etag(dict(reversed(USER.items())))
+    assert compute_etag(USER) != compute_etag({**USER, "name": "Grace"})
+
+
+@pytest.fixture
+def client(monkeypatch):
+    service, _ = make_service()
+    monkeypatch.setattr(status_api, "user_status_service", service)
+    app = FastAPI()
+    app.include_router(status_api.router)
+    return TestClient(app)
+
+
+def test_matching_if_none_match_gets_a_304(client):
+    first = client.get("/auth/status", params={"user_id": "3f0c1c1e-8f51-4e3b-9a57-6f2d1b0c9e11"})
+    etag = first.headers["ETag"]
+
+    again = client.get(
+        "/auth/status",
+        params={"user_id": "3f0c1c1e-8f51-4e3b-9a57-6f2d1b0c9e11"},
+        headers={"If-None-Match": etag}
+    )
+
+    assert first.status_code == 200 and first.json() == USER
+    assert again.status_code == 304 and again.headers["ETag"] == etag
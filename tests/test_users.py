@@ -0,0 +1,85 @@
+import asyncio
+
+import httpx
+import pytest
+
+import app.services.cache as cache
+import app.config as config
+from app.services.users import UserService, user_exists_cache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "monotonic", clock.monotonic)
+    user_exists_cache.clear()
+    yield clock
+    user_exists_cache.clear()
+
+
+def make_service(status_code=200):
+    """
+    A UserService whose Supabase answers `users` queries for user u1 (hash h).
+    """
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if status_code != 200:
+            return httpx.Response(status_code, text="unavailable")
+        found = request.url.params["and"] == "(id.eq.u1,user_hash.eq.h)"
+        return httpx.Response(200, json=[{"id": "u1"}] if found else [])
+
+    return UserService(httpx.AsyncClient(transport=httpx.MockTransport(handler))), requests
+
+
+def exists(service, user_id, user_hash):
+    return asyncio.run(service.user_exists(user_id, user_hash))
+
+
+def test_existing_user_is_cached_for_the_ttl(clock):
+    service, requests = make_service()
+
+    assert exists(service, "u1", "h") == (True, 200, "User exists")
+    assert exists(service, "u1", "h")[0]
+    assert len(requests) == 1
+    clock.now += config.USER_EXISTS_CACHE_TTL
+    exists(service, "u1", "h")
+    assert len(requests) == 2
+
+
+def test_unknown_user_is_cached_briefly(clock):
+    service, requests = make_service()
+
+    assert exists(service, "u2", "h") == (False, 404, "User not found")
+    exists(service, "u2", "h")
+    assert len(requests) == 1
+    clock.now += config.USER_EXISTS_NEGATIVE_TTL
+    exists(service, "u2", "h")
+    assert len(requests) == 2
+
+
+def test_errors_are_not_cached(clock):
+    service, requests = make_service(status_code=503)
+
+    assert exists(service, "u1", "h")[:2] == (False, 503)
+    exists(service, "u1", "h")
+    assert len(requests) == 2
+
+
+def test_invalidate_drops_every_hash_of_a_user(clock):
+    service, requests = make_service()
+    exists(service, "u1", "h")
+    exists(service, "u1", "other")
+
+    UserService.invalidate("u1")
+
+    assert len(user_exists_cache) == 0
@@ -0,0 +1,167 @@
+import asyncio
+import json
+
+import pytest
+
+import app.services.write_behind as write_behind
+from app.services.database import DatabaseError
+from app.services.write_behind import WriteBehindQueue
+
+
+class FakeDatabase:
+    """
+    Records writes; `fail` maps a user id to the error its upsert raises.
+    """
+
+    def __init__(self, fail: dict | None = None):
+        self.fail = fail or {}
+        self.upserts = []
+        self.updates = []
+
+    async def upsert(self, table, rows, on_conflict=None):
+        for row in rows:
+            if row["user_id"] in self.fail:
+                raise self.fail[row["user_id"]]
+        self.upserts.append((table, rows))
+
+    async def update(self, table, values, filters):
+        self.updates.append((table, values, filters))
+
+
+class FakeTenants:
+    async def sync(self, tenants):
+        return 0
+
+
+def make_queue(tmp_path, database=None) -> WriteBehindQueue:
+    queue = WriteBehindQueue(str(tmp_path / "journal.sqlite3"), database or FakeDatabase(), FakeTenants())
+    queue.open()
+    return queue
+
+
+def enqueue(queue, provider, user_id, record):
+    asyncio.run(queue.enqueue(provider, user_id, record))
+
+
+def pending(queue) -> list[tuple]:
+    return queue._execute(
+        "select provider, user_id, record from journal where flushed_at is null and error is null order by seq"
+    )
+
+
+def test_requires_a_journal_path():
+    with pytest.raises(RuntimeError):
+        WriteBehindQueue(None).open()
+
+
+def test_claim_leases_entries(tmp_path, monkeypatch):
+    queue = make_queue(tmp_path)
+    enqueue(queue, "google", "u1", {"email": "a@example.com"})
+    enqueue(queue, "xero", "u2", {"tenant_id": "t"})
+
+    claimed = queue._claim(10)
+    assert [(provider, user_id) for _, provider, user_id, _, _ in claimed] == [("google", "u1"), ("xero", "u2")]
+    assert queue._claim(10) == []
+
+    # an expired lease makes the entries claimable again
+    now = write_behind.time.time()
+    monkeypatch.setattr(write_behind.time, "time", lambda: now + write_behind.config.WRITE_BEHIND_CLAIM_LEASE + 1)
+    assert len(queue._claim(10)) == 2
+
+
+def test_claim_respects_the_batch_size(tmp_path):
+    queue = make_queue(tmp_path)
+    for i in range(5):
+        enqueue(queue, "google", f"u{i}", {})
+    assert len(queue._claim(3)) == 3
+    assert len(queue._claim(3)) == 2
+
+
+def test_complete_marks_superseded_entries_flushed(tmp_path):
+    queue = make_queue(tmp_path)
+    enqueue(queue, "google", "u1", {"email": "old@example.com"})
+    enqueue(queue, "google", "u1", {"email": "new@example.com"})
+    enqueue(queue, "google", "u2", {"email": "other@example.com"})
+    claimed = queue._claim(10)
+
+    latest = max(seq for seq, _, user_id, _, _ in claimed if user_id == "u1")
+    queue._complete([(latest, "google", "u1")])
+
+    assert [user_id for _, user_id, _ in pending(queue)] == ["u2"]
+    assert asyncio.run(queue.stats()) == {"pending": 1, "flushed": 2, "rejected": 0}
+
+
+def test_flush_writes_the_latest_record_per_user(tmp_path):
+    database = FakeDatabase()
+    queue = make_queue(tmp_path, database)
+    enqueue(queue, "google", "u1", {"email": "old@example.com"})
+    enqueue(queue, "google", "u1", {"email": "new@example.com"})
+
+    assert asyncio.run(queue.flush()) == 2
+    assert database.upserts == [("google_users", [{"email": "new@example.com", "user_id": "u1"}])]
+    assert database.updates == [("users", {"is_email_service_connected": True}, {"id": 'in.("u1")'})]
+    assert pending(queue) == []
+
+
+def test_rejected_record_is_isolated(tmp_path):
+    database = FakeDatabase(fail={"bad": DatabaseError(400, "invalid input")})
+    queue = make_queue(tmp_path, database)
+    enqueue(queue, "google", "good", {"email": "good@example.com"})
+    enqueue(queue, "google", "bad", {"email": "bad@example.com"})
+
+    asyncio.run(queue.flush())
+
+    assert [rows for _, rows in database.upserts] == [[{"email": "good@example.com", "user_id": "good"}]]
+    assert pending(queue) == []
+    assert asyncio.run(queue.stats()) == {"pending": 0, "flushed": 1, "rejected": 1}
+    (error,), = queue._execute("select error from journal where user_id = 'bad'")
+    assert "invalid input" in error
+    # rejected entries are neither claimed again nor reported as connected
+    assert queue._claim(10) == []
+    assert asyncio.run(queue.connected_flags(["bad"])) == {}
+
+
+def test_server_errors_release_the_batch_for_a_retry(tmp_path):
+    database = FakeDatabase(fail={"u1": DatabaseError(503, "unavailable")})
+    queue = make_queue(tmp_path, database)
+    enqueue(queue, "xero", "u1", {"tenant_id": "t"})
+
+    asyncio.run(queue.flush())
+
+    (attempts, not_before, claimed_until), = queue._execute(
+        "select attempts, not_before, claimed_until from journal"
+    )
+    assert attempts == 1
+    assert not_before > write_behind.time.time()
+    assert claimed_until == 0
+    assert [json.loads(record) for _, _, record in pending(queue)] == [{"tenant_id": "t"}]
+    # backing off: not claimable until not_before
+    assert queue._claim(10) == []
+
+
+def test_backoff_is_tracked_per_provider(tmp_path, monkeypatch):
+    unavailable = DatabaseError(503, "unavailable")
+    queue = make_queue(tmp_path, FakeDatabase(fail={"u1": unavailable, "u2": unavailable}))
+    enqueue(queue, "xero", "u1", {"tenant_id": "t"})
+    queue._execute("update journal set attempts = 5")
+    enqueue(queue, "quickbooks", "u2", {"realm_id": "r"})
+    released = {}
+    monkeypatch.setattr(
+        queue, "_release",
+        lambda seqs, attempts, error: released.update({seq: attempts for seq in seqs})
+    )
+
+    asyncio.run(queue.flush())
+
+    # the fresh QuickBooks entry is not held back by Xero's failures
+    assert released == {1: 5, 2: 0}
+
+
+def test_connected_flags_cover_pending_entries(tmp_path):
+    queue = make_queue(tmp_path)
+    enqueue(queue, "xero", "u1", {})
+    enqueue(queue, "outlook", "u2", {})
+    assert asyncio.run(queue.connected_flags(["u1", "u2", "u3"])) == {
+        "u1": {"is_invoice_service_connected": True},
+        "u2": {"is_email_service_connected": True},
+    }
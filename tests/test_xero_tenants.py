@@ -0,0 +1,92 @@
+import asyncio
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import app.api.internal as internal
+import app.config as config
+from app.services.providers import PROVIDERS
+from app.services.write_behind import WriteBehindQueue
+from app.services.xero_tenants import XeroTenantService
+
+CONNECTIONS = [
+    {"id": "c1", "tenantId": "t1", "tenantName": "Acme", "tenantType": "ORGANISATION"},
+    {"id": "c2", "tenantId": "t2", "tenantName": "Acme Holdings", "tenantType": "ORGANISATION"},
+    {"id": "c3", "tenantType": "PRACTICE"},
+]
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.calls = []
+
+    async def rpc(self, function, params):
+        self.calls.append(("rpc", function, params))
+        return sum(len(tenants) for tenants in params["p_tenants"].values())
+
+    async def select(self, table, columns, filters):
+        self.calls.append(("select", table, filters))
+        return []
+
+    async def upsert(self, table, rows, on_conflict=None):
+        self.calls.append(("upsert", table, rows))
+
+    async def update(self, table, values, filters):
+        self.calls.append(("update", table, values))
+
+
+def test_profile_keeps_every_tenant():
+    profile = PROVIDERS["xero"].profile({"connections": CONNECTIONS, "user_info": None}, {})
+
+    assert (profile["tenant_id"], profile["tenant_name"]) == ("t1", "Acme")
+    assert profile["tenants"] == [
+        {"tenant_id": "t1", "tenant_name": "Acme", "tenant_type": "ORGANISATION", "connection_id": "c1"},
+        {"tenant_id": "t2", "tenant_name": "Acme Holdings", "tenant_type": "ORGANISATION", "connection_id": "c2"},
+    ]
+
+
+def test_sync_writes_every_user_in_one_call():
+    database = FakeDatabase()
+    service = XeroTenantService(database)
+    tenants = {"u1": [{"tenant_id": "t1"}, {"tenant_id": "t2"}], "u2": []}
+
+    assert asyncio.run(service.sync(tenants)) == 2
+    assert asyncio.run(service.sync({})) == 0
+    assert database.calls == [("rpc", "sync_xero_tenants", {"p_tenants": tenants})]
+
+
+def test_for_user_reads_the_users_tenants():
+    database = FakeDatabase()
+
+    asyncio.run(XeroTenantService(database).for_user("u1"))
+
+    assert database.calls == [("select", "xero_tenants", {"user_id": "eq.u1", "order": "tenant_name,tenant_id"})]
+
+
+def test_write_behind_syncs_a_batchs_tenants_together():
+    database = FakeDatabase()
+    queue = WriteBehindQueue(None, database, XeroTenantService(database))
+    entries = [
+        ([1], "u1", {"tenant_id": "t1", "tenants": [{"tenant_id": "t1"}]}),
+        ([2], "u2", {"tenant_id": "t3", "tenants": [{"tenant_id": "t3"}, {"tenant_id": "t4"}]}),
+    ]
+
+    asyncio.run(queue._write("xero", entries))
+
+    kinds = [call[:2] for call in database.calls]
+    assert kinds == [("upsert", "xero_users"), ("rpc", "sync_xero_tenants"), ("update", "users")]
+    assert all("tenants" not in row for row in database.calls[0][2])
+    assert database.calls[1][2] == {"p_tenants": {
+        "u1": [{"tenant_id": "t1"}],
+        "u2": [{"tenant_id": "t3"}, {"tenant_id": "t4"}],
+    }}
+
+
+def test_tenants_route_rejects_malformed_user_ids(monkeypatch):
+    monkeypatch.setattr(config, "INTERNAL_API_KEY", "internal")
+    app = FastAPI()
+    app.include_router(internal.router)
+
+    response = TestClient(app).get("/internal/xero/tenants/not-a-uuid", headers={"X-Internal-Key": "internal"})
+
+    assert response.status_code == 422